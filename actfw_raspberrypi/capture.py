@@ -1,17 +1,215 @@
 import io
+import threading
+import time
 import warnings
-from typing import Any, Generator, Optional
+from queue import Empty, Queue
+from typing import Any, Dict, Generator, Optional, Tuple, TypeVar
 
 from actfw_core.capture import Frame
 from actfw_core.system import EnvironmentVariableNotSet, get_actcast_firmware_type
 from actfw_core.task import Producer
 from actfw_core.util.pad import _PadBase, _PadDiscardingOld
 
+T = TypeVar("T")
 
-class PiCameraCapture(Producer[Frame[bytes]]):
+# Raw formats of picamera -> bytes per pixel (of the Y plane for YUV420)
+RAW_FORMATS: Dict[str, int] = {"rgb": 3, "bgr": 3, "rgba": 4, "bgra": 4, "yuv": 1}
+
+
+def raw_frame_layout(format: str, resolution: Tuple[int, int]) -> Tuple[int, int]:
+    """
+    Get the layout of raw frames written by picamera.
+
+    picamera pads the width to a multiple of 32 and the height to a multiple of 16.
+
+    Args:
+        format (str): raw format ("rgb", "bgr", "rgba", "bgra" or "yuv")
+        resolution ((int, int)): capture resolution (width, height)
+
+    Returns:
+        (int, int): (stride, size). ``stride`` is bytes between rows (of the Y plane for YUV420)
+        and ``size`` is bytes of a frame.
+    """
+    if format not in RAW_FORMATS:
+        raise RuntimeError(f"not raw format: {format}")
+    width = (resolution[0] + 31) // 32 * 32
+    height = (resolution[1] + 15) // 16 * 16
+    stride = width * RAW_FORMATS[format]
+    if format == "yuv":
+        # U and V planes of half width and height follow the Y plane
+        return (stride, stride * height * 3 // 2)
+    return (stride, stride * height)
+
+
+class PiCameraFrame(Frame[T]):
+    sequence: int
+    timestamp: float
+
+    """Captured Frame with its sequence number and capture time"""
+
+    def __init__(self, value: T, sequence: int, timestamp: float) -> None:
+        """
+
+        Args:
+            value : captured image data
+            sequence (int): number of frames captured before this frame
+            timestamp (float): :func:`time.monotonic` when the frame has been captured.
+                Compare it with :func:`time.monotonic` downstream to measure latency.
+
+        """
+        super().__init__(value)
+        self.sequence = sequence
+        self.timestamp = timestamp
+
+
+class PooledFrame(PiCameraFrame[memoryview]):
+    format: Optional[str]
+    resolution: Optional[Tuple[int, int]]
+    stride: Optional[int]
+    _pool: "Queue[bytearray]"
+    _buffer: Optional[bytearray]
+    _lock: threading.Lock
+
+    """Captured Frame whose data is a view of a buffer borrowed from a pool"""
+
+    def __init__(
+        self,
+        value: memoryview,
+        sequence: int,
+        timestamp: float,
+        pool: "Queue[bytearray]",
+        buffer: bytearray,
+        format: Optional[str] = None,
+        resolution: Optional[Tuple[int, int]] = None,
+        stride: Optional[int] = None,
+    ) -> None:
+        """
+
+        Raw frames carry their layout, so that they can be wrapped without copy, e.g. for "rgb"::
+
+            numpy.ndarray((height, width, 3), numpy.uint8, frame.getvalue(), strides=(frame.stride, 3, 1))
+
+        Args:
+            value (memoryview): captured image data
+            sequence (int): number of frames captured before this frame
+            timestamp (float): :func:`time.monotonic` when the frame has been captured
+            pool (:class:`~queue.Queue`): pool to return the buffer to
+            buffer (bytearray): buffer which ``value`` refers to
+            format (str): raw format, or None for encoded frames
+            resolution ((int, int)): image size (width, height) without padding, or None for encoded frames
+            stride (int): bytes between rows (of the Y plane for YUV420), or None for encoded frames
+
+        """
+        super().__init__(value, sequence, timestamp)
+        self.format = format
+        self.resolution = resolution
+        self.stride = stride
+        self._pool = pool
+        self._buffer = buffer
+        self._lock = threading.Lock()
+
+    def release(self) -> None:
+        """
+        Return the buffer to the pool so that the next frames are captured into it.
+
+        Do not use the frame data after release. Releasing twice does nothing.
+        """
+        with self._lock:
+            buffer, self._buffer = self._buffer, None
+        if buffer is not None:
+            self._pool.put(buffer)
+
+
+class _PoolOutput(object):
+    buffer: bytearray
+    length: int
+
+    """Writable target for picamera which fills a preallocated buffer"""
+
+    def __init__(self, buffer: bytearray) -> None:
+        self.buffer = buffer
+        self.length = 0
+
+    def write(self, data: Any) -> int:
+        view = memoryview(data).cast("B")
+        end = self.length + view.nbytes
+        if end > len(self.buffer):
+            # Grow by replacing the buffer. Views of the old one may still be alive in released frames.
+            buffer = bytearray(max(end, len(self.buffer) * 2))
+            buffer[: self.length] = self.buffer[: self.length]
+            self.buffer = buffer
+        self.buffer[self.length : end] = view
+        self.length = end
+        return view.nbytes
+
+    def flush(self) -> None:
+        pass
+
+
+class _Counters(object):
+    _lock: threading.Lock
+    _counts: Dict[str, int]
+
+    def __init__(self, *names: str) -> None:
+        self._lock = threading.Lock()
+        self._counts = {name: 0 for name in names}
+
+    def add(self, name: str) -> int:
+        """Increment a counter and return its previous value"""
+        with self._lock:
+            count = self._counts[name]
+            self._counts[name] = count + 1
+            return count
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+class _PadCountingOld(_PadDiscardingOld[T]):
+    _counters: _Counters
+
+    """Pad which counts delivered frames and frames discarded for new ones, releasing pooled ones"""
+
+    def __init__(self, counters: _Counters) -> None:
+        super().__init__()
+        self._counters = counters
+
+    def put(
+        self,
+        item: T,
+        block: bool = True,
+        timeout: Optional[float] = None,
+    ) -> None:
+        try:
+            old = self._queue.get(block=False)
+        except Empty:
+            pass
+        else:
+            self._counters.add("dropped")
+            if isinstance(old, PooledFrame):
+                old.release()
+        self._queue.put(item, block=block, timeout=timeout)
+
+    def get(
+        self,
+        block: bool = True,
+        timeout: Optional[float] = None,
+    ) -> T:
+        item = self._queue.get(block=block, timeout=timeout)
+        self._counters.add("delivered")
+        return item
+
+
+class PiCameraCapture(Producer[Frame[Any]]):
     camera: "picamera.PiCamera"  # type: ignore  # reason: can't depend on picamera  # noqa F821
     args: Any
     kwargs: Any
+    pool_size: int
+    buffer_size: int
+    _pool: "Queue[bytearray]"
+    _raw: Optional[Tuple[str, Tuple[int, int], int]]
+    _counters: _Counters
 
     """Captured Frame Producer for Raspberry Pi Camera Module"""
 
@@ -19,12 +217,25 @@ class PiCameraCapture(Producer[Frame[bytes]]):
         self,
         camera: "picamera.PiCamera",  # type: ignore  # reason: can't depend on picamera  # noqa F821
         *args: Any,
+        pool_size: int = 0,
+        buffer_size: int = 0,
         **kwargs: Any,
     ) -> None:
         """
 
         Args:
             camera (:class:`~picamera.PiCamera`): picamera object
+            pool_size (int): number of preallocated buffers to capture into.
+                If it is positive, frames are :class:`PooledFrame` of which data is a memoryview of a pooled buffer
+                and no per-frame copy or allocation is made. Call :meth:`PooledFrame.release` when the frame has been
+                processed, or the capture stops when all the buffers are in use.
+                Frames discarded because consumers are slow are released automatically.
+                By default frames are copied into new ``bytes``.
+            buffer_size (int): initial size of pooled buffers. They grow when a frame does not fit.
+                For raw formats ("rgb", "bgr", "rgba", "bgra" and "yuv"), buffers are allocated in the exact size
+                of padded frames at the capture resolution, and frames carry their resolution, stride and format.
+
+        Other arguments are passed to :meth:`~picamera.PiCamera.capture_sequence`.
 
         """
         try:
@@ -46,25 +257,92 @@ class PiCameraCapture(Producer[Frame[bytes]]):
         self.camera = camera
         self.args = args
         self.kwargs = kwargs
+        self.pool_size = pool_size
+        self.buffer_size = buffer_size
+        self._pool = Queue()
+        self._raw = None
+        self._counters = _Counters("captured", "delivered", "dropped")
 
-    def _new_pad(self) -> _PadBase[Frame[bytes]]:
-        return _PadDiscardingOld()
+    def stats(self) -> Dict[str, int]:
+        """
+        Get frame counters.
+
+        Frames are dropped when consumers are slower than the camera and newer frames replace them,
+        or when the capture stops before they are passed to consumers.
+
+        Returns:
+            dict: numbers of frames "captured", "delivered" to consumers and "dropped"
+        """
+        return self._counters.snapshot()
+
+    def _new_pad(self) -> _PadBase[Frame[Any]]:
+        return _PadCountingOld(self._counters)
 
     def run(self) -> None:
         """Run producer activity"""
+        if self.pool_size > 0:
+            self._fill_pool()
+            self.camera.capture_sequence(self._pooled_outputs(), *self.args, **self.kwargs)
+            return
 
         def generator() -> Generator[io.BytesIO, None, None]:
             stream = io.BytesIO()
             while self._is_running():
                 try:
                     yield stream
+                    timestamp = time.monotonic()
                     stream.seek(0)
                     value = stream.getvalue()
-                    frame = Frame(value)
-                    self._outlet(frame)
+                    frame = PiCameraFrame(value, self._counters.add("captured"), timestamp)
+                    if not self._outlet(frame):
+                        self._counters.add("dropped")
                     stream.seek(0)
                     stream.truncate()
                 except GeneratorExit:
                     break
 
         self.camera.capture_sequence(generator(), *self.args, **self.kwargs)
+
+    def _pooled_outputs(self) -> Generator[_PoolOutput, None, None]:
+        while self._is_running():
+            buffer = self._borrow()
+            if buffer is None:
+                break
+            output = _PoolOutput(buffer)
+            try:
+                yield output
+            except GeneratorExit:
+                self._pool.put(output.buffer)
+                break
+            timestamp = time.monotonic()
+            frame = PooledFrame(
+                memoryview(output.buffer)[: output.length],
+                self._counters.add("captured"),
+                timestamp,
+                self._pool,
+                output.buffer,
+                *(self._raw or ()),
+            )
+            if not self._outlet(frame):
+                self._counters.add("dropped")
+                frame.release()
+
+    def _fill_pool(self) -> None:
+        # Arguments of capture_sequence(outputs, format, use_video_port, resize, ...)
+        format = self.kwargs.get("format", self.args[0] if len(self.args) > 0 else "jpeg")
+        resize = self.kwargs.get("resize", self.args[2] if len(self.args) > 2 else None)
+        size = self.buffer_size
+        if format in RAW_FORMATS:
+            resolution = tuple(resize or self.camera.resolution)
+            stride, size = raw_frame_layout(format, resolution)
+            self._raw = (format, resolution, stride)
+        while self._pool.qsize() < self.pool_size:
+            self._pool.put(bytearray(size))
+
+    def _borrow(self) -> Optional[bytearray]:
+        while self._is_running():
+            try:
+                return self._pool.get(timeout=1)
+            except Empty:
+                pass
+        return None
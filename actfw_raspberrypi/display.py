@@ -45,7 +45,7 @@ class Display:
         )
 
         self.size = size
-        self.preferred_size = EDID().prefferd_mode()
+        self.preferred_size = EDID().preferred_mode()
         scale_w = self.preferred_size[0] / self.size[0]
         scale_h = self.preferred_size[1] / self.size[1]
         self.scale = min(scale_w, scale_h)
@@ -1,30 +1,254 @@
-import re
+import glob
+import os
 import subprocess
-from typing import Tuple
+import tempfile
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+EDID_HEADER = b"\x00\xff\xff\xff\xff\xff\xff\x00"
+EDID_BLOCK_SIZE = 128
+CEA_EXTENSION_TAG = 0x02
+CEA_VIDEO_DATA_BLOCK = 2
+
+
+class Mode(NamedTuple):
+    """Display mode"""
+
+    width: int
+    height: int
+    refresh: int
+    interlaced: bool = False
+
+
+# Established timings I and II (bytes 35 and 36, MSB first)
+_ESTABLISHED_MODES = [
+    Mode(720, 400, 70),
+    Mode(720, 400, 88),
+    Mode(640, 480, 60),
+    Mode(640, 480, 67),
+    Mode(640, 480, 72),
+    Mode(640, 480, 75),
+    Mode(800, 600, 56),
+    Mode(800, 600, 60),
+    Mode(800, 600, 72),
+    Mode(800, 600, 75),
+    Mode(832, 624, 75),
+    Mode(1024, 768, 87, True),
+    Mode(1024, 768, 60),
+    Mode(1024, 768, 70),
+    Mode(1024, 768, 75),
+    Mode(1280, 1024, 75),
+]
+
+# Common CEA-861 video identification codes
+_CEA_MODES: Dict[int, Mode] = {
+    1: Mode(640, 480, 60),
+    2: Mode(720, 480, 60),
+    3: Mode(720, 480, 60),
+    4: Mode(1280, 720, 60),
+    5: Mode(1920, 1080, 60, True),
+    16: Mode(1920, 1080, 60),
+    17: Mode(720, 576, 50),
+    18: Mode(720, 576, 50),
+    19: Mode(1280, 720, 50),
+    20: Mode(1920, 1080, 50, True),
+    31: Mode(1920, 1080, 50),
+    32: Mode(1920, 1080, 24),
+    33: Mode(1920, 1080, 25),
+    34: Mode(1920, 1080, 30),
+    93: Mode(3840, 2160, 24),
+    94: Mode(3840, 2160, 25),
+    95: Mode(3840, 2160, 30),
+    96: Mode(3840, 2160, 50),
+    97: Mode(3840, 2160, 60),
+}
+
+# Aspect ratios of standard timings (height / width)
+_STANDARD_ASPECTS = [(10, 16), (3, 4), (4, 5), (9, 16)]
+
+
+class _ParsedEDID(NamedTuple):
+    preferred_mode: Optional[Mode]
+    modes: List[Mode]
+    physical_size: Tuple[int, int]
 
 
 class EDID:
-    edid: str
+    data: Optional[bytes]
+    _parsed: Optional[_ParsedEDID]
 
     """Extended Display Information Data"""
 
-    def __init__(self) -> None:
-        subprocess.run("/opt/vc/bin/tvservice -d /tmp/edid".split(), stdout=subprocess.DEVNULL)
-        p = subprocess.run("/opt/vc/bin/edidparser /tmp/edid".split(), stdout=subprocess.PIPE)
-        self.edid = p.stdout.decode("utf-8")
+    def __init__(self, data: Optional[bytes] = None) -> None:
+        """
+
+        Args:
+            data (bytes): EDID blob, e.g. the EDID property of a DRM connector.
+                By default it is read from ``/sys/class/drm/*/edid`` of the connected display,
+                or dumped by ``tvservice`` if the KMS driver is not loaded.
+
+        """
+        self._parsed = None
+        if data is not None:
+            self._parsed = _parse(data)
+        else:
+            data = read_edid()
+            if data is not None:
+                try:
+                    self._parsed = _parse(data)
+                except RuntimeError:
+                    # Fall back to the defaults as when EDID is not available
+                    data = None
+        self.data = data
+
+    def preferred_mode(self) -> Tuple[int, int]:
+        """Preferred Display Resolution.
+
+        Returns:
+            (int, int): (width, height). (640, 480) if EDID is not available.
+
+        """
+        if self._parsed is None or self._parsed.preferred_mode is None:
+            return (640, 480)  # fallback
+        mode = self._parsed.preferred_mode
+        return (mode.width, mode.height)
 
     def prefferd_mode(self) -> Tuple[int, int]:
-        """Preffered Display Resolution.
+        """Same as :meth:`preferred_mode`, kept for compatibility."""
+        return self.preferred_mode()
+
+    def modes(self) -> List[Mode]:
+        """Supported Display Modes.
 
         Returns:
-            (int, int): (width, height)
+            list of :class:`Mode`: modes in the order they appear in EDID, starting with the preferred mode
 
         """
-        prog = re.compile(r"^.+preferred mode.+(DMT|CEA) \(([0-9]+)\) ([0-9]+)x([0-9]+)[pi]? @.+")
-        for line in self.edid.split("\n"):
-            result = prog.match(line)
-            if result is not None:
-                xres = result.group(3)
-                yres = result.group(4)
-                return (int(xres), int(yres))
-        return (640, 480)  # fallback
+        if self._parsed is None:
+            return []
+        return list(self._parsed.modes)
+
+    def physical_size(self) -> Tuple[int, int]:
+        """Physical Display Size.
+
+        Returns:
+            (int, int): (width, height) in millimeters. (0, 0) if it is unknown.
+
+        """
+        if self._parsed is None:
+            return (0, 0)
+        return self._parsed.physical_size
+
+
+def read_edid() -> Optional[bytes]:
+    """
+    Read EDID of the connected display.
+
+    Returns:
+        bytes: EDID blob, or None if it is not available
+    """
+    for path in sorted(glob.glob("/sys/class/drm/card*-*/edid")):
+        try:
+            with open(os.path.join(os.path.dirname(path), "status")) as f:
+                if f.read().strip() != "connected":
+                    continue
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        if data:
+            return data
+    return _dump_edid_by_tvservice()
+
+
+def _dump_edid_by_tvservice() -> Optional[bytes]:
+    if not os.path.exists("/opt/vc/bin/tvservice"):
+        return None
+    with tempfile.NamedTemporaryFile(prefix="edid") as f:
+        subprocess.run(["/opt/vc/bin/tvservice", "-d", f.name], stdout=subprocess.DEVNULL)
+        data = f.read()
+    return data or None
+
+
+@lru_cache(maxsize=8)
+def _parse(data: bytes) -> _ParsedEDID:
+    if len(data) < EDID_BLOCK_SIZE or data[:8] != EDID_HEADER:
+        raise RuntimeError("invalid EDID header")
+    if sum(data[:EDID_BLOCK_SIZE]) % 256 != 0:
+        raise RuntimeError("invalid EDID checksum")
+
+    modes: List[Mode] = []
+    physical_size = (data[21] * 10, data[22] * 10)
+    preferred_mode = None
+    for offset in range(54, 126, 18):
+        timing = _detailed_timing(data[offset : offset + 18])
+        if timing is not None:
+            mode, size = timing
+            if preferred_mode is None:
+                # The first detailed timing is the preferred mode
+                preferred_mode = mode
+                if size != (0, 0):
+                    physical_size = size
+            modes.append(mode)
+
+    for i, mode in enumerate(_ESTABLISHED_MODES):
+        if data[35 + i // 8] & (0x80 >> (i % 8)):
+            modes.append(mode)
+
+    for offset in range(38, 54, 2):
+        b0, b1 = data[offset], data[offset + 1]
+        if (b0, b1) == (0x01, 0x01) or b0 == 0:
+            continue
+        width = (b0 + 31) * 8
+        num, den = _STANDARD_ASPECTS[b1 >> 6]
+        modes.append(Mode(width, width * num // den, (b1 & 0x3F) + 60))
+
+    for block in range(1, min(data[126] + 1, len(data) // EDID_BLOCK_SIZE)):
+        ext = data[block * EDID_BLOCK_SIZE : (block + 1) * EDID_BLOCK_SIZE]
+        if ext[0] == CEA_EXTENSION_TAG:
+            modes += _cea_modes(ext)
+
+    if preferred_mode is None and modes:
+        preferred_mode = modes[0]
+    # Remove duplicates keeping the order
+    modes = list(dict.fromkeys(modes))
+    return _ParsedEDID(preferred_mode, modes, physical_size)
+
+
+def _detailed_timing(d: bytes) -> Optional[Tuple[Mode, Tuple[int, int]]]:
+    clock = int.from_bytes(d[0:2], "little") * 10000
+    if clock == 0:
+        # Display descriptor such as the monitor name
+        return None
+    width = d[2] | (d[4] & 0xF0) << 4
+    hblank = d[3] | (d[4] & 0x0F) << 8
+    height = d[5] | (d[7] & 0xF0) << 4
+    vblank = d[6] | (d[7] & 0x0F) << 8
+    interlaced = bool(d[17] & 0x80)
+    refresh = round(clock / ((width + hblank) * (height + vblank))) if width and height else 0
+    if interlaced:
+        # Active lines of a field. The refresh rate is the field rate as in "1080i60".
+        height *= 2
+    size = (d[12] | (d[14] & 0xF0) << 4, d[13] | (d[14] & 0x0F) << 8)
+    return (Mode(width, height, refresh, interlaced), size)
+
+
+def _cea_modes(ext: bytes) -> List[Mode]:
+    modes: List[Mode] = []
+    dtd_offset = ext[2]
+    offset = 4
+    while offset < dtd_offset:
+        tag, length = ext[offset] >> 5, ext[offset] & 0x1F
+        if tag == CEA_VIDEO_DATA_BLOCK:
+            for svd in ext[offset + 1 : offset + 1 + length]:
+                # VICs 1 to 64 have the native flag in bit 7
+                vic = svd & 0x7F if svd <= 0xC0 else svd
+                if vic in _CEA_MODES:
+                    modes.append(_CEA_MODES[vic])
+        offset += 1 + length
+    if dtd_offset >= 4:
+        for offset in range(dtd_offset, EDID_BLOCK_SIZE - 18, 18):
+            timing = _detailed_timing(ext[offset : offset + 18])
+            if timing is not None:
+                modes.append(timing[0])
+    return modes
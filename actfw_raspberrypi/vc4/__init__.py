@@ -1 +1,2 @@
+from .consumer import DisplayConsumer  # noqa F401
 from .display import Display  # type: ignore  # noqa F401
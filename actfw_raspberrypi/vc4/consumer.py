@@ -0,0 +1,87 @@
+from queue import Empty
+from threading import Thread
+from typing import Any, Optional, Tuple, TypeVar
+
+from actfw_core.task import Consumer
+from actfw_core.util.pad import _PadBase, _PadDiscardingOld
+
+T = TypeVar("T")
+
+
+class DisplayConsumer(Consumer[T]):
+    window: Any
+    _latest: _PadBase[T]
+    _presenter: Thread
+    _error: Optional[BaseException]
+
+    """Consumer which shows received images on its own window"""
+
+    def __init__(
+        self,
+        display: Any,
+        dst: Tuple[int, int, int, int],
+        size: Tuple[int, int],
+        layer: int,
+        *,
+        num_buffers: int = 2,
+        pixel_format: str = "RGB",
+    ) -> None:
+        """
+
+        Blitting and updating the window run in a dedicated thread.
+        Only the latest received image is shown, so slow scanout never blocks the preceding tasks.
+        If drawing fails, the consumer stops and :meth:`run` raises the exception.
+
+        Args:
+            display (:class:`~actfw_raspberrypi.vc4.Display`): display
+            dst ((int, int, int, int)): destination rectangle (left, top, width, height)
+            size ((int, int)): window size (width, height)
+            layer (int): layer
+            num_buffers (int): number of window buffers
+            pixel_format (str): pixel format of the window (see ``Display.open_window``)
+
+        """
+        super().__init__()
+        self.window = display.open_window(dst, size, layer, num_buffers=num_buffers, pixel_format=pixel_format)
+        self._latest = _PadDiscardingOld()
+        self._presenter = Thread(target=self._present, daemon=True)
+        self._error = None
+
+    def render(self, image: T) -> None:
+        """
+        Draw an image into the window.
+
+        Override this to convert received objects, e.g. ``self.window.blit(image.tobytes())`` for PIL images.
+
+        Args:
+            image : received object. By default it is blitted as is.
+        """
+        self.window.blit(image)
+
+    def run(self) -> None:
+        """Run and start the activity"""
+        self._presenter.start()
+        super().run()
+        if self._error is not None:
+            raise self._error
+
+    def proc(self, image: T) -> None:
+        self._latest.put(image)
+
+    def cleanup(self) -> None:
+        self.stop()
+        self._presenter.join()
+        self.window.close()
+
+    def _present(self) -> None:
+        while self._is_running():
+            try:
+                image = self._latest.get(timeout=1)
+            except Empty:
+                continue
+            try:
+                self.render(image)
+                self.window.update()
+            except Exception as e:
+                self._error = e
+                self.stop()
@@ -3,36 +3,63 @@
 
 from actfw_core.system import EnvironmentVariableNotSet, get_actcast_firmware_type
 
+BACKENDS = ("drm", "dispmanx", "shm")
+
 
 class Display(object):
-    def __init__(self, display_num=0):
+    def __init__(self, display_num=0, backend=None, **kwargs):
+        """
+
+        Args:
+            display_num (int): display number
+            backend (str): "drm", "dispmanx", or "shm" which shares windows with other processes
+                through memory-mapped files in ``/dev/shm`` without a display (see :mod:`actfw_raspberrypi.vc4.shm`).
+                By default it is chosen by the firmware type.
+
+        Other keyword arguments are passed to the backend.
+        """
         self.display = None
 
-        try:
-            firmware_type = get_actcast_firmware_type()
-        except EnvironmentVariableNotSet:
-            firmware_type = None
+        if backend is None:
+            try:
+                firmware_type = get_actcast_firmware_type()
+            except EnvironmentVariableNotSet:
+                firmware_type = None
 
-        if firmware_type == "raspberrypi-bullseye" or firmware_type == "raspberrypi-bookworm":
+            if firmware_type == "raspberrypi-bullseye" or firmware_type == "raspberrypi-bookworm":
+                backend = "drm"
+            elif firmware_type == "raspberrypi-buster" or firmware_type is None:
+                backend = "dispmanx"
+            else:
+                raise RuntimeError(f"Error: firmware_type={firmware_type} is not supported.")
+
+        if backend == "drm":
             from actfw_raspberrypi.vc4.drm import Display
 
-            self.display = Display(display_num)
-        elif firmware_type == "raspberrypi-buster" or firmware_type is None:
+            self.display = Display(display_num, **kwargs)
+        elif backend == "dispmanx":
             from actfw_raspberrypi.vc4.dispmanx import Display
 
-            self.display = Display(display_num)
+            self.display = Display(display_num, **kwargs)
+        elif backend == "shm":
+            from actfw_raspberrypi.vc4.shm import Display
+
+            self.display = Display(display_num, **kwargs)
         else:
-            raise RuntimeError(f"Error: firmware_type={firmware_type} is not supported.")
+            raise RuntimeError(f"backend must be in {BACKENDS}: {backend}")
 
     def get_info(self):
         return self.display.get_info()
 
-    def open_window(self, dst, size, layer):
-        return self.display.open_window(dst, size, layer)
+    def open_window(self, dst, size, layer, *, num_buffers=2, pixel_format="RGB"):
+        return self.display.open_window(dst, size, layer, num_buffers=num_buffers, pixel_format=pixel_format)
 
     def size(self):
         return self.display.size()
 
+    def batch(self):
+        return self.display.batch()
+
     def close(self):
         self.display.close()
         self.display = None
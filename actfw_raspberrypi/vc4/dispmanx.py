@@ -1,86 +1,93 @@
 # type: ignore
 # flake8: noqa
 
+import threading
+import time
+from contextlib import contextmanager
 from ctypes import *
 from ctypes.util import find_library
+from functools import lru_cache
+
+from .pixel import BLIT_FORMATS, copy_rect, fill, rgb_to_rgb565
+from .stats import WindowStats
+from .swapchain import MAX_BUFFERS, MIN_BUFFERS, SwapChain
+
+
+@lru_cache(maxsize=None)
+def _find_library(name):
+    # find_library spawns ldconfig or gcc, so do not repeat it
+    return find_library(name)
 
 
 class _libbcm_host(object):
     def __init__(self):
+        # Loaded at the first call not to find libbcm_host on import
         self.lib = None
-        path = find_library("bcm_host")
-        if path is not None:
-            self.lib = CDLL(path, use_errno=True)
+        self._lock = threading.Lock()
+
+    def load(self):
+        lib = self.lib
+        if lib is None:
+            with self._lock:
+                if self.lib is None:
+                    path = _find_library("bcm_host")
+                    if path is not None:
+                        self.lib = CDLL(path, use_errno=True)
+                lib = self.lib
+            if lib is None:
+                raise FileNotFoundError("Not found: 'libbcm_host.so'")
+        return lib
 
     def init(self, *args, **kwargs):
-        if self.lib is None:
-            raise FileNotFoundError("Not found: 'libbcm_host.so'")
-        return self.lib.bcm_host_init(*args, **kwargs)
+        return self.load().bcm_host_init(*args, **kwargs)
 
     def vc_dispmanx_display_open(self, *args, **kwargs):
-        if self.lib is None:
-            raise FileNotFoundError("Not found: 'libbcm_host.so'")
-        return self.lib.vc_dispmanx_display_open(*args, **kwargs)
+        return self.load().vc_dispmanx_display_open(*args, **kwargs)
 
     def vc_dispmanx_display_get_info(self, *args, **kwargs):
-        if self.lib is None:
-            raise FileNotFoundError("Not found: 'libbcm_host.so'")
-        return self.lib.vc_dispmanx_display_get_info(*args, **kwargs)
+        return self.load().vc_dispmanx_display_get_info(*args, **kwargs)
 
     def vc_dispmanx_resource_create(self, *args, **kwargs):
-        if self.lib is None:
-            raise FileNotFoundError("Not found: 'libbcm_host.so'")
-        return self.lib.vc_dispmanx_resource_create(*args, **kwargs)
+        return self.load().vc_dispmanx_resource_create(*args, **kwargs)
 
     def vc_dispmanx_rect_set(self, *args, **kwargs):
-        if self.lib is None:
-            raise FileNotFoundError("Not found: 'libbcm_host.so'")
-        return self.lib.vc_dispmanx_rect_set(*args, **kwargs)
+        return self.load().vc_dispmanx_rect_set(*args, **kwargs)
 
     def vc_dispmanx_update_start(self, *args, **kwargs):
-        if self.lib is None:
-            raise FileNotFoundError("Not found: 'libbcm_host.so'")
-        return self.lib.vc_dispmanx_update_start(*args, **kwargs)
+        return self.load().vc_dispmanx_update_start(*args, **kwargs)
 
     def vc_dispmanx_element_add(self, *args, **kwargs):
-        if self.lib is None:
-            raise FileNotFoundError("Not found: 'libbcm_host.so'")
-        return self.lib.vc_dispmanx_element_add(*args, **kwargs)
+        return self.load().vc_dispmanx_element_add(*args, **kwargs)
 
     def vc_dispmanx_element_change_layer(self, *args, **kwargs):
-        if self.lib is None:
-            raise FileNotFoundError("Not found: 'libbcm_host.so'")
-        return self.lib.vc_dispmanx_element_change_layer(*args, **kwargs)
+        return self.load().vc_dispmanx_element_change_layer(*args, **kwargs)
+
+    def vc_dispmanx_update_submit(self, *args, **kwargs):
+        return self.load().vc_dispmanx_update_submit(*args, **kwargs)
 
     def vc_dispmanx_update_submit_sync(self, *args, **kwargs):
-        if self.lib is None:
-            raise FileNotFoundError("Not found: 'libbcm_host.so'")
-        return self.lib.vc_dispmanx_update_submit_sync(*args, **kwargs)
+        return self.load().vc_dispmanx_update_submit_sync(*args, **kwargs)
 
     def vc_dispmanx_element_remove(self, *args, **kwargs):
-        if self.lib is None:
-            raise FileNotFoundError("Not found: 'libbcm_host.so'")
-        return self.lib.vc_dispmanx_element_remove(*args, **kwargs)
+        return self.load().vc_dispmanx_element_remove(*args, **kwargs)
 
     def vc_dispmanx_resource_delete(self, *args, **kwargs):
-        if self.lib is None:
-            raise FileNotFoundError("Not found: 'libbcm_host.so'")
-        return self.lib.vc_dispmanx_resource_delete(*args, **kwargs)
+        return self.load().vc_dispmanx_resource_delete(*args, **kwargs)
 
     def vc_dispmanx_display_close(self, *args, **kwargs):
-        if self.lib is None:
-            raise FileNotFoundError("Not found: 'libbcm_host.so'")
-        return self.lib.vc_dispmanx_display_close(*args, **kwargs)
+        return self.load().vc_dispmanx_display_close(*args, **kwargs)
 
     def vc_dispmanx_resource_write_data(self, *args, **kwargs):
-        if self.lib is None:
-            raise FileNotFoundError("Not found: 'libbcm_host.so'")
-        return self.lib.vc_dispmanx_resource_write_data(*args, **kwargs)
+        return self.load().vc_dispmanx_resource_write_data(*args, **kwargs)
+
+    def vc_dispmanx_resource_read_data(self, *args, **kwargs):
+        return self.load().vc_dispmanx_resource_read_data(*args, **kwargs)
 
     def vc_dispmanx_element_change_source(self, *args, **kwargs):
-        if self.lib is None:
-            raise FileNotFoundError("Not found: 'libbcm_host.so'")
-        return self.lib.vc_dispmanx_element_change_source(*args, **kwargs)
+        return self.load().vc_dispmanx_element_change_source(*args, **kwargs)
+
+    def vc_dispmanx_element_change_attributes(self, *args, **kwargs):
+        return self.load().vc_dispmanx_element_change_attributes(*args, **kwargs)
 
 
 _bcm_host = _libbcm_host()
@@ -90,10 +97,19 @@ DISPMANX_UPDATE_HANDLE_T = c_uint
 DISPMANX_ELEMENT_HANDLE_T = c_uint
 DISPMANX_RESOURCE_HANDLE_T = c_uint
 
+DISPMANX_CALLBACK_FUNC_T = CFUNCTYPE(None, DISPMANX_UPDATE_HANDLE_T, c_void_p)
+
 DISPMANX_PROTECTION_MAX = 0x0F
 DISPMANX_PROTECTION_NONE = 0
 DISPMANX_PROTECTION_HDCP = 11
 
+ELEMENT_CHANGE_LAYER = 1 << 0
+ELEMENT_CHANGE_OPACITY = 1 << 1
+ELEMENT_CHANGE_DEST_RECT = 1 << 2
+ELEMENT_CHANGE_SRC_RECT = 1 << 3
+ELEMENT_CHANGE_MASK_RESOURCE = 1 << 4
+ELEMENT_CHANGE_TRANSFORM = 1 << 5
+
 DISPMANX_TRANSFORM_T = c_uint
 DISPMANX_NO_ROTATE = 0
 DISPMANX_ROTATE_90 = 1
@@ -123,7 +139,18 @@ DISPLAY_INPUT_FORMAT_RGB888 = VCOS_DISPLAY_INPUT_FORMAT_RGB888
 DISPLAY_INPUT_FORMAT_RGB565 = VCOS_DISPLAY_INPUT_FORMAT_RGB565
 
 VC_IMAGE_TYPE_T = c_uint
+VC_IMAGE_RGB565 = 1
 VC_IMAGE_RGB888 = 5
+VC_IMAGE_RGBA32 = 15
+VC_IMAGE_ARGB8888 = 43
+
+# Byte order of pixels in memory -> (VC image type, bpp)
+PIXEL_FORMATS = {
+    "RGB": (VC_IMAGE_RGB888, 24),
+    "RGBA": (VC_IMAGE_RGBA32, 32),
+    "BGRA": (VC_IMAGE_ARGB8888, 32),
+    "RGB565": (VC_IMAGE_RGB565, 16),
+}
 
 TRANSFORM_HFLIP = 1 << 0
 TRANSFORM_VFLIP = 1 << 1
@@ -179,14 +206,37 @@ class VC_DISPMANX_ALPHA_T(Structure):
 
 
 class Display(object):
-    """Display using VideoCore4 dispmanx"""
+    """
+    Display using VideoCore4 dispmanx
 
-    def __init__(self, display_num=0):
+    By default window updates are submitted asynchronously and :meth:`Window.update` returns without waiting
+    for vsync. Drawing waits only when no buffer of the window is free.
+    """
+
+    UPDATE_TIMEOUT = 1.0
+
+    def __init__(self, display_num=0, async_update=True):
+        """
+
+        Args:
+            display_num (int): display number
+            async_update (bool): submit updates without waiting for vsync
+
+        """
         self.display_num = display_num
+        self.async_update = async_update
         _bcm_host.init()
         self.handle = _bcm_host.vc_dispmanx_display_open(self.display_num)
         self.info = DISPMANX_MODEINFO_T()
         self.get_info()
+        self._cond = threading.Condition()
+        self._batching = 0
+        self._batch_update = None
+        self._batch_callbacks = []
+        # update handle -> callbacks called when the update has been applied
+        self._pending = {}
+        # Keep the C callback alive while updates are pending
+        self._on_update_func = DISPMANX_CALLBACK_FUNC_T(self._on_update)
 
     def get_info(self):
         """
@@ -202,7 +252,7 @@ class Display(object):
             raise RuntimeError("Failed to get display({}) information.".format(self.display_num))
         return self.info
 
-    def open_window(self, dst, size, layer):
+    def open_window(self, dst, size, layer, *, num_buffers=2, pixel_format="RGB"):
         """
         Open new window.
 
@@ -210,11 +260,100 @@ class Display(object):
             dst ((int, int, int, int)): destination rectangle (left, top, width, height)
             size ((int, int)): window size (width, height)
             layer (int): layer
+            num_buffers (int): number of buffers (2 to 4)
+            pixel_format (str): byte order of blitted images, "RGB", or "RGBA" or "BGRA" which are blended
+                with lower layers by their non-premultiplied alpha.
+                "RGB565" windows take 24-bit RGB images and pack them to 16 bits on blit to save memory bandwidth.
 
         Returns:
             :class:`~actfw_raspberrypi.vc4.display.Window`: window
         """
-        return Window(self, dst, size, layer)
+        return Window(self, dst, size, layer, num_buffers, pixel_format)
+
+    @contextmanager
+    def batch(self):
+        """
+        Apply window updates in the with-block at once.
+
+        Updates, layer changes and rectangle changes of all windows issued in the block are collected into one
+        update handle and submitted at the end of the block, so they are applied at the same vsync.
+        Drawing into a window which has no free buffer fails in the block.
+
+        Returns:
+            context manager
+        """
+        with self._cond:
+            self._batching += 1
+        try:
+            yield
+        finally:
+            update = None
+            with self._cond:
+                self._batching -= 1
+                if self._batching == 0 and self._batch_update is not None:
+                    update, callbacks = self._batch_update, self._batch_callbacks
+                    self._batch_update = None
+                    self._batch_callbacks = []
+            if update is not None:
+                self._submit_now(update, callbacks)
+
+    def wait(self, predicate):
+        """
+        Wait until a predicate on window states gets true. The predicate is evaluated with the state lock held.
+
+        Args:
+            predicate (callable): called without arguments
+        """
+        with self._cond:
+            if predicate():
+                return
+            if not self._pending:
+                if self._batch_update is not None:
+                    raise RuntimeError("can not wait for update in batch(): no free buffer")
+                raise RuntimeError("no update in flight")
+            if not self._cond.wait_for(predicate, self.UPDATE_TIMEOUT):
+                raise RuntimeError("timed out waiting for update")
+
+    def _start(self):
+        with self._cond:
+            if self._batching > 0:
+                if self._batch_update is None:
+                    self._batch_update = _bcm_host.vc_dispmanx_update_start(0)
+                return self._batch_update
+        return _bcm_host.vc_dispmanx_update_start(0)
+
+    def _submit(self, update, callback=None):
+        callbacks = [] if callback is None else [callback]
+        with self._cond:
+            if update == self._batch_update:
+                self._batch_callbacks += callbacks
+                return
+        self._submit_now(update, callbacks)
+
+    def _submit_now(self, update, callbacks):
+        if not self.async_update:
+            result = _bcm_host.vc_dispmanx_update_submit_sync(update)
+            if result != 0:
+                raise RuntimeError("Failed to submit update.: {}".format(result))
+            with self._cond:
+                for callback in callbacks:
+                    callback()
+            return
+        with self._cond:
+            # Registered before submitting because the callback may be called before submit returns
+            self._pending[update] = callbacks
+        result = _bcm_host.vc_dispmanx_update_submit(update, self._on_update_func, None)
+        if result != 0:
+            with self._cond:
+                del self._pending[update]
+            raise RuntimeError("Failed to submit update.: {}".format(result))
+
+    def _on_update(self, update, _arg):
+        # Called by a VideoCore service thread
+        with self._cond:
+            for callback in self._pending.pop(update, []):
+                callback()
+            self._cond.notify_all()
 
     def size(self):
         """
@@ -226,6 +365,8 @@ class Display(object):
         return (self.info.width, self.info.height)
 
     def close(self):
+        with self._cond:
+            self._cond.wait_for(lambda: not self._pending, self.UPDATE_TIMEOUT)
         _bcm_host.vc_dispmanx_display_close(self.handle)
 
     def __enter__(self):
@@ -235,40 +376,88 @@ class Display(object):
         self.close()
 
 
+def _pointer(image, size):
+    # Pass the memory of the image to C without copy. ctypes can only take a pointer of read-only memory from bytes.
+    if isinstance(image, bytes):
+        if len(image) < size:
+            raise RuntimeError("image is too small: {} < {}".format(len(image), size))
+        return image
+    view = memoryview(image)
+    if not view.c_contiguous:
+        raise RuntimeError("image must be C-contiguous")
+    view = view.cast("B")
+    if view.nbytes < size:
+        raise RuntimeError("image is too small: {} < {}".format(view.nbytes, size))
+    if view.readonly:
+        return (c_char * view.nbytes).from_buffer_copy(view)
+    return (c_char * view.nbytes).from_buffer(view)
+
+
+def _fixed16(rect):
+    # Source rectangles of elements are in 16.16 fixed point
+    return tuple(v << 16 for v in rect)
+
+
 class Window(object):
     """
-    Double buffered window.
+    Multi buffered window.
     """
 
-    def __init__(self, display, dst, size, layer):
+    def __init__(self, display, dst, size, layer, num_buffers=2, pixel_format="RGB"):
         self.display = display
         self.size = size
         self.layer = layer
-
-        if self.size[0] % 32 != 0:
-            raise RuntimeError("Window width must be a multiple of 32.")
-
-        self.format = VC_IMAGE_RGB888
-        self.num_of_resources = 2
+        self.src = (0, 0, size[0], size[1])
+        self.dst = dst
+        self.pixel_format = pixel_format
+        self.alpha = 255
+        self._changes = 0
+        # libbcm_host does not tell the refresh rate, so missed vblanks are counted at 60 Hz
+        self._stats = WindowStats()
+
+        if not MIN_BUFFERS <= num_buffers <= MAX_BUFFERS:
+            raise RuntimeError(f"num_buffers must be in [{MIN_BUFFERS}, {MAX_BUFFERS}]: {num_buffers}")
+        if pixel_format not in PIXEL_FORMATS:
+            raise RuntimeError(f"not support pixel format: {pixel_format}")
+
+        self.format, bpp = PIXEL_FORMATS[pixel_format]
+        self._cpp = bpp // 8
+        self._blit_format = BLIT_FORMATS.get(pixel_format, pixel_format)
+        # Resources are padded to a multiple of 32 pixels and cropped by the source rectangle
+        self._padded_width = (size[0] + 32 - 1) // 32 * 32
+        self._pitch = self._padded_width * self._cpp
+        self._rect = VC_RECT_T(0, 0, size[0], size[1])
+        self.num_of_resources = num_buffers
         self.resources = []
         self.native_image_handle = [c_uint()] * self.num_of_resources
         for i in range(self.num_of_resources):
             native_image_handle = c_uint()
-            handle = _bcm_host.vc_dispmanx_resource_create(self.format, size[0], size[1], byref(self.native_image_handle[i]))
+            handle = _bcm_host.vc_dispmanx_resource_create(
+                self.format, self._padded_width, size[1], byref(self.native_image_handle[i])
+            )
             if handle == 0:
                 raise RuntimeError("Failed to create window resource.")
             self.resources.append(handle)
+        self.chain = SwapChain(self.resources)
+        self._shadow = None
+        self._shadow_buf = None
+        # True if the whole back resource has been blitted since the last update
+        self._back_drawn = False
 
         src_rect = VC_RECT_T()
-        _bcm_host.vc_dispmanx_rect_set(byref(src_rect), 0, 0, size[0] << 16, size[1] << 16)
+        _bcm_host.vc_dispmanx_rect_set(byref(src_rect), *_fixed16(self.src))
         dst_rect = VC_RECT_T()
         _bcm_host.vc_dispmanx_rect_set(byref(dst_rect), dst[0], dst[1], dst[2], dst[3])
 
         update = _bcm_host.vc_dispmanx_update_start(0)
 
         alpha = VC_DISPMANX_ALPHA_T()
-        alpha.flags = DISPMANX_FLAGS_ALPHA_FROM_SOURCE | DISPMANX_FLAGS_ALPHA_FIXED_ALL_PIXELS
-        alpha.opacity = 255
+        if "A" in pixel_format:
+            # Per-pixel alpha multiplied by the opacity of the element
+            alpha.flags = DISPMANX_FLAGS_ALPHA_FROM_SOURCE | DISPMANX_FLAGS_ALPHA_MIX
+        else:
+            alpha.flags = DISPMANX_FLAGS_ALPHA_FROM_SOURCE | DISPMANX_FLAGS_ALPHA_FIXED_ALL_PIXELS
+        alpha.opacity = self.alpha
         alpha.mask = 0
 
         self.element = _bcm_host.vc_dispmanx_element_add(
@@ -276,7 +465,7 @@ class Window(object):
             self.display.handle,
             self.layer,
             byref(dst_rect),
-            self.resources[1],
+            self.chain.scanout,
             byref(src_rect),
             DISPMANX_PROTECTION_NONE,
             byref(alpha),
@@ -293,10 +482,9 @@ class Window(object):
         Clear window.
 
         Args:
-            rgb ((int, int, int)): clear color
+            rgb ((int, int, int)): clear color. Pass (r, g, b, a) to clear windows with alpha, e.g. to transparent.
         """
-        color = b"".join(map(lambda x: x.to_bytes(1, "little"), rgb))
-        self.blit(color * self.size[0] * self.size[1])
+        self.blit(fill(self._blit_format, rgb, self.size[0], self.size[1]))
 
     def set_layer(self, layer):
         """
@@ -305,9 +493,9 @@ class Window(object):
         Args:
             layer (int): new layer
         """
-        update = _bcm_host.vc_dispmanx_update_start(0)
+        update = self.display._start()
         _bcm_host.vc_dispmanx_element_change_layer(update, self.element, layer)
-        _bcm_host.vc_dispmanx_update_submit_sync(update)
+        self.display._submit(update)
         self.layer = layer
 
     def swap_layer(self, window):
@@ -317,46 +505,228 @@ class Window(object):
         Args:
             window (:class:`~actfw_raspberrypi.vc4.display.Window`): target window
         """
-        update = _bcm_host.vc_dispmanx_update_start(0)
+        update = self.display._start()
         _bcm_host.vc_dispmanx_element_change_layer(update, self.element, window.layer)
         _bcm_host.vc_dispmanx_element_change_layer(update, window.element, self.layer)
-        _bcm_host.vc_dispmanx_update_submit_sync(update)
+        self.display._submit(update)
         self.layer, window.layer = window.layer, self.layer
 
-    def blit(self, image):
+    def set_source_rect(self, rect):
+        """
+        Set the rectangle of the window resources to show.
+
+        The rectangle is scaled to the destination rectangle by the display hardware,
+        so a part of the window can be zoomed without re-creating the resources.
+        It is applied with the next :meth:`update`.
+
+        Args:
+            rect ((int, int, int, int)): rectangle in window (left, top, width, height)
+        """
+        x, y, w, h = rect
+        if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > self.size[0] or y + h > self.size[1]:
+            raise RuntimeError("source rect {} is out of window".format(rect))
+        self.src = tuple(rect)
+        self._changes |= ELEMENT_CHANGE_SRC_RECT
+
+    def set_dest_rect(self, rect):
+        """
+        Set the rectangle of the display to show the window in.
+
+        It is applied with the next :meth:`update`.
+
+        Args:
+            rect ((int, int, int, int)): destination rectangle (left, top, width, height)
+        """
+        if rect[2] <= 0 or rect[3] <= 0:
+            raise RuntimeError("dest rect {} is empty".format(rect))
+        self.dst = tuple(rect)
+        self._changes |= ELEMENT_CHANGE_DEST_RECT
+
+    def set_alpha(self, alpha):
+        """
+        Set the opacity of the whole window.
+
+        For windows with alpha, it is multiplied by the alpha of each pixel.
+        It is applied with the next :meth:`update`.
+
+        Args:
+            alpha (int): opacity from 0 (transparent) to 255 (opaque)
+        """
+        if not 0 <= alpha <= 255:
+            raise RuntimeError("alpha must be in [0, 255]: {}".format(alpha))
+        self.alpha = alpha
+        self._changes |= ELEMENT_CHANGE_OPACITY
+
+    def blit(self, image, stride=None):
         """
         Blit image to window.
 
+        The image is transferred from its own memory, so NumPy arrays, ``bytearray``, ``mmap`` and memoryviews
+        can be passed without ``tobytes()``. Read-only buffers other than ``bytes`` are copied once.
+        Rows of images of which width is not a multiple of 32 are padded to the resource pitch on the way,
+        unless they are already laid out with :meth:`pitch`.
+
         Args:
-            image (bytes): RGB image with which size is the same as window size
+            image (bytes-like): C-contiguous image in ``pixel_format`` (RGB for "RGB565") with which size is the same
+                as window size
+            stride (int): bytes between rows of ``image``, either packed rows or :meth:`pitch`.
+                By default it is guessed from the size of ``image``.
         """
-        src_rect = VC_RECT_T()
-        _bcm_host.vc_dispmanx_rect_set(byref(src_rect), 0, 0, self.size[0], self.size[1])
-        pitch = (self.size[0] * 3 + 32 - 1) // 32 * 32
-        buf = c_char_p(image)
-        result = _bcm_host.vc_dispmanx_resource_write_data(self.resources[0], self.format, c_int(pitch), buf, byref(src_rect))
-        if result != 0:
-            raise RuntimeError("Failed to blit.: {}".format(result))
+        start = time.perf_counter()
+        width, height = self.size
+        as_is = self._blit_format == self.pixel_format
+        if stride is None:
+            if as_is and memoryview(image).nbytes >= self._pitch * height:
+                stride = self._pitch
+            else:
+                stride = width * len(self._blit_format)
+        resource = self._back()
+        if self._shadow is None and (stride != self._pitch or not as_is):
+            # The shadow is overwritten as a whole, so it is not read back
+            self._init_shadow()
+        if self._shadow is not None:
+            self._convert(image, stride, (0, 0, width, height))
+            buf = self._shadow_buf
+        else:
+            buf = _pointer(image, self._pitch * height)
+        nbytes = self._write(resource, buf, (0, 0, width, height))
+        self._back_drawn = True
+        self.chain.take_stale(resource)
+        self.chain.damage((0, 0, width, height))
+        self._stats.blit(time.perf_counter() - start, nbytes)
+
+    def blit_region(self, image, rect, stride=None):
+        """
+        Blit image to a rectangle of window.
+
+        Only the rows of the rectangle and of the regions which the back buffer misses from the previous frames
+        are transferred to the back buffer, so small changes such as overlays cost little memory bandwidth.
+        The first call reads the latest frame back once to keep a copy of the window content.
+
+        Args:
+            image (bytes-like): image in ``pixel_format`` (RGB for "RGB565") with which size is the same as the rectangle
+            rect ((int, int, int, int)): rectangle in window (left, top, width, height)
+            stride (int): bytes between rows of ``image``. By default rows are packed.
+        """
+        start = time.perf_counter()
+        x, y, w, h = rect
+        width, height = self.size
+        if x < 0 or y < 0 or x + w > width or y + h > height:
+            raise RuntimeError("rect {} is out of window".format(rect))
+        resource = self._back()
+        if self._shadow is None:
+            self._init_shadow()
+            # The back resource already holds the frame if it has been blitted since the last update
+            source = resource if self._back_drawn else self.chain.latest
+            source_rect = VC_RECT_T(0, 0, width, height)
+            result = _bcm_host.vc_dispmanx_resource_read_data(source, byref(source_rect), self._shadow_buf, self._pitch)
+            if result != 0:
+                raise RuntimeError("Failed to read window resource.: {}".format(result))
+        self._convert(image, stride, rect)
+        # Rows are transferred as a whole anyway
+        nbytes = 0
+        for _, y, _, h in self.chain.take_stale(resource) + [rect]:
+            nbytes += self._write(resource, self._shadow_buf, (0, y, width, h))
+        self.chain.damage(rect)
+        self._stats.blit(time.perf_counter() - start, nbytes)
+
+    def pitch(self):
+        """
+        Get bytes between rows of the window resources.
+
+        Images laid out with this pitch are blitted without repacking.
+
+        Returns:
+            int: pitch
+        """
+        return self._pitch
 
     def update(self):
         """
         Update window.
+
+        Shows the buffer blitted since the last update together with the changes of the source and destination
+        rectangles. Does nothing if nothing has been changed.
+        Unless the display is opened with ``async_update=False``, this returns without waiting for vsync.
         """
-        update = _bcm_host.vc_dispmanx_update_start(0)
-        _bcm_host.vc_dispmanx_element_change_source(update, self.element, self.resources[0])
-        _bcm_host.vc_dispmanx_update_submit_sync(update)
-        self.resources.append(self.resources.pop(0))
+        if self.chain.back is None and self._changes == 0:
+            return
+        start = time.perf_counter()
+        update = self.display._start()
+        if self._changes != 0:
+            src_rect = VC_RECT_T()
+            _bcm_host.vc_dispmanx_rect_set(byref(src_rect), *_fixed16(self.src))
+            dst_rect = VC_RECT_T()
+            _bcm_host.vc_dispmanx_rect_set(byref(dst_rect), *self.dst)
+            _bcm_host.vc_dispmanx_element_change_attributes(
+                update, self.element, self._changes, 0, self.alpha, byref(dst_rect), byref(src_rect), 0, VC_IMAGE_ROT0
+            )
+            self._changes = 0
+        if self.chain.back is None:
+            self.display._submit(update)
+            return
+        with self.display._cond:
+            resource = self.chain.queue()
+        self._back_drawn = False
+        _bcm_host.vc_dispmanx_element_change_source(update, self.element, resource)
+        queued_at = time.monotonic()
+        self.display._submit(update, lambda: self._on_presented(resource, queued_at))
+        self._stats.update(time.perf_counter() - start)
+
+    def stats(self):
+        """
+        Get presentation statistics of the window.
+
+        Returns:
+            dict: snapshot described in :meth:`~actfw_raspberrypi.vc4.stats.WindowStats.snapshot`
+        """
+        return self._stats.snapshot()
 
     def close(self):
         """
         Close window.
         """
+        if self.chain.queued:
+            self.display.wait(lambda: not self.chain.queued)
         update = _bcm_host.vc_dispmanx_update_start(0)
         _bcm_host.vc_dispmanx_element_remove(update, self.element)
         _bcm_host.vc_dispmanx_update_submit_sync(update)
         for resource in self.resources:
             _bcm_host.vc_dispmanx_resource_delete(resource)
 
+    def _back(self):
+        with self.display._cond:
+            if self.chain.acquire() is None:
+                self._stats.buffer_wait()
+                self.display.wait(lambda: self.chain.acquire() is not None)
+            return self.chain.back
+
+    def _on_presented(self, resource, queued_at):
+        # Called with the display lock held when the update has been applied at vsync
+        self.chain.presented(resource)
+        self._stats.presented(queued_at)
+
+    def _convert(self, image, stride, rect):
+        # Copy a blitted image into a rectangle of the shadow in the resource format
+        x, y, w, h = rect
+        if stride is None:
+            stride = w * len(self._blit_format)
+        if self.pixel_format == "RGB565":
+            rgb_to_rgb565(memoryview(self._shadow)[y * self._pitch + x * 2 :], self._pitch, image, stride, w, h)
+        else:
+            copy_rect(self._shadow, self._pitch, image, stride, rect, self._cpp)
+
+    def _init_shadow(self):
+        self._shadow = bytearray(self._pitch * self.size[1])
+        self._shadow_buf = (c_char * len(self._shadow)).from_buffer(self._shadow)
+
+    def _write(self, resource, buf, rect):
+        self._rect.x, self._rect.y, self._rect.width, self._rect.height = rect
+        result = _bcm_host.vc_dispmanx_resource_write_data(resource, self.format, self._pitch, buf, byref(self._rect))
+        if result != 0:
+            raise RuntimeError("Failed to blit.: {}".format(result))
+        return rect[3] * self._pitch
+
     def __enter__(self):
         return self
 
@@ -2,18 +2,23 @@
 # flake8: noqa
 
 import sys
+import time
+from contextlib import nullcontext
 
+from ..pixel import BLIT_FORMATS, copy_rect, fill, rgb_to_rgb565
+from ..stats import WindowStats
+from ..swapchain import MAX_BUFFERS, MIN_BUFFERS, SwapChain
 from .drm import *
 
 
 class Display(object):
     """Display using libdrm"""
 
-    def __init__(self, display_num=0):
+    def __init__(self, display_num=0, page_flip=True):
         if display_num != 0:
             raise RuntimeError(f"display_num={display_num} is not supported in bullseye.")
         try:
-            self.device = Device()
+            self.device = Device(page_flip)
         except RuntimeError as e:
             print(f"Failed to open display: {e}", file=sys.stderr)
             self.device = None
@@ -24,7 +29,7 @@ class Display(object):
         """
         raise RuntimeError("This API is deprecated. If you need width and height, use Display.size().")
 
-    def open_window(self, dst, size, layer):
+    def open_window(self, dst, size, layer, *, num_buffers=2, pixel_format="RGB"):
         """
         Open new window.
 
@@ -32,13 +37,37 @@ class Display(object):
             dst ((int, int, int, int)): destination rectangle (left, top, width, height)
             size ((int, int)): window size (width, height)
             layer (int): layer
+            num_buffers (int): number of buffers (2 to 4).
+                More buffers let the application draw the next frames while previous ones wait for vblank.
+            pixel_format (str): format of blitted images.
+                Byte order of packed pixels ("RGB", "BGR", "RGBX", "BGRX", "RGBA" or "BGRA"),
+                or planar YUV ("NV12" or "YUV420") which is converted to RGB by the display hardware.
+                "RGB565" windows take 24-bit RGB images and pack them to 16 bits on blit to save memory bandwidth.
 
         Returns:
             :class:`~actfw_raspberrypi.vc4.drm.display.Window`: window
         """
         if self.device is None:
-            return DummyWindow(self.device, dst, size, layer)
-        return Window(self.device, dst, size, layer)
+            return DummyWindow(self.device, dst, size, layer, num_buffers, pixel_format)
+        return Window(self.device, dst, size, layer, num_buffers, pixel_format)
+
+    def import_fb(self, dmabuf_fd, width, height, pixel_format, pitch):
+        """
+        Import a DMA-BUF (e.g. a V4L2 buffer exported by VIDIOC_EXPBUF) to show it by :meth:`Window.present`.
+
+        Args:
+            dmabuf_fd (int): DMA-BUF file descriptor
+            width (int): image width
+            height (int): image height
+            pixel_format (str): pixel format such as "NV12" or "RGB"
+            pitch (int): bytes between rows of the first plane
+
+        Returns:
+            :class:`~actfw_raspberrypi.vc4.drm.drm.PrimeFramebuffer`: framebuffer, or None if display is not found
+        """
+        if self.device is None:
+            return None
+        return self.device.import_fb(dmabuf_fd, width, height, pixel_format, pitch)
 
     def size(self):
         """
@@ -53,6 +82,19 @@ class Display(object):
 
         return (self.device.width, self.device.height)
 
+    def batch(self):
+        """
+        Apply window updates in the with-block at once.
+
+        Updates of all windows issued in the block are applied by one atomic commit at the same vblank.
+
+        Returns:
+            context manager
+        """
+        if self.device is None:
+            return nullcontext()
+        return self.device.batch()
+
     def close(self):
         if self.device is not None:
             self.device.close()
@@ -66,31 +108,63 @@ class Display(object):
 
 class Window(object):
     """
-    Double buffered window.
+    Multi buffered window.
+
+    If the device supports page flipping, :meth:`update` queues the back buffer and returns immediately.
+    Drawing waits only when no buffer is free, i.e. all the other buffers are queued or scanned out.
+
+    Framebuffers are allocated in the DRM format matching ``pixel_format`` so that blitted images are copied as is.
+    If the plane does not support that format, channels are reordered while blitting.
+    YUV formats are scanned out as is and converted by the display hardware as full range BT.601.
+    Formats with alpha ("RGBA" and "BGRA") are blended with lower layers by their non-premultiplied alpha.
     """
 
-    def __init__(self, device, dst, size, layer):
+    def __init__(self, device, dst, size, layer, num_buffers=2, pixel_format="RGB"):
         self.device = device
         self.size = size
         width, height = size
         self.crtc_id = self.device.crtc.crtc_id
         self.src = (0, 0, width, height)
         self.dst = dst
-        self.front_fb = self.device.create_fb(width, height)
-        self.back_fb = self.device.create_fb(width, height)
-
-        self.plane = self.device.pick_plane(layer)
-        self.plane.set(self.crtc_id, self.front_fb.fb_id, self.dst, self.src)
+        self.pixel_format = pixel_format
+        self.alpha = 255
+        self._blit_format = BLIT_FORMATS.get(pixel_format, pixel_format)
+        if not MIN_BUFFERS <= num_buffers <= MAX_BUFFERS:
+            raise RuntimeError(f"num_buffers must be in [{MIN_BUFFERS}, {MAX_BUFFERS}]: {num_buffers}")
+
+        self.plane = self.device.pick_plane(layer, pixel_format, self._scaling())
+        fbs = []
+        try:
+            self.fb_format, self._order = self._choose_format(self.plane, pixel_format)
+            self._setup_plane(self.plane)
+            for _ in range(num_buffers):
+                fbs.append(self.device.create_fb(width, height, pixel_format=self.fb_format))
+            if not self.device.test_plane(self.plane, fbs[0].fb_id, self.dst, self.src):
+                raise RuntimeError(f"layer {layer} can not show {width}x{height} window at {dst}")
+        except Exception:
+            # Give back the plane and the framebuffers created so far
+            self.device.free_plane(self.plane)
+            for fb in fbs:
+                fb.close()
+            raise
+        self.chain = SwapChain(fbs)
+        self._releases = {}
+        self._shadow = None
+        # True if the whole back buffer has been drawn since the last update
+        self._back_drawn = False
+        self._attributes_changed = False
+        vrefresh = self.device.crtc.mode.vrefresh
+        self._stats = WindowStats(1 / vrefresh if vrefresh else 1 / 60)
+        self.plane.set(self.crtc_id, self.chain.scanout.fb_id, self.dst, self.src)
 
     def clear(self, rgb=(0, 0, 0)):
         """
         Clear window.
 
         Args:
-            rgb ((int, int, int)): clear color
+            rgb ((int, int, int)): clear color. Pass (r, g, b, a) to clear windows with alpha, e.g. to transparent.
         """
-        color = b"".join(map(lambda x: x.to_bytes(1, "little"), rgb))
-        self.blit(color * self.size[0] * self.size[1])
+        self.blit(fill(self._blit_format, rgb, self.size[0], self.size[1]))
 
     def set_layer(self, layer):
         """
@@ -101,10 +175,19 @@ class Window(object):
         """
         if self.plane.zpos == layer:
             return
-        else:
-            self.device.free_plane(self.plane)
-            self.plane = self.device.pick_plane(layer)
-            self.plane.set(self.crtc_id, self.front_fb.fb_id, self.dst, self.src)
+        self._wait_for_flip()
+        # The current plane is kept until the new one is known to show the window
+        plane = self._pick_plane(layer)
+        try:
+            self._setup_plane(plane)
+            if not self.device.test_plane(plane, self.chain.scanout.fb_id, self.dst, self.src):
+                raise RuntimeError(f"layer {layer} can not show the window")
+        except RuntimeError:
+            self.device.free_plane(plane)
+            raise
+        plane.set(self.crtc_id, self.chain.scanout.fb_id, self.dst, self.src)
+        self.device.free_plane(self.plane)
+        self.plane = plane
 
     def swap_layer(self, window):
         """
@@ -115,34 +198,328 @@ class Window(object):
         """
         zpos0 = self.plane.zpos
         zpos1 = window.plane.zpos
-        self.device.free_plane(self.plane)
-        window.set_layer(zpos0)
-        self.plane = self.device.pick_plane(zpos1)
-        self.plane.set(self.crtc_id, self.front_fb.fb_id, self.dst, self.src)
+        if zpos0 == zpos1:
+            return
+        # Both layers are in use, so the planes exchange their zpos instead of being picked again.
+        # Nothing is changed unless both planes can move.
+        if not (self.plane.can_move(zpos1) and window.plane.can_move(zpos0)):
+            raise RuntimeError(f"layers {zpos0} and {zpos1} can not be swapped")
+        self._wait_for_flip()
+        window._wait_for_flip()
+        self.plane.set_zpos(zpos1)
+        try:
+            window.plane.set_zpos(zpos0)
+        except RuntimeError:
+            self.plane.set_zpos(zpos0)
+            raise
+
+    def set_source_rect(self, rect):
+        """
+        Set the rectangle of the window buffers to show.
+
+        The rectangle is scaled to the destination rectangle by the display hardware,
+        so a part of the window can be zoomed without re-allocating the buffers.
+        It is applied with the next :meth:`update` or :meth:`present`.
+
+        Args:
+            rect ((int, int, int, int)): rectangle in window (left, top, width, height)
+        """
+        x, y, w, h = rect
+        if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > self.size[0] or y + h > self.size[1]:
+            raise RuntimeError(f"source rect {rect} is out of window")
+        self._set_geometry(self.dst, tuple(rect))
+
+    def set_dest_rect(self, rect):
+        """
+        Set the rectangle of the display to show the window in.
+
+        It is applied with the next :meth:`update` or :meth:`present`.
+
+        Args:
+            rect ((int, int, int, int)): destination rectangle (left, top, width, height)
+        """
+        if rect[2] <= 0 or rect[3] <= 0:
+            raise RuntimeError(f"dest rect {rect} is empty")
+        self._set_geometry(tuple(rect), self.src)
 
-    def blit(self, image):
+    def set_alpha(self, alpha):
+        """
+        Set the opacity of the whole window by the alpha property of the plane.
+
+        For windows with alpha, it is multiplied by the alpha of each pixel.
+        It is applied with the next :meth:`update` or :meth:`present`.
+
+        Args:
+            alpha (int): opacity from 0 (transparent) to 255 (opaque)
+        """
+        if not 0 <= alpha <= 255:
+            raise RuntimeError(f"alpha must be in [0, 255]: {alpha}")
+        if alpha != self.alpha:
+            self.alpha = alpha
+            self.plane.alpha = alpha * 0x101
+            self._attributes_changed = True
+
+    def blit(self, image, stride=None):
         """
         Blit image to window.
 
         Args:
-            image (bytes): RGB image with which size is the same as window size
+            image (bytes-like): image in ``pixel_format`` (RGB for "RGB565") with which size is the same as window size
+            stride (int): bytes between rows of ``image`` (of its Y plane for YUV). By default rows are packed.
+        """
+        start = time.perf_counter()
+        fb = self._back()
+        width, height = self.size
+        if self._shadow is not None:
+            self._convert(self._shadow, fb.pitch, image, stride, (0, 0, width, height))
+            fb.write(self._shadow, fb.pitch)
+        elif self._order is None and self._blit_format == self.fb_format:
+            fb.write(image, stride)
+        else:
+            self._convert(fb.buffer, fb.pitch, image, stride, (0, 0, width, height))
+        self._back_drawn = True
+        self.chain.take_stale(fb)
+        self.chain.damage((0, 0, width, height))
+        self._stats.blit(time.perf_counter() - start, fb.size)
+
+    def blit_region(self, image, rect, stride=None):
+        """
+        Blit image to a rectangle of window.
+
+        Only the rectangle and the regions which the back buffer misses from the previous frames are copied
+        into the back buffer, so small changes such as overlays cost little memory bandwidth.
+        The first call reads the latest frame back once to keep a copy of the window content.
+        Not available for YUV formats.
+
+        Args:
+            image (bytes-like): image in ``pixel_format`` (RGB for "RGB565") with which size is the same as the rectangle.
+                To take a part of a whole frame, pass a memoryview starting at the top left pixel of the part
+                with ``stride`` of the frame.
+            rect ((int, int, int, int)): rectangle in window (left, top, width, height)
+            stride (int): bytes between rows of ``image``. By default rows are packed.
+        """
+        if self.pixel_format in YUV_FORMATS:
+            raise RuntimeError(f"blit_region() is not supported for {self.pixel_format}")
+        start = time.perf_counter()
+        x, y, w, h = rect
+        if x < 0 or y < 0 or x + w > self.size[0] or y + h > self.size[1]:
+            raise RuntimeError(f"rect {rect} is out of window")
+        fb = self._back()
+        cpp = fb.bpp // 8
+        nbytes = 0
+        if self._shadow is None:
+            # The back buffer already holds the frame if it has been drawn since the last update
+            source = fb if self._back_drawn else self.chain.latest
+            with source.view() as content:
+                self._shadow = bytearray(content)
+        self._convert(self._shadow, fb.pitch, image, stride, rect)
+        with fb.view() as view:
+            for x, y, w, h in self.chain.take_stale(fb) + [rect]:
+                offset = y * fb.pitch + x * cpp
+                copy_rect(view, fb.pitch, memoryview(self._shadow)[offset:], fb.pitch, (x, y, w, h), cpp)
+                nbytes += w * h * cpp
+        self.chain.damage(rect)
+        self._stats.blit(time.perf_counter() - start, nbytes)
+
+    def view(self):
         """
-        self.back_fb.write(image)
+        Get the back buffer to draw into it without an intermediate copy.
+
+        The back buffer changes at each :meth:`update`, so get the view again for every frame.
+        Release the view before the window is closed.
+        Pixels are in ``fb_format`` byte order, which differs from ``pixel_format`` if channels are reordered on blit.
+
+        Returns:
+            memoryview: writable bytes of the back buffer. Row ``y`` starts at ``y * pitch()``.
+        """
+        return self._drawn_directly().view()
+
+    def array(self):
+        """
+        Get the back buffer as a NumPy array. Requires numpy.
+
+        The back buffer changes at each :meth:`update`, so get the array again for every frame.
+
+        Returns:
+            numpy.ndarray: writable uint8 array of shape (height, width, channels) in ``fb_format`` byte order
+        """
+        return self._drawn_directly().array()
+
+    def pitch(self):
+        """
+        Get bytes between rows of the window buffers.
+
+        Returns:
+            int: pitch
+        """
+        return self.chain.buffers[0].pitch
 
     def update(self):
         """
         Update window.
+
+        Shows the back buffer drawn since the last update.
+        If nothing has been drawn, the frame on screen is shown again only when the source or destination rectangle
+        or alpha has been changed.
+        """
+        start = time.perf_counter()
+        if self.chain.back is not None:
+            self._back_drawn = False
+            self._show(self.chain.queue())
+        elif self._attributes_changed:
+            self._wait_for_flip()
+            self._show(self.chain.queue(self.chain.scanout))
+        else:
+            return
+        self._stats.update(time.perf_counter() - start)
+
+    def present(self, fb, release=None):
+        """
+        Show an imported framebuffer without copy.
+
+        Open the window with the same ``pixel_format`` as the framebuffer so that the plane is configured for it.
+        Do not present the framebuffer again before it is released.
+
+        Args:
+            fb (:class:`~actfw_raspberrypi.vc4.drm.drm.PrimeFramebuffer`): framebuffer from :meth:`Display.import_fb`
+            release (callable): called with ``fb`` when it is no longer scanned out,
+                i.e. when the flip to the next frame has completed or the frame is replaced before it is shown.
+                Requeue the capture buffer in it.
+        """
+        start = time.perf_counter()
+        self._releases[fb] = release
+        self._show(self.chain.queue(fb))
+        self._stats.update(time.perf_counter() - start)
+
+    def stats(self):
         """
-        self.plane.set(self.crtc_id, self.back_fb.fb_id, self.dst, self.src)
-        self.front_fb, self.back_fb = self.back_fb, self.front_fb
+        Get presentation statistics of the window.
+
+        Frames replaced by newer frames before being committed are counted as dropped.
+
+        Returns:
+            dict: snapshot described in :meth:`~actfw_raspberrypi.vc4.stats.WindowStats.snapshot`
+        """
+        return self._stats.snapshot()
 
     def close(self):
         """
         Close window.
         """
-        self.front_fb.close()
-        self.back_fb.close()
+        self._wait_for_flip()
+        for fb in self.chain.buffers:
+            fb.close()
         self.device.free_plane(self.plane)
+        self._release(self.chain.scanout)
+
+    def _back(self):
+        if self.chain.acquire() is None:
+            self._stats.buffer_wait()
+            self.device.wait(lambda: self.chain.acquire() is not None)
+        return self.chain.back
+
+    def _drawn_directly(self):
+        # The window content can not be tracked any more. It is read back at the next blit_region().
+        fb = self._back()
+        self._shadow = None
+        self._back_drawn = True
+        self.chain.take_stale(fb)
+        self.chain.damage((0, 0, self.size[0], self.size[1]))
+        return fb
+
+    def _convert(self, dst, dst_pitch, image, stride, rect):
+        # Copy a blitted image into a rectangle of a buffer in the framebuffer format
+        x, y, w, h = rect
+        if stride is None:
+            stride = w * len(self._blit_format)
+        if self.fb_format == "RGB565":
+            rgb_to_rgb565(memoryview(dst)[y * dst_pitch + x * 2 :], dst_pitch, image, stride, w, h)
+        else:
+            copy_rect(dst, dst_pitch, image, stride, rect, PIXEL_FORMATS[self.fb_format][1] // 8, self._order)
+
+    def _setup_plane(self, plane):
+        if self.pixel_format in YUV_FORMATS:
+            plane._set_color_space()
+        if "A" in self.fb_format:
+            plane._set_blend_mode("Coverage")
+        plane.alpha = self.alpha * 0x101
+
+    def _pick_plane(self, layer):
+        # Framebuffers have been allocated, so the plane has to show them as is
+        plane = self.device.pick_plane(layer, self.fb_format, self._scaling())
+        if plane.format_cost(self.fb_format) != 0:
+            self.device.free_plane(plane)
+            raise RuntimeError(f"layer {layer} does not support pixel format: {self.fb_format}")
+        return plane
+
+    def _scaling(self):
+        return tuple(self.src[2:]) != tuple(self.dst[2:])
+
+    def _set_geometry(self, dst, src):
+        if (dst, src) == (self.dst, self.src):
+            return
+        # Scaling limits of the plane are checked here rather than failing in a later commit
+        if not self.device.test_plane(self.plane, self.chain.scanout.fb_id, dst, src):
+            raise RuntimeError(f"layer {self.plane.zpos} can not scale {src} to {dst}")
+        self.dst = dst
+        self.src = src
+        self._attributes_changed = True
+
+    def _show(self, fb):
+        self._attributes_changed = False
+        if self.device.page_flip:
+            # Callbacks of a flip run before the next commit, so the commit time is the one of this frame.
+            # The time waiting for the in-flight flip is not counted as latency.
+            self.device.queue_flip(
+                self.plane,
+                fb.fb_id,
+                self.dst,
+                self.src,
+                lambda presented: self._on_flip(fb, presented, self.device.commit_time),
+            )
+        else:
+            queued_at = time.monotonic()
+            self.plane.set(self.crtc_id, fb.fb_id, self.dst, self.src)
+            self._on_flip(fb, True, queued_at)
+
+    def _on_flip(self, fb, presented, queued_at):
+        if presented:
+            self._stats.presented(queued_at, self.device.flip_time if self.device.page_flip else None)
+            previous = self.chain.presented(fb)
+            if previous is not fb:
+                self._release(previous)
+        else:
+            self._stats.dropped()
+            self.chain.dropped(fb)
+            # The frame on screen may have been shown again for a geometry change
+            if fb is not self.chain.scanout:
+                self._release(fb)
+
+    def _release(self, fb):
+        release = self._releases.pop(fb, None)
+        if release is not None:
+            release(fb)
+
+    @staticmethod
+    def _choose_format(plane, pixel_format):
+        if pixel_format not in PIXEL_FORMATS:
+            raise RuntimeError(f"not support pixel format: {pixel_format}")
+        drm_format, bpp = PIXEL_FORMATS[pixel_format]
+        if drm_format in plane.formats:
+            return (pixel_format, None)
+        if pixel_format in YUV_FORMATS:
+            raise RuntimeError(f"layer {plane.zpos} does not support pixel format: {pixel_format}")
+        # Channels of the input which fill padding bytes of the framebuffer and vice versa
+        alias = {"X": "A", "A": "X"}
+        for fb_format, (fb_drm_format, fb_bpp) in PIXEL_FORMATS.items():
+            if fb_bpp == bpp and fb_drm_format in plane.formats:
+                order = tuple(pixel_format.index(c if c in pixel_format else alias[c]) for c in fb_format)
+                return (fb_format, order)
+        raise RuntimeError(f"layer {plane.zpos} does not support pixel format: {pixel_format}")
+
+    def _wait_for_flip(self):
+        if self.chain.queued:
+            self.device.wait(lambda: not self.chain.queued)
 
     def __enter__(self):
         return self
@@ -158,8 +535,9 @@ class DummyWindow(object):
     Because if display is not found, we want it to keep running without error.
     """
 
-    def __init__(self, _device, _dst, _size, _layer):
-        pass
+    def __init__(self, _device, _dst, size, _layer, _num_buffers=2, pixel_format="RGB"):
+        self.size = size
+        self.pixel_format = pixel_format
 
     def clear(self, _rgb=(0, 0, 0)):
         pass
@@ -170,12 +548,48 @@ class DummyWindow(object):
     def swap_layer(self, _window):
         pass
 
-    def blit(self, _image):
+    def set_source_rect(self, _rect):
+        pass
+
+    def set_alpha(self, _alpha):
         pass
 
+    def set_dest_rect(self, _rect):
+        pass
+
+    def blit(self, _image, _stride=None):
+        pass
+
+    def blit_region(self, _image, _rect, _stride=None):
+        pass
+
+    def view(self):
+        if self.pixel_format in YUV_FORMATS:
+            return memoryview(bytearray(self.size[0] * self.size[1] * 3 // 2))
+        return memoryview(bytearray(self.pitch() * self.size[1]))
+
+    def array(self):
+        import numpy as np  # type: ignore  # reason: numpy is optional
+
+        if self.pixel_format in YUV_FORMATS:
+            raise RuntimeError(f"array() is not supported for {self.pixel_format}")
+        return np.zeros((self.size[1], self.size[0], PIXEL_FORMATS[self.pixel_format][1] // 8), dtype=np.uint8)
+
+    def pitch(self):
+        if self.pixel_format in YUV_FORMATS:
+            return self.size[0]
+        return self.size[0] * PIXEL_FORMATS[self.pixel_format][1] // 8
+
     def update(self):
         pass
 
+    def present(self, fb, release=None):
+        if release is not None:
+            release(fb)
+
+    def stats(self):
+        return WindowStats().snapshot()
+
     def close(self):
         pass
 
@@ -3,8 +3,13 @@
 
 import mmap
 import os
+import select
+import threading
+import time
+from contextlib import contextmanager
 from ctypes import *
 from ctypes.util import find_library
+from functools import lru_cache
 from typing import List
 
 """
@@ -24,21 +29,69 @@ DRM_MODE_OBJECT_BLOB = 0xBBBBBBBB
 DRM_MODE_OBJECT_PLANE = 0xEEEEEEEE
 DRM_MODE_OBJECT_ANY = 0
 
+DRM_FORMAT_RGB565 = 0x36314752
 DRM_FORMAT_RGB888 = 0x34324752
 DRM_FORMAT_BGR888 = 0x34324742
 DRM_FORMAT_RGBA8888 = 0x34324152
 DRM_FORMAT_BGRA8888 = 0x34324142
 DRM_FORMAT_ARGB8888 = 0x34325241
 DRM_FORMAT_ABGR8888 = 0x34324241
+DRM_FORMAT_XRGB8888 = 0x34325258
+DRM_FORMAT_XBGR8888 = 0x34324258
+DRM_FORMAT_NV12 = 0x3231564E
+DRM_FORMAT_NV21 = 0x3132564E
+DRM_FORMAT_YUV420 = 0x32315559
+DRM_FORMAT_YVU420 = 0x32315659
+
+# Byte order of pixels in memory -> (DRM format, bpp)
+PIXEL_FORMATS = {
+    "RGB": (DRM_FORMAT_BGR888, 24),
+    "BGR": (DRM_FORMAT_RGB888, 24),
+    "RGBX": (DRM_FORMAT_XBGR8888, 32),
+    "BGRX": (DRM_FORMAT_XRGB8888, 32),
+    "RGBA": (DRM_FORMAT_ABGR8888, 32),
+    "BGRA": (DRM_FORMAT_ARGB8888, 32),
+    "RGB565": (DRM_FORMAT_RGB565, 16),
+    "NV12": (DRM_FORMAT_NV12, 12),
+    "YUV420": (DRM_FORMAT_YUV420, 12),
+}
+YUV_FORMATS = ("NV12", "YUV420")
+
+DRM_PLANE_TYPE_OVERLAY = 0
+DRM_PLANE_TYPE_PRIMARY = 1
+DRM_PLANE_TYPE_CURSOR = 2
 
 DRM_PROP_NAME_LEN = 32
+
+DRM_MODE_PROP_PENDING = 1 << 0
+DRM_MODE_PROP_RANGE = 1 << 1
+DRM_MODE_PROP_IMMUTABLE = 1 << 2
+DRM_MODE_PROP_ENUM = 1 << 3
+DRM_MODE_PROP_BLOB = 1 << 4
+DRM_MODE_PROP_BITMASK = 1 << 5
+DRM_MODE_PROP_EXTENDED_TYPE = 0x0000FFC0
+DRM_MODE_PROP_OBJECT = 1 << 6
+DRM_MODE_PROP_SIGNED_RANGE = 2 << 6
+DRM_MODE_PROP_ATOMIC = 0x80000000
 DRM_DISPLAY_MODE_LEN = 32
 
 DRM_CAP_DUMB_BUFFER = 0x1
 
+DRM_CLIENT_CAP_UNIVERSAL_PLANES = 2
+DRM_CLIENT_CAP_ATOMIC = 3
+
+DRM_MODE_PAGE_FLIP_EVENT = 0x01
+DRM_MODE_PAGE_FLIP_ASYNC = 0x02
+DRM_MODE_ATOMIC_TEST_ONLY = 0x0100
+DRM_MODE_ATOMIC_NONBLOCK = 0x0200
+DRM_MODE_ATOMIC_ALLOW_MODESET = 0x0400
+
+DRM_EVENT_CONTEXT_VERSION = 2
+
 DRM_IOCTL_MODE_CREATE_DUMB = 0xC02064B2
 DRM_IOCTL_MODE_MAP_DUMB = 0xC01064B3
 DRM_IOCTL_MODE_DESTROY_DUMB = 0xC00464B4
+DRM_IOCTL_GEM_CLOSE = 0x40086409
 
 DRM_MODE_CONNECTED = 1
 DRM_MODE_DISCONNECTED = 2
@@ -109,6 +162,22 @@ class DRMModeProperty(Structure):
     ]
 
 
+class DRMModePropertyBlob(Structure):
+    """
+    typedef struct _drmModePropertyBlob {
+        uint32_t id;
+        uint32_t length;
+        void *data;
+    } drmModePropertyBlobRes, *drmModePropertyBlobPtr;
+    """
+
+    _fields_ = [
+        ("id", c_uint32),
+        ("length", c_uint32),
+        ("data", c_void_p),
+    ]
+
+
 class DRMModeObjectProperties(Structure):
     """
     typedef struct _drmModeObjectProperties {
@@ -315,6 +384,25 @@ class DRMModePlane(Structure):
     ]
 
 
+_DRMPageFlipHandler = CFUNCTYPE(None, c_int, c_uint, c_uint, c_uint, c_void_p)
+
+
+class DRMEventContext(Structure):
+    """
+    typedef struct _drmEventContext {
+        int version;
+        void (*vblank_handler)(int fd, unsigned int sequence, unsigned int tv_sec, unsigned int tv_usec, void *user_data);
+        void (*page_flip_handler)(int fd, unsigned int sequence, unsigned int tv_sec, unsigned int tv_usec, void *user_data);
+    } drmEventContext, *drmEventContextPtr;
+    """
+
+    _fields_ = [
+        ("version", c_int),
+        ("vblank_handler", _DRMPageFlipHandler),
+        ("page_flip_handler", _DRMPageFlipHandler),
+    ]
+
+
 class _DRMModeCreateDumb(Structure):
     """
     struct drm_mode_create_dumb {
@@ -368,10 +456,27 @@ class _DRMModeDestroyDumb(Structure):
     _fields_ = [("handle", c_uint32)]
 
 
+class _DRMGemClose(Structure):
+    """
+    struct drm_gem_close {
+        __u32 handle;
+        __u32 pad;
+    };
+    """
+
+    _fields_ = [("handle", c_uint32), ("pad", c_uint32)]
+
+
+@lru_cache(maxsize=None)
+def _find_library(name):
+    # find_library spawns ldconfig or gcc, so do not repeat it
+    return find_library(name)
+
+
 class _libdrm(object):
     def __init__(self):
         self.lib = None
-        path = find_library("drm")
+        path = _find_library("drm")
         if path is not None:
             self.lib = CDLL(path, use_errno=True)
 
@@ -385,6 +490,10 @@ class _libdrm(object):
 
         self.lib.drmGetCap.argtypes = [c_int, c_uint64, POINTER(c_uint64)]
         self.lib.drmGetCap.restype = c_int
+        self.lib.drmSetClientCap.argtypes = [c_int, c_uint64, c_uint64]
+        self.lib.drmSetClientCap.restype = c_int
+        self.lib.drmHandleEvent.argtypes = [c_int, POINTER(DRMEventContext)]
+        self.lib.drmHandleEvent.restype = c_int
 
         self.lib.drmModeGetResources.argtypes = [c_int]
         self.lib.drmModeGetResources.restype = POINTER(DRMModeResource)
@@ -458,11 +567,19 @@ class _libdrm(object):
         self.lib.drmModeRmFB.argtypes = [c_int, c_uint32]
         self.lib.drmModeRmFB.restype = c_int
 
+        self.lib.drmPrimeFDToHandle.argtypes = [c_int, c_int, POINTER(c_uint32)]
+        self.lib.drmPrimeFDToHandle.restype = c_int
+
         self.lib.drmModeGetProperty.argtypes = [c_int, c_uint32]
         self.lib.drmModeGetProperty.restype = POINTER(DRMModeProperty)
         self.lib.drmModeFreeProperty.argtypes = [POINTER(DRMModeProperty)]
         self.lib.drmModeFreeProperty.restype = None
 
+        self.lib.drmModeGetPropertyBlob.argtypes = [c_int, c_uint32]
+        self.lib.drmModeGetPropertyBlob.restype = POINTER(DRMModePropertyBlob)
+        self.lib.drmModeFreePropertyBlob.argtypes = [POINTER(DRMModePropertyBlob)]
+        self.lib.drmModeFreePropertyBlob.restype = None
+
         self.lib.drmModeObjectGetProperties.argtypes = [c_int, c_uint32, c_uint32]
         self.lib.drmModeObjectGetProperties.restype = POINTER(DRMModeObjectProperties)
         self.lib.drmModeFreeObjectProperties.argtypes = [POINTER(DRMModeObjectProperties)]
@@ -476,6 +593,15 @@ class _libdrm(object):
         ]
         self.lib.drmModeObjectSetProperty.restype = c_int
 
+        self.lib.drmModeAtomicAlloc.argtypes = []
+        self.lib.drmModeAtomicAlloc.restype = c_void_p
+        self.lib.drmModeAtomicFree.argtypes = [c_void_p]
+        self.lib.drmModeAtomicFree.restype = None
+        self.lib.drmModeAtomicAddProperty.argtypes = [c_void_p, c_uint32, c_uint32, c_uint64]
+        self.lib.drmModeAtomicAddProperty.restype = c_int
+        self.lib.drmModeAtomicCommit.argtypes = [c_int, c_void_p, c_uint32, c_void_p]
+        self.lib.drmModeAtomicCommit.restype = c_int
+
         self.lib.drmIoctl.argtypes = [c_int, c_ulong, c_voidp]
         self.lib.drmIoctl.restype = c_int
 
@@ -490,6 +616,12 @@ class _libdrm(object):
         res = self.lib.drmGetCap(fd, DRM_CAP_DUMB_BUFFER, byref(cap))
         return not (res < 0 or cap == 0)
 
+    def set_client_cap(self, *args, **kwargs):
+        return self.lib.drmSetClientCap(*args, **kwargs)
+
+    def handle_event(self, *args, **kwargs):
+        return self.lib.drmHandleEvent(*args, **kwargs)
+
     def get_resources(self, *args, **kwargs):
         return self.lib.drmModeGetResources(*args, **kwargs).contents
 
@@ -538,12 +670,24 @@ class _libdrm(object):
     def rm_fb(self, *args, **kwargs):
         return self.lib.drmModeRmFB(*args, **kwargs)
 
+    def prime_fd_to_handle(self, *args, **kwargs):
+        return self.lib.drmPrimeFDToHandle(*args, **kwargs)
+
     def get_property(self, *args, **kwargs):
         return self.lib.drmModeGetProperty(*args, **kwargs).contents
 
     def free_property(self, *args, **kwargs):
         return self.lib.drmModeFreeProperty(*args, **kwargs)
 
+    def get_property_blob(self, *args, **kwargs):
+        blob = self.lib.drmModeGetPropertyBlob(*args, **kwargs)
+        if not blob:
+            return None
+        return blob.contents
+
+    def free_property_blob(self, *args, **kwargs):
+        return self.lib.drmModeFreePropertyBlob(*args, **kwargs)
+
     def get_object_properties(self, *args, **kwargs):
         return self.lib.drmModeObjectGetProperties(*args, **kwargs).contents
 
@@ -553,63 +697,86 @@ class _libdrm(object):
     def set_object_property(self, *args, **kwargs):
         return self.lib.drmModeObjectSetProperty(*args, **kwargs)
 
+    def atomic_alloc(self, *args, **kwargs):
+        return self.lib.drmModeAtomicAlloc(*args, **kwargs)
+
+    def atomic_free(self, *args, **kwargs):
+        return self.lib.drmModeAtomicFree(*args, **kwargs)
+
+    def atomic_add_property(self, *args, **kwargs):
+        return self.lib.drmModeAtomicAddProperty(*args, **kwargs)
+
+    def atomic_commit(self, *args, **kwargs):
+        return self.lib.drmModeAtomicCommit(*args, **kwargs)
+
     def ioctl(self, *args, **kwargs):
         return self.lib.drmIoctl(*args, **kwargs)
 
 
-_drm = _libdrm()
+# Bound at the first Device by _load_libdrm() not to find and bind libdrm on import
+_drm = None
+_drm_lock = threading.Lock()
+
+
+def _load_libdrm():
+    global _drm
+    with _drm_lock:
+        if _drm is None:
+            _drm = _libdrm()
+    return _drm
 
 
 class Framebuffer(object):
-    def __init__(self, fd, width, height, bpp=24):
+    """
+    Dumb framebuffer mapped into the process.
+
+    Rows of the framebuffer are ``pitch`` bytes apart, which may be larger than ``width * bpp // 8``.
+    YUV framebuffers hold all planes in one buffer object; ``layout`` lists (offset, pitch, bytes per row, rows)
+    of each plane.
+    """
+
+    def __init__(self, fd, width, height, bpp=24, pixel_format=None):
         self.fd = fd
 
+        if pixel_format is None:
+            if bpp == 24:
+                pixel_format = "RGB"
+            elif bpp == 32:
+                pixel_format = "BGRA"
+            elif bpp == 16:
+                pixel_format = "RGB565"
+            else:
+                raise RuntimeError(f"not support bpp: {bpp}")
+        if pixel_format not in PIXEL_FORMATS:
+            raise RuntimeError(f"not support pixel format: {pixel_format}")
+        drm_format, bpp = PIXEL_FORMATS[pixel_format]
+
         creq = _DRMModeCreateDumb()
         creq.width = width
         creq.height = height
         creq.bpp = bpp
         creq.flags = 0
+        if pixel_format in YUV_FORMATS:
+            if width % 2 != 0 or height % 2 != 0:
+                raise RuntimeError(f"width and height must be even for {pixel_format}")
+            # Allocate luma and chroma planes in one buffer of 8bpp rows
+            creq.height = height * 3 // 2
+            creq.bpp = 8
 
         res = _drm.ioctl(self.fd, DRM_IOCTL_MODE_CREATE_DUMB, byref(creq))
         if res != 0:
             raise RuntimeError("fail to create dumb")
 
-        fb = c_uint32()
-        if creq.bpp == 24:
-            pixel_format = DRM_FORMAT_BGR888
-        else:
-            raise RuntimeError(f"not support bpp: {creq.bpp}")
-
-        bo_handles = (c_uint32 * 4)()
-        bo_handles[0] = creq.handle
-        bo_handles[1] = 0
-        bo_handles[2] = 0
-        bo_handles[3] = 0
-        pitches = (c_uint32 * 4)()
-        pitches[0] = creq.pitch
-        pitches[1] = 0
-        pitches[2] = 0
-        pitches[3] = 0
-        offsets = (c_uint32 * 4)()
-        offsets[0] = 0
-        offsets[1] = 0
-        offsets[2] = 0
-        offsets[3] = 0
-        res = _drm.add_fb(
-            self.fd,
-            creq.width,
-            creq.height,
-            pixel_format,
-            bo_handles,
-            pitches,
-            offsets,
-            byref(fb),
-            creq.flags,
-        )
-        if res != 0:
-            raise RuntimeError("fail to add framebuffer")
-        self.fb_id = fb
         self.handle = creq.handle
+        self.width = width
+        self.height = height
+        self.bpp = bpp
+        self.pixel_format = pixel_format
+        self.pitch = creq.pitch
+        self.size = creq.size
+        self.layout = self._layout(self.pitch)
+
+        self.fb_id = self._add_fb(drm_format)
 
         mreq = _DRMModeMapDumb()
         mreq.handle = creq.handle
@@ -625,9 +792,15 @@ class Framebuffer(object):
             offset=mreq.offset,
         )
 
-        self.write(bytearray(creq.size))
+        self._view = memoryview(self.buffer)
+        self._view[:] = bytes(creq.size)
+        if pixel_format in YUV_FORMATS:
+            # Black is Y=0 with neutral chroma
+            chroma = self.layout[1][0]
+            self._view[chroma:] = b"\x80" * (creq.size - chroma)
 
     def close(self):
+        self._view.release()
         self.buffer.close()
 
         res = _drm.rm_fb(self.fd, self.fb_id)
@@ -640,14 +813,267 @@ class Framebuffer(object):
         if res != 0:
             raise RuntimeError("fail to destroy dumb")
 
-    def write(self, bs):
-        pos = self.buffer.tell()
-        self.buffer.write(bs)
-        self.buffer.seek(pos)
+    def view(self):
+        """
+        Get a writable view of the mapped framebuffer.
+
+        The view must be released before the framebuffer is closed.
+
+        Returns:
+            memoryview: bytes of the framebuffer. Planes are placed as described in ``layout``.
+        """
+        return memoryview(self.buffer)
+
+    def array(self):
+        """
+        Get the mapped framebuffer as a writable NumPy array.
+
+        The array must be deleted before the framebuffer is closed.
+        Not available for YUV formats; use :meth:`view` and ``layout`` for them.
+
+        Returns:
+            numpy.ndarray: uint8 array of shape (height, width, bpp // 8) with row stride ``pitch``
+        """
+        if self.pixel_format in YUV_FORMATS:
+            raise RuntimeError(f"array() is not supported for {self.pixel_format}")
+
+        import numpy as np  # type: ignore  # reason: numpy is optional
+
+        cpp = self.bpp // 8
+        return np.ndarray(
+            (self.height, self.width, cpp),
+            dtype=np.uint8,
+            buffer=self.buffer,
+            strides=(self.pitch, cpp, 1),
+        )
+
+    def write(self, bs, stride=None):
+        """
+        Copy an image into the framebuffer.
+
+        YUV images are given as planes stored one after another, e.g. I420 for "YUV420".
+
+        Args:
+            bs (bytes-like): image data. Any object supporting the buffer protocol is accepted.
+            stride (int): bytes between rows of the first plane of ``bs``.
+                By default, ``pitch`` if ``bs`` has the same size as the framebuffer planes, otherwise packed rows.
+        """
+        src = memoryview(bs).cast("B")
+        if stride is None:
+            offset, pitch, _, rows = self.layout[-1]
+            packed = self.width if self.pixel_format in YUV_FORMATS else self.width * self.bpp // 8
+            stride = self.pitch if len(src) == offset + pitch * rows else packed
+        src_layout = self._layout(stride)
+        # The last row of the last plane may be packed
+        offset, pitch, row, rows = src_layout[-1]
+        size = offset + pitch * (rows - 1) + row
+        if len(src) < size:
+            raise RuntimeError(f"image is too small: {len(src)} < {size}")
+        if stride == self.pitch:
+            size = min(len(src), self.size)
+            self._view[:size] = src[:size]
+            return
+        for (offset, pitch, row, rows), (src_offset, src_pitch, _, _) in zip(self.layout, src_layout):
+            for y in range(rows):
+                start = src_offset + y * src_pitch
+                self._view[offset + y * pitch : offset + y * pitch + row] = src[start : start + row]
+
+    def _add_fb(self, drm_format):
+        fb = c_uint32()
+        bo_handles = (c_uint32 * 4)()
+        pitches = (c_uint32 * 4)()
+        offsets = (c_uint32 * 4)()
+        for i, (offset, pitch, _, _) in enumerate(self.layout):
+            bo_handles[i] = self.handle
+            pitches[i] = pitch
+            offsets[i] = offset
+        res = _drm.add_fb(
+            self.fd,
+            self.width,
+            self.height,
+            drm_format,
+            bo_handles,
+            pitches,
+            offsets,
+            byref(fb),
+            0,
+        )
+        if res != 0:
+            raise RuntimeError("fail to add framebuffer")
+        return fb.value
+
+    def _layout(self, pitch):
+        """
+        (offset, pitch, bytes per row, rows) of each plane for the given pitch of the first plane.
+        """
+        w, h = self.width, self.height
+        if self.pixel_format == "NV12":
+            return [(0, pitch, w, h), (pitch * h, pitch, w, h // 2)]
+        if self.pixel_format == "YUV420":
+            chroma = pitch * h
+            return [
+                (0, pitch, w, h),
+                (chroma, pitch // 2, w // 2, h // 2),
+                (chroma + pitch // 2 * h // 2, pitch // 2, w // 2, h // 2),
+            ]
+        return [(0, pitch, w * self.bpp // 8, h)]
+
+
+class PrimeFramebuffer(Framebuffer):
+    """
+    Framebuffer imported from a DMA-BUF file descriptor, e.g. a V4L2 buffer exported by VIDIOC_EXPBUF.
+
+    The buffer is scanned out without copy and is not mapped into the process.
+    The DMA-BUF fd stays owned by the caller. Import each buffer once: the same buffer gets the same GEM handle.
+    """
+
+    def __init__(self, fd, dmabuf_fd, width, height, pixel_format, pitch):
+        self.fd = fd
+
+        if pixel_format not in PIXEL_FORMATS:
+            raise RuntimeError(f"not support pixel format: {pixel_format}")
+        drm_format, bpp = PIXEL_FORMATS[pixel_format]
+
+        handle = c_uint32()
+        res = _drm.prime_fd_to_handle(self.fd, dmabuf_fd, byref(handle))
+        if res != 0:
+            errno = get_errno()
+            raise RuntimeError(f"fail to import dma-buf: {res} {errno} {os.strerror(errno)}")
+
+        self.handle = handle.value
+        self.width = width
+        self.height = height
+        self.bpp = bpp
+        self.pixel_format = pixel_format
+        self.pitch = pitch
+        self.layout = self._layout(self.pitch)
+        offset, plane_pitch, _, rows = self.layout[-1]
+        self.size = offset + plane_pitch * rows
+        self.buffer = None
+        try:
+            self.fb_id = self._add_fb(drm_format)
+        except RuntimeError:
+            self._close_handle()
+            raise
+
+    def close(self):
+        res = _drm.rm_fb(self.fd, self.fb_id)
+        if res != 0:
+            raise RuntimeError("fail to remove framebuffer")
+        self._close_handle()
+
+    def view(self):
+        raise RuntimeError("imported framebuffer is not mapped")
+
+    def array(self):
+        raise RuntimeError("imported framebuffer is not mapped")
+
+    def write(self, bs, stride=None):
+        raise RuntimeError("imported framebuffer is not mapped")
+
+    def _close_handle(self):
+        req = _DRMGemClose()
+        req.handle = self.handle
+        res = _drm.ioctl(self.fd, DRM_IOCTL_GEM_CLOSE, byref(req))
+        if res != 0:
+            raise RuntimeError("fail to close gem handle")
+
+
+class Property(object):
+    """
+    DRM property metadata.
+
+    Attributes:
+        prop_id (int): property id
+        name (str): property name
+        flags (int): ``DRM_MODE_PROP_*`` flags
+        enums (dict): enum or bitmask names to values
+        range ((int, int)): (min, max) of range properties, or None
+    """
+
+    def __init__(self, prop):
+        self.prop_id = prop.prop_id
+        self.name = prop.name.decode()
+        self.flags = prop.flags
+        self.enums = {prop.enums[i].name.decode(): prop.enums[i].value for i in range(prop.count_enums)}
+        self.range = None
+        if self.flags & (DRM_MODE_PROP_RANGE | DRM_MODE_PROP_SIGNED_RANGE) and prop.count_values == 2:
+            self.range = (prop.values[0], prop.values[1])
+
+    @property
+    def immutable(self):
+        return bool(self.flags & DRM_MODE_PROP_IMMUTABLE)
+
+    def value_of(self, value):
+        """
+        Resolve an enum name to its value.
+
+        Args:
+            value (int or str): value, or enum name
+
+        Returns:
+            int: value
+        """
+        if isinstance(value, str):
+            if value not in self.enums:
+                raise RuntimeError(f"{self.name} does not support {value}")
+            return self.enums[value]
+        return value
+
+
+class PropertyIndex(object):
+    """
+    Cache of DRM property metadata of a device.
+
+    Metadata is fetched once per property id. Only current values are read from the objects.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+        self._properties = {}
+
+    def get(self, prop_id):
+        """
+        Get property metadata.
+
+        Args:
+            prop_id (int): property id
+
+        Returns:
+            :class:`Property`: property
+        """
+        prop = self._properties.get(prop_id)
+        if prop is None:
+            raw = _drm.get_property(self.fd, prop_id)
+            prop = Property(raw)
+            _drm.free_property(byref(raw))
+            self._properties[prop_id] = prop
+        return prop
+
+    def object_properties(self, object_id, object_type):
+        """
+        Get properties of a DRM object.
+
+        Args:
+            object_id (int): object id
+            object_type (int): ``DRM_MODE_OBJECT_*``
+
+        Returns:
+            (dict, dict): property names to :class:`Property` and property names to current values
+        """
+        properties = {}
+        values = {}
+        props = _drm.get_object_properties(self.fd, object_id, object_type)
+        for i in range(props.count_props):
+            prop = self.get(props.props[i])
+            properties[prop.name] = prop
+            values[prop.name] = props.prop_values[i]
+        _drm.free_object_properties(byref(props))
+        return (properties, values)
 
 
 class Plane(object):
-    def __init__(self, fd, drm_plane):
+    def __init__(self, fd, drm_plane, property_index=None):
         self.fd = fd
         self.plane_id = drm_plane.plane_id
         self.crtc_id = drm_plane.crtc_id
@@ -656,8 +1082,18 @@ class Plane(object):
         self.crtc_y = drm_plane.crtc_y
         self.x = drm_plane.x
         self.y = drm_plane.y
+        self.formats = [drm_plane.formats[i] for i in range(drm_plane.count_formats)]
+        self.possible_crtcs = drm_plane.possible_crtcs
 
-        self.zpos = self._get_zpos()
+        self.properties, values = (property_index or PropertyIndex(fd)).object_properties(self.plane_id, DRM_MODE_OBJECT_PLANE)
+        if "zpos" not in values:
+            raise RuntimeError("zpos not found")
+        self.zpos = values["zpos"]
+        self.type = values.get("type", DRM_PLANE_TYPE_OVERLAY)
+        self.prop_ids = {name: prop.prop_id for name, prop in self.properties.items()}
+        # Plane alpha from 0 to 0xFFFF, sent with the next update
+        self.alpha = 0xFFFF
+        self._applied_alpha = None
 
     def set(self, crtc_id, fb_id, dst, src):
         x, y, w, h = dst
@@ -682,6 +1118,104 @@ class Plane(object):
             errno = get_errno()
             err = os.strerror(errno)
             raise RuntimeError(f"fail to set plane: {res} {errno} {err}")
+        if self.alpha != self._applied_alpha and "alpha" in self.properties:
+            self.set_property("alpha", self.alpha)
+            self._applied_alpha = self.alpha
+
+    @property
+    def can_scale(self):
+        # Cursor planes are not scaled by vc4
+        return self.type != DRM_PLANE_TYPE_CURSOR
+
+    @property
+    def movable(self):
+        """True if the zpos can be changed"""
+        prop = self.properties["zpos"]
+        return not prop.immutable and prop.range is not None
+
+    def can_move(self, zpos):
+        """
+        Returns:
+            bool: True if the plane can move to the layer ``zpos``
+        """
+        if zpos == self.zpos:
+            return True
+        if not self.movable:
+            return False
+        low, high = self.properties["zpos"].range
+        return low <= zpos <= high
+
+    def format_cost(self, pixel_format):
+        """
+        Cost to show images in the pixel format.
+
+        Returns:
+            int: 0 if the plane supports the format, 1 if channels have to be reordered while blitting,
+            or None if it is not supported
+        """
+        drm_format, bpp = PIXEL_FORMATS[pixel_format]
+        if drm_format in self.formats:
+            return 0
+        if pixel_format in YUV_FORMATS:
+            return None
+        if any(fb_bpp == bpp and fb_drm_format in self.formats for fb_drm_format, fb_bpp in PIXEL_FORMATS.values()):
+            return 1
+        return None
+
+    def set_zpos(self, zpos):
+        """
+        Move the plane to another layer.
+
+        Args:
+            zpos (int): new zpos in the range of the zpos property
+        """
+        if zpos == self.zpos:
+            return
+        if not self.can_move(zpos):
+            raise RuntimeError(f"plane {self.plane_id} can not move to layer {zpos}")
+        self.set_property("zpos", zpos)
+        self.zpos = zpos
+
+    def set_property(self, name, value):
+        """
+        Set a plane property immediately.
+
+        Args:
+            name (str): property name
+            value (int or str): value, or enum name
+        """
+        prop = self.properties.get(name)
+        if prop is None:
+            raise RuntimeError(f"plane {self.plane_id} has no property {name}")
+        res = _drm.set_object_property(self.fd, self.plane_id, DRM_MODE_OBJECT_PLANE, prop.prop_id, prop.value_of(value))
+        if res < 0:
+            raise RuntimeError(f"fail to set {name}")
+
+    def add_to_request(self, req, crtc_id, fb_id, dst, src):
+        """
+        Add plane properties to an atomic request.
+        """
+        x, y, w, h = dst
+        x0, y0, w0, h0 = src
+        values = [
+            ("FB_ID", fb_id),
+            ("CRTC_ID", crtc_id),
+            ("CRTC_X", x),
+            ("CRTC_Y", y),
+            ("CRTC_W", w),
+            ("CRTC_H", h),
+            ("SRC_X", x0 << 16),
+            ("SRC_Y", y0 << 16),
+            ("SRC_W", w0 << 16),
+            ("SRC_H", h0 << 16),
+        ]
+        if "alpha" in self.properties:
+            values.append(("alpha", self.alpha))
+        for name, value in values:
+            # CRTC_X and CRTC_Y are signed
+            res = _drm.atomic_add_property(req, self.plane_id, self.prop_ids[name], value & 0xFFFFFFFFFFFFFFFF)
+            if res < 0:
+                raise RuntimeError(f"fail to add property {name} to atomic request: {res}")
 
     def __str__(self):
         res = f"""Plane {self.plane_id}:
@@ -692,42 +1226,121 @@ class Plane(object):
     zpos = {self.zpos}"""
         return res
 
-    def _get_zpos(self):
-        zpos = None
-        props = _drm.get_object_properties(self.fd, self.plane_id, DRM_MODE_OBJECT_PLANE)
-        for i in range(props.count_props):
-            prop_id = props.props[i]
-            prop = _drm.get_property(self.fd, prop_id)
-            if prop.name == b"zpos":
-                zpos = props.prop_values[i]
-            _drm.free_property(byref(prop))
-        _drm.free_object_properties(byref(props))
-        if zpos is None:
-            raise RuntimeError("zpos not found")
-        else:
-            return zpos
+    def _set_blend_mode(self, mode):
+        prop = self.properties.get("pixel blend mode")
+        if prop is not None and mode in prop.enums:
+            self.set_property(prop.name, mode)
 
     def _set_color_space(self):
-        props = _drm.get_object_properties(self.fd, self.plane_id, DRM_MODE_OBJECT_PLANE)
-        for i in range(props.count_props):
-            prop_id = props.props[i]
-            prop = _drm.get_property(self.fd, prop_id)
-            if prop.name == b"COLOR_ENCODING":
-                # Use ITU-R BT.601 YCbCr
-                ret = _drm.set_object_property(self.fd, self.plane_id, DRM_MODE_OBJECT_PLANE, prop_id, 0)
-                if ret < 0:
-                    raise RuntimeError("fail to set color_encoding")
-            elif prop.name == b"COLOR_RANGE":
-                # Use YCbCr full range
-                ret = _drm.set_object_property(self.fd, self.plane_id, DRM_MODE_OBJECT_PLANE, prop_id, 1)
-                if ret < 0:
-                    raise RuntimeError("fail to set color_range")
-            _drm.free_property(byref(prop))
-        _drm.free_object_properties(byref(props))
+        # Use ITU-R BT.601 YCbCr in full range
+        if "COLOR_ENCODING" in self.properties:
+            self.set_property("COLOR_ENCODING", "ITU-R BT.601 YCbCr")
+        if "COLOR_RANGE" in self.properties:
+            self.set_property("COLOR_RANGE", "YCbCr full range")
+
+
+class PlaneAllocator(object):
+    """
+    Allocator of planes for windows.
+
+    Free planes are kept in lists per capability, i.e. supported formats, CRTCs and scaling.
+    A plane is picked by the cost to show the window on it in this order:
+
+    1. reordering channels on every blit if the plane does not support the pixel format
+    2. changing the zpos property if no suitable plane is at the layer
+    3. taking a plane with more capabilities than needed, which may be needed by later windows
+    """
+
+    def __init__(self, planes, crtc_index=0):
+        """
+
+        Args:
+            planes (list of :class:`Plane`): planes of the device
+            crtc_index (int): index of the CRTC to show windows on
+        """
+        self._free = {}
+        self._used = {}
+        for plane in planes:
+            if plane.crtc_id != 0 or not plane.possible_crtcs & (1 << crtc_index):
+                # Used by another client or not connected to the CRTC
+                continue
+            key = (tuple(sorted(plane.formats)), plane.can_scale)
+            self._free.setdefault(key, {})[plane.plane_id] = plane
+
+    def pick(self, layer, pixel_format="RGB", scaling=False):
+        """
+        Take a plane.
+
+        Args:
+            layer (int): zpos of the plane
+            pixel_format (str): pixel format of the window (see :data:`PIXEL_FORMATS`)
+            scaling (bool): True if the window is scaled
+
+        Returns:
+            :class:`Plane`: plane at ``layer``
+        """
+        if pixel_format not in PIXEL_FORMATS:
+            raise RuntimeError(f"not support pixel format: {pixel_format}")
+        used_zposs = {p.zpos for p in self._used.values()}
+        if layer in used_zposs:
+            raise RuntimeError(f"layer {layer} is already used")
+        best = None
+        for (formats, can_scale), free in self._free.items():
+            if not free or (scaling and not can_scale):
+                continue
+            format_cost = next(iter(free.values())).format_cost(pixel_format)
+            if format_cost is None:
+                continue
+            richness = len(formats) + int(can_scale and not scaling)
+            for plane in free.values():
+                if plane.zpos == layer:
+                    cost = (format_cost, 0, richness)
+                elif plane.can_move(layer):
+                    cost = (format_cost, 1, richness)
+                else:
+                    continue
+                if best is None or cost < best[0]:
+                    best = (cost, plane)
+        if best is None:
+            raise RuntimeError(f"no plane for {pixel_format} window at layer {layer}: layer value must be in {self.zposs()}")
+        plane = best[1]
+        plane.set_zpos(layer)
+        del self._free[(tuple(sorted(plane.formats)), plane.can_scale)][plane.plane_id]
+        self._used[plane.plane_id] = plane
+        return plane
+
+    def free(self, plane):
+        """
+        Return a plane taken by :meth:`pick`.
+
+        Args:
+            plane (:class:`Plane`): plane
+        """
+        if self._used.pop(plane.plane_id, None) is not None:
+            self._free[(tuple(sorted(plane.formats)), plane.can_scale)][plane.plane_id] = plane
+
+    def zposs(self):
+        """
+        Returns:
+            list of int: zpos of free planes
+        """
+        return sorted(p.zpos for free in self._free.values() for p in free.values())
 
 
 class Device(object):
-    def __init__(self):
+    """
+    DRM device.
+
+    When the driver supports atomic modesetting and ``page_flip`` is True, plane updates are queued
+    as non-blocking atomic commits and completed by page flip events read from the device fd.
+    Updates of several planes issued inside :meth:`batch` are applied by one atomic commit.
+    Otherwise planes are updated by synchronous ``drmModeSetPlane``.
+    """
+
+    FLIP_TIMEOUT = 1.0
+
+    def __init__(self, page_flip=True):
+        _load_libdrm()
         self.fd = _drm.open(b"vc4", None)
         if self.fd < 0:
             raise RuntimeError("fail to open drm device")
@@ -737,32 +1350,222 @@ class Device(object):
         resources = _drm.get_resources(self.fd)
         self.connector = self._find_connector(resources)
         self.crtc = self._find_crtc(self.connector)
+        crtc_ids = [resources._crtcs[i] for i in range(resources.count_crtcs)]
+        crtc_index = crtc_ids.index(self.crtc.crtc_id) if self.crtc.crtc_id in crtc_ids else 0
         self.width = self.crtc.mode.hdisplay
         self.height = self.crtc.mode.vdisplay
         _drm.free_resouces(byref(resources))
 
+        # Enable atomic before collecting planes: the properties which atomic commits set (FB_ID, CRTC_ID, ...)
+        # are reported only to atomic clients.
+        self.page_flip = page_flip and _drm.set_client_cap(self.fd, DRM_CLIENT_CAP_ATOMIC, 1) == 0
+        self.properties = PropertyIndex(self.fd)
         self.planes = self._collect_planes()
+        self.allocator = PlaneAllocator(self.planes, crtc_index)
+        self._cond = threading.Condition()
+        self._reading = False
+        self._batching = 0
+        self._flipped = False
+        self._inflight = None
+        self._queued = {}
+        # CLOCK_MONOTONIC time of the vblank of the last page flip, the same clock as time.monotonic()
+        self.flip_time = None
+        # time.monotonic() when the last page flip was committed, which is later than queue_flip() if it was deferred
+        self.commit_time = None
+        self._event_context = DRMEventContext()
+        self._event_context.version = DRM_EVENT_CONTEXT_VERSION
+        self._event_context.vblank_handler = _DRMPageFlipHandler()
+        self._event_context.page_flip_handler = _DRMPageFlipHandler(self._on_page_flip)
 
     def close(self):
+        if self.page_flip:
+            self.wait(lambda: self._inflight is None and not self._queued)
         _drm.free_crtc(byref(self.crtc))
         _drm.free_connector(byref(self.connector))
         _drm.close(self.fd)
 
-    def pick_plane(self, layer):
-        zposs = sorted([p.zpos for p in self.planes if p.crtc_id == 0])
-        if layer in zposs:
-            plane = [p for p in self.planes if p.zpos == layer][0]
-            self.planes.remove(plane)
-            return plane
-        else:
-            raise RuntimeError(f"layer value must be in {zposs}")
+    def edid(self):
+        """
+        Get EDID of the connected display from the EDID property of the connector.
+
+        Parse it with :class:`~actfw_raspberrypi.edid.EDID`.
+
+        Returns:
+            bytes: EDID blob, or None if the display does not provide it
+        """
+        _, values = self.properties.object_properties(self.connector.connector_id, DRM_MODE_OBJECT_CONNECTOR)
+        if not values.get("EDID"):
+            return None
+        blob = _drm.get_property_blob(self.fd, values["EDID"])
+        if blob is None:
+            return None
+        data = string_at(blob.data, blob.length)
+        _drm.free_property_blob(byref(blob))
+        return data
+
+    def pick_plane(self, layer, pixel_format="RGB", scaling=False):
+        """
+        Take a plane suitable for a window (see :class:`PlaneAllocator`).
+
+        Args:
+            layer (int): zpos of the plane
+            pixel_format (str): pixel format of the window
+            scaling (bool): True if the window is scaled
+
+        Returns:
+            :class:`Plane`: plane at ``layer``
+        """
+        return self.allocator.pick(layer, pixel_format, scaling)
 
     def free_plane(self, plane):
         plane.set(0, 0, (0, 0, 0, 0), (0, 0, 0, 0))
-        self.planes.append(plane)
-
-    def create_fb(self, width, height, bpp=24):
-        return Framebuffer(self.fd, width, height, bpp)
+        self.allocator.free(plane)
+
+    def create_fb(self, width, height, bpp=24, pixel_format=None):
+        return Framebuffer(self.fd, width, height, bpp, pixel_format)
+
+    def import_fb(self, dmabuf_fd, width, height, pixel_format, pitch):
+        """
+        Import a DMA-BUF as a framebuffer.
+
+        Args:
+            dmabuf_fd (int): DMA-BUF file descriptor
+            width (int): image width
+            height (int): image height
+            pixel_format (str): pixel format (see :data:`PIXEL_FORMATS`)
+            pitch (int): bytes between rows of the first plane
+
+        Returns:
+            :class:`PrimeFramebuffer`: framebuffer
+        """
+        return PrimeFramebuffer(self.fd, dmabuf_fd, width, height, pixel_format, pitch)
+
+    def queue_flip(self, plane, fb_id, dst, src, callback):
+        """
+        Queue a plane update which is shown at the next vblank.
+
+        If another flip is in flight, the update is deferred and committed together with
+        the other deferred updates when the in-flight flip completes.
+
+        Args:
+            plane (:class:`Plane`): plane to update
+            fb_id (int): framebuffer to scan out
+            dst ((int, int, int, int)): destination rectangle
+            src ((int, int, int, int)): source rectangle
+            callback (callable): called with True when the update is on screen,
+                or with False when it is replaced by a newer update of the plane before being committed
+                or when its commit fails
+        """
+        with self._cond:
+            replaced = self._queued.get(plane.plane_id)
+            self._queued[plane.plane_id] = (plane, fb_id, dst, src, callback)
+            if replaced is not None:
+                replaced[4](False)
+            if self._inflight is None and self._batching == 0:
+                self._commit_queued()
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager which collects the updates queued inside it into one atomic commit.
+        """
+        with self._cond:
+            self._batching += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._batching -= 1
+                if self._inflight is None and self._batching == 0 and self._queued:
+                    self._commit_queued()
+
+    def test_plane(self, plane, fb_id, dst, src):
+        """
+        Check whether the plane can show the framebuffer by a TEST_ONLY atomic commit.
+
+        Returns:
+            bool: True if the configuration is accepted by the driver
+        """
+        if not self.page_flip:
+            return True
+        with self._cond:
+            return self._atomic_commit([(plane, fb_id, dst, src, None)], DRM_MODE_ATOMIC_TEST_ONLY) == 0
+
+    def wait(self, predicate):
+        """
+        Handle page flip events until ``predicate()`` becomes True.
+
+        Only one thread reads the device fd at a time; the other threads wait for it.
+        """
+        with self._cond:
+            while not predicate():
+                if self._inflight is None:
+                    if self._queued:
+                        raise RuntimeError("can not wait for page flip in batch(): no free buffer")
+                    raise RuntimeError("no page flip in flight")
+                if self._reading:
+                    self._cond.wait()
+                    continue
+                self._reading = True
+                self._cond.release()
+                try:
+                    handled = self._read_events(self.FLIP_TIMEOUT)
+                finally:
+                    self._cond.acquire()
+                    self._reading = False
+                    self._complete_flip()
+                    self._cond.notify_all()
+                if not handled:
+                    raise RuntimeError("timed out waiting for page flip")
+
+    def _read_events(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        res = _drm.handle_event(self.fd, byref(self._event_context))
+        if res != 0:
+            errno = get_errno()
+            raise RuntimeError(f"fail to handle drm event: {res} {errno} {os.strerror(errno)}")
+        return True
+
+    def _on_page_flip(self, fd, sequence, tv_sec, tv_usec, user_data):
+        # Called from drmHandleEvent. State is updated by _complete_flip() under the lock.
+        self._flipped = True
+        self.flip_time = tv_sec + tv_usec / 1e6
+
+    def _complete_flip(self):
+        if not self._flipped:
+            return
+        self._flipped = False
+        inflight, self._inflight = self._inflight, None
+        for _, _, _, _, callback in inflight:
+            callback(True)
+        if self._queued and self._batching == 0:
+            self._commit_queued()
+
+    def _commit_queued(self):
+        entries = list(self._queued.values())
+        self._queued = {}
+        self.commit_time = time.monotonic()
+        res = self._atomic_commit(entries, DRM_MODE_ATOMIC_NONBLOCK | DRM_MODE_PAGE_FLIP_EVENT)
+        if res != 0:
+            errno = get_errno()
+            # The updates are given up so that their framebuffers can be drawn again
+            for _, _, _, _, callback in entries:
+                callback(False)
+            raise RuntimeError(f"fail to commit atomic request: {res} {errno} {os.strerror(errno)}")
+        self._inflight = entries
+
+    def _atomic_commit(self, entries, flags):
+        req = _drm.atomic_alloc()
+        if not req:
+            raise RuntimeError("fail to allocate atomic request")
+        try:
+            for plane, fb_id, dst, src, _ in entries:
+                plane.add_to_request(req, self.crtc.crtc_id, fb_id, dst, src)
+            return _drm.atomic_commit(self.fd, req, flags, None)
+        finally:
+            _drm.atomic_free(req)
 
     def _find_connector(self, res: DRMModeResource) -> DRMModeConnector:
         for i in range(res.count_connectors):
@@ -792,8 +1595,10 @@ class Device(object):
         res = _drm.get_plane_resources(self.fd)
         for i in range(res.count_planes):
             raw = _drm.get_plane(self.fd, res.planes[i])
-            p = Plane(self.fd, raw)
+            p = Plane(self.fd, raw, self.properties)
             _drm.free_plane(byref(raw))
-            planes.append(p)
+            # Atomic implies universal planes, which also lists the primary and cursor planes
+            if p.type == DRM_PLANE_TYPE_OVERLAY:
+                planes.append(p)
         _drm.free_plane_resources(byref(res))
         return planes
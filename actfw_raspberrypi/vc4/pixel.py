@@ -0,0 +1,194 @@
+"""
+Pixel conversion helpers shared by display backends.
+
+NumPy is used when it is installed. Otherwise conversions fall back to slicing of ``bytes``,
+which still runs in C but is slower.
+"""
+
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+# Objects supporting the buffer protocol such as bytes, mmap and ctypes arrays, which typing cannot express
+Buffer = Any
+
+# Format of images blitted into windows, if it differs from the pixel format of the window
+BLIT_FORMATS: Dict[str, str] = {"RGB565": "RGB"}
+
+_np: Any = None
+
+
+def _numpy() -> Any:
+    global _np
+    if _np is None:
+        try:
+            import numpy  # type: ignore[import-not-found, unused-ignore]  # reason: numpy is optional
+
+            _np = numpy
+        except ImportError:
+            _np = False
+    return _np or None
+
+
+def _pack_rows(src: Buffer, stride: int, row: int, height: int) -> Buffer:
+    src = memoryview(src).cast("B")
+    if stride == row:
+        return src[: row * height]
+    return b"".join(src[y * stride : y * stride + row] for y in range(height))
+
+
+def swizzle(dst: Buffer, dst_pitch: int, src: Buffer, src_stride: int, width: int, height: int, order: Sequence[int]) -> None:
+    """
+    Copy packed pixels reordering their channels.
+
+    Args:
+        dst (writable bytes-like): destination whose rows are ``dst_pitch`` bytes apart
+        dst_pitch (int): bytes between rows of ``dst``
+        src (bytes-like): source image
+        src_stride (int): bytes between rows of ``src``
+        width (int): image width
+        height (int): image height
+        order (tuple of int): channel ``i`` of ``dst`` is taken from channel ``order[i]`` of ``src``
+    """
+    channels = len(order)
+    row = width * channels
+    np = _numpy()
+    if np is not None:
+        d = np.ndarray((height, width, channels), dtype=np.uint8, buffer=dst, strides=(dst_pitch, channels, 1))
+        s = np.ndarray((height, width, channels), dtype=np.uint8, buffer=src, strides=(src_stride, channels, 1))
+        for i, j in enumerate(order):
+            d[..., i] = s[..., j]
+        return
+
+    src = bytes(_pack_rows(src, src_stride, row, height))
+    out = bytearray(row * height)
+    for i, j in enumerate(order):
+        out[i::channels] = src[j::channels]
+    dst = memoryview(dst).cast("B")
+    if dst_pitch == row:
+        dst[: len(out)] = out
+    else:
+        for y in range(height):
+            dst[y * dst_pitch : y * dst_pitch + row] = out[y * row : (y + 1) * row]
+
+
+def rgb_to_rgb565(dst: Buffer, dst_pitch: int, src: Buffer, src_stride: int, width: int, height: int) -> None:
+    """
+    Pack 24-bit RGB pixels into little endian RGB565.
+
+    Args:
+        dst (writable bytes-like): destination whose rows are ``dst_pitch`` bytes apart
+        dst_pitch (int): bytes between rows of ``dst``
+        src (bytes-like): RGB image
+        src_stride (int): bytes between rows of ``src``
+        width (int): image width
+        height (int): image height
+    """
+    np = _numpy()
+    if np is not None:
+        s = np.ndarray((height, width, 3), dtype=np.uint8, buffer=src, strides=(src_stride, 3, 1))
+        d = np.ndarray((height, width), dtype="<u2", buffer=dst, strides=(dst_pitch, 2))
+        r = s[..., 0].astype(np.uint16)
+        g = s[..., 1].astype(np.uint16)
+        b = s[..., 2].astype(np.uint16)
+        d[...] = ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)
+        return
+
+    src = bytes(_pack_rows(src, src_stride, width * 3, height))
+    n = width * height
+    r, g, b = src[0::3], src[1::3], src[2::3]
+    # Bytes are OR-ed channel by channel as big integers
+    high = int.from_bytes(r.translate(_R_HIGH), "big") | int.from_bytes(g.translate(_G_HIGH), "big")
+    low = int.from_bytes(g.translate(_G_LOW), "big") | int.from_bytes(b.translate(_B_LOW), "big")
+    out = bytearray(n * 2)
+    out[0::2] = low.to_bytes(n, "big")
+    out[1::2] = high.to_bytes(n, "big")
+    row = width * 2
+    dst = memoryview(dst).cast("B")
+    for y in range(height):
+        dst[y * dst_pitch : y * dst_pitch + row] = out[y * row : (y + 1) * row]
+
+
+_R_HIGH = bytes(v & 0xF8 for v in range(256))
+_G_HIGH = bytes(v >> 5 for v in range(256))
+_G_LOW = bytes((v << 3) & 0xE0 for v in range(256))
+_B_LOW = bytes(v >> 3 for v in range(256))
+
+
+def copy_rect(
+    dst: Buffer,
+    dst_pitch: int,
+    src: Buffer,
+    src_stride: int,
+    rect: Tuple[int, int, int, int],
+    cpp: int,
+    order: Optional[Sequence[int]] = None,
+) -> None:
+    """
+    Copy a packed image into a rectangle of a larger image.
+
+    Args:
+        dst (writable bytes-like): destination image whose rows are ``dst_pitch`` bytes apart
+        dst_pitch (int): bytes between rows of ``dst``
+        src (bytes-like): image of the rectangle size
+        src_stride (int): bytes between rows of ``src``
+        rect ((int, int, int, int)): destination rectangle (left, top, width, height)
+        cpp (int): bytes per pixel
+        order (tuple of int): channel order as :func:`swizzle`, or None to copy as is
+    """
+    x, y, w, h = rect
+    dst = memoryview(dst).cast("B")[y * dst_pitch + x * cpp :]
+    if order is not None:
+        swizzle(dst, dst_pitch, src, src_stride, w, h, order)
+        return
+    src = memoryview(src).cast("B")
+    row = w * cpp
+    for i in range(h):
+        dst[i * dst_pitch : i * dst_pitch + row] = src[i * src_stride : i * src_stride + row]
+
+
+def rgb_to_yuv(rgb: Sequence[int]) -> Tuple[int, int, int]:
+    """
+    Convert a color to full range ITU-R BT.601 YCbCr.
+
+    Args:
+        rgb ((int, int, int)): color
+
+    Returns:
+        (int, int, int): (Y, Cb, Cr)
+    """
+    r, g, b = rgb
+    y = 0.299 * r + 0.587 * g + 0.114 * b
+    u = 128 - 0.168736 * r - 0.331264 * g + 0.5 * b
+    v = 128 + 0.5 * r - 0.418688 * g - 0.081312 * b
+    y, u, v = (min(255, max(0, round(c))) for c in (y, u, v))
+    return y, u, v
+
+
+def fill(pixel_format: str, rgb: Sequence[int], width: int, height: int) -> bytes:
+    """
+    Make an image filled with a color.
+
+    Args:
+        pixel_format (str): byte order of pixels such as "RGB" or "BGRA", "RGB565", or "NV12" or "YUV420"
+        rgb ((int, int, int) or (int, int, int, int)): color. Alpha is 255 unless it is given as the 4th element.
+            Padding bytes are filled with 255.
+        width (int): image width
+        height (int): image height
+
+    Returns:
+        bytes: packed image
+    """
+    if pixel_format in ("NV12", "YUV420"):
+        y, u, v = rgb_to_yuv(rgb[:3])
+        luma = bytes([y]) * (width * height)
+        quarter = width // 2 * (height // 2)
+        if pixel_format == "NV12":
+            return luma + bytes([u, v]) * quarter
+        return luma + bytes([u]) * quarter + bytes([v]) * quarter
+    if pixel_format == "RGB565":
+        out = bytearray(2)
+        rgb_to_rgb565(out, 2, bytes(rgb[:3]), 3, 1, 1)
+        return bytes(out) * (width * height)
+    channels = dict(X=255, A=255)
+    channels.update(zip("RGBA", rgb))
+    color = bytes(channels[c] for c in pixel_format)
+    return color * (width * height)
@@ -0,0 +1,621 @@
+"""
+Headless display which shares windows with other processes through memory-mapped files.
+
+Each window is a file in ``/dev/shm`` laid out as:
+
+- header (:data:`_HEADER`): window geometry, pixel format, index and sequence number of the latest frame
+- one slot (:data:`_SLOT`) per buffer: sequence number of the frame in the buffer and its timestamp
+- buffers of ``pitch * height`` bytes from ``data_offset``, aligned to pages
+
+Readers map the file and use the latest buffer without copy (see :class:`WindowReader`).
+The sequence number of a buffer is 0 while it is drawn, so a frame is intact
+if its slot still holds the same sequence number after it has been used.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from types import TracebackType
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Type
+
+from .pixel import BLIT_FORMATS, Buffer, copy_rect, fill, rgb_to_rgb565
+from .stats import WindowStats
+from .swapchain import MAX_BUFFERS, MIN_BUFFERS, Rect, SwapChain
+
+SHM_DIRECTORY = "/dev/shm"
+SHM_MAGIC = b"ACTFWSHM"
+SHM_VERSION = 1
+
+# Byte order of pixels in memory -> bpp
+PIXEL_FORMATS: Dict[str, int] = {
+    "RGB": 24,
+    "BGR": 24,
+    "RGBX": 32,
+    "BGRX": 32,
+    "RGBA": 32,
+    "BGRA": 32,
+    "RGB565": 16,
+}
+
+# magic, version, data offset, number of buffers, width, height, pitch, pixel format,
+# layer, destination rectangle, source rectangle, alpha, latest buffer index (-1 if none), latest sequence number
+_HEADER = struct.Struct("<8sIIIIII8si4i4iIiQ")
+# sequence number (0 while drawn), time.monotonic() when the frame has been updated
+_SLOT = struct.Struct("<Qd")
+# Frame read from a shared window. The functional form allows the field named "index".
+SharedFrame = NamedTuple("SharedFrame", [("sequence", int), ("timestamp", float), ("index", int), ("value", memoryview)])
+
+
+class Display(object):
+    display_num: int
+    directory: str
+    name: str
+    _size: Tuple[int, int]
+    _cond: threading.Condition
+    _batching: int
+    _deferred: List[Callable[[float], None]]
+    _windows: int
+
+    """Headless display which shares windows in memory-mapped files"""
+
+    def __init__(
+        self,
+        display_num: int = 0,
+        size: Tuple[int, int] = (640, 480),
+        directory: str = SHM_DIRECTORY,
+        name: str = "actfw",
+    ) -> None:
+        """
+
+        Args:
+            display_num (int): display number, which is a part of the file names
+            size ((int, int)): display size (width, height) reported to the application
+            directory (str): directory to create window files in
+            name (str): prefix of the file names. Windows are shared as ``{directory}/{name}-display{display_num}-window{index}``
+        """
+        self.display_num = display_num
+        self.directory = directory
+        self.name = name
+        self._size = (size[0], size[1])
+        self._cond = threading.Condition()
+        self._batching = 0
+        self._deferred = []
+        self._windows = 0
+
+    def get_info(self) -> Any:
+        """
+        DEPRECATED: Get display information.
+        """
+        raise RuntimeError("This API is deprecated. If you need width and height, use Display.size().")
+
+    def open_window(
+        self,
+        dst: Rect,
+        size: Tuple[int, int],
+        layer: int,
+        *,
+        num_buffers: int = 2,
+        pixel_format: str = "RGB",
+    ) -> "Window":
+        """
+        Open new window.
+
+        Args:
+            dst ((int, int, int, int)): destination rectangle (left, top, width, height)
+            size ((int, int)): window size (width, height)
+            layer (int): layer
+            num_buffers (int): number of buffers (2 to 4).
+                Readers can use a frame until ``num_buffers - 1`` newer frames have been updated.
+            pixel_format (str): byte order of blitted images ("RGB", "BGR", "RGBX", "BGRX", "RGBA" or "BGRA").
+                "RGB565" windows take 24-bit RGB images and pack them to 16 bits on blit.
+
+        Returns:
+            :class:`Window`: window
+        """
+        with self._cond:
+            index = self._windows
+            self._windows += 1
+        path = os.path.join(self.directory, f"{self.name}-display{self.display_num}-window{index}")
+        return Window(self, path, dst, size, layer, num_buffers, pixel_format)
+
+    def size(self) -> Tuple[int, int]:
+        """
+        Get display size.
+
+        Returns:
+            ((int, int)): (width, height)
+        """
+        return self._size
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Apply window updates in the with-block at once.
+
+        Frames of all windows updated in the block are published to readers at the end of the block.
+        Drawing into a window which has no free buffer fails in the block.
+
+        Returns:
+            context manager
+        """
+        with self._cond:
+            self._batching += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._batching -= 1
+                if self._batching == 0:
+                    deferred, self._deferred = self._deferred, []
+                    timestamp = time.monotonic()
+                    for publish in deferred:
+                        publish(timestamp)
+
+    def close(self) -> None:
+        pass
+
+    def _publish(self, publish: Callable[[float], None]) -> None:
+        with self._cond:
+            if self._batching > 0:
+                self._deferred.append(publish)
+            else:
+                publish(time.monotonic())
+
+    def __enter__(self) -> "Display":
+        return self
+
+    def __exit__(
+        self,
+        ex_type: Optional[Type[BaseException]],
+        ex_value: Optional[BaseException],
+        trace: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+
+class Window(object):
+    """
+    Multi buffered window in a memory-mapped file.
+
+    :meth:`update` publishes the back buffer to readers immediately; there is no vsync to wait for.
+    """
+
+    display: Display
+    path: str
+    size: Tuple[int, int]
+    layer: int
+    src: Rect
+    dst: Rect
+    pixel_format: str
+    alpha: int
+    buffers: List[memoryview]
+    chain: SwapChain[int]
+    _blit_format: str
+    _cpp: int
+    _pitch: int
+    _attributes_changed: bool
+    _sequence: int
+    _latest: int
+    _stats: WindowStats
+    _data_offset: int
+    _map: mmap.mmap
+
+    def __init__(
+        self,
+        display: Display,
+        path: str,
+        dst: Rect,
+        size: Tuple[int, int],
+        layer: int,
+        num_buffers: int = 2,
+        pixel_format: str = "RGB",
+    ) -> None:
+        if not MIN_BUFFERS <= num_buffers <= MAX_BUFFERS:
+            raise RuntimeError(f"num_buffers must be in [{MIN_BUFFERS}, {MAX_BUFFERS}]: {num_buffers}")
+        if pixel_format not in PIXEL_FORMATS:
+            raise RuntimeError(f"not support pixel format: {pixel_format}")
+
+        self.display = display
+        self.path = path
+        self.size = (size[0], size[1])
+        self.layer = layer
+        self.src = (0, 0, size[0], size[1])
+        self.dst = (dst[0], dst[1], dst[2], dst[3])
+        self.pixel_format = pixel_format
+        self.alpha = 255
+        self._blit_format = BLIT_FORMATS.get(pixel_format, pixel_format)
+        self._cpp = PIXEL_FORMATS[pixel_format] // 8
+        self._pitch = size[0] * self._cpp
+        self._attributes_changed = False
+        self._sequence = 0
+        self._latest = -1
+        # Frames are published without vsync, so no vblank is missed
+        self._stats = WindowStats(vsync_period=0)
+
+        buffer_size = self._pitch * size[1]
+        self._data_offset = -(-(_HEADER.size + _SLOT.size * num_buffers) // mmap.PAGESIZE) * mmap.PAGESIZE
+        # Created under a temporary name and renamed with the header written. Readers of a previous window
+        # at the path keep mapping its file, which must not be truncated under them.
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, self._data_offset + buffer_size * num_buffers)
+            self._map = mmap.mmap(fd, self._data_offset + buffer_size * num_buffers)
+        finally:
+            os.close(fd)
+        self.buffers = [
+            memoryview(self._map)[self._data_offset + i * buffer_size : self._data_offset + (i + 1) * buffer_size]
+            for i in range(num_buffers)
+        ]
+        self.chain = SwapChain(list(range(num_buffers)))
+        self._write_header()
+        os.rename(tmp_path, path)
+
+    def clear(self, rgb: Sequence[int] = (0, 0, 0)) -> None:
+        """
+        Clear window.
+
+        Args:
+            rgb ((int, int, int)): clear color. Pass (r, g, b, a) to clear windows with alpha, e.g. to transparent.
+        """
+        self.blit(fill(self._blit_format, rgb, self.size[0], self.size[1]))
+
+    def set_layer(self, layer: int) -> None:
+        """
+        Set window layer.
+
+        Args:
+            layer (int): new layer
+        """
+        self.layer = layer
+        self._write_header()
+
+    def swap_layer(self, window: "Window") -> None:
+        """
+        Swap window layer.
+
+        Args:
+            window (:class:`Window`): target window
+        """
+        self.layer, window.layer = window.layer, self.layer
+        self._write_header()
+        window._write_header()
+
+    def set_source_rect(self, rect: Rect) -> None:
+        """
+        Set the rectangle of the window buffers to show. Readers are told at the next :meth:`update`.
+
+        Args:
+            rect ((int, int, int, int)): rectangle in window (left, top, width, height)
+        """
+        x, y, w, h = rect
+        if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > self.size[0] or y + h > self.size[1]:
+            raise RuntimeError(f"source rect {rect} is out of window")
+        self.src = (x, y, w, h)
+        self._attributes_changed = True
+
+    def set_dest_rect(self, rect: Rect) -> None:
+        """
+        Set the rectangle of the display to show the window in. Readers are told at the next :meth:`update`.
+
+        Args:
+            rect ((int, int, int, int)): destination rectangle (left, top, width, height)
+        """
+        x, y, w, h = rect
+        if w <= 0 or h <= 0:
+            raise RuntimeError(f"dest rect {rect} is empty")
+        self.dst = (x, y, w, h)
+        self._attributes_changed = True
+
+    def set_alpha(self, alpha: int) -> None:
+        """
+        Set the opacity of the whole window. Readers are told at the next :meth:`update`.
+
+        Args:
+            alpha (int): opacity from 0 (transparent) to 255 (opaque)
+        """
+        if not 0 <= alpha <= 255:
+            raise RuntimeError(f"alpha must be in [0, 255]: {alpha}")
+        self.alpha = alpha
+        self._attributes_changed = True
+
+    def blit(self, image: Buffer, stride: Optional[int] = None) -> None:
+        """
+        Blit image to window.
+
+        Args:
+            image (bytes-like): image in ``pixel_format`` (RGB for "RGB565") with which size is the same as window size
+            stride (int): bytes between rows of ``image``. By default rows are packed.
+        """
+        start = time.perf_counter()
+        width, height = self.size
+        back = self._back()
+        buf = self.buffers[back]
+        if stride is None:
+            stride = width * len(self._blit_format)
+        if self.pixel_format == "RGB565":
+            rgb_to_rgb565(buf, self._pitch, image, stride, width, height)
+        elif stride == self._pitch:
+            buf[:] = memoryview(image).cast("B")[: len(buf)]
+        else:
+            copy_rect(buf, self._pitch, image, stride, (0, 0, width, height), self._cpp)
+        self.chain.take_stale(back)
+        self.chain.damage((0, 0, width, height))
+        self._stats.blit(time.perf_counter() - start, len(buf))
+
+    def blit_region(self, image: Buffer, rect: Rect, stride: Optional[int] = None) -> None:
+        """
+        Blit image to a rectangle of window.
+
+        Only the rectangle and the regions which the back buffer misses from the previous frames are copied
+        into the back buffer.
+
+        Args:
+            image (bytes-like): image in ``pixel_format`` (RGB for "RGB565") with which size is the same as the rectangle
+            rect ((int, int, int, int)): rectangle in window (left, top, width, height)
+            stride (int): bytes between rows of ``image``. By default rows are packed.
+        """
+        start = time.perf_counter()
+        x, y, w, h = rect
+        if x < 0 or y < 0 or x + w > self.size[0] or y + h > self.size[1]:
+            raise RuntimeError(f"rect {rect} is out of window")
+        back = self._back()
+        buf = self.buffers[back]
+        latest = self.buffers[self.chain.latest]
+        nbytes = w * h * self._cpp
+        for sx, sy, sw, sh in self.chain.take_stale(back):
+            offset = sy * self._pitch + sx * self._cpp
+            copy_rect(buf, self._pitch, latest[offset:], self._pitch, (sx, sy, sw, sh), self._cpp)
+            nbytes += sw * sh * self._cpp
+        if stride is None:
+            stride = w * len(self._blit_format)
+        if self.pixel_format == "RGB565":
+            rgb_to_rgb565(buf[y * self._pitch + x * 2 :], self._pitch, image, stride, w, h)
+        else:
+            copy_rect(buf, self._pitch, image, stride, rect, self._cpp)
+        self.chain.damage(rect)
+        self._stats.blit(time.perf_counter() - start, nbytes)
+
+    def view(self) -> memoryview:
+        """
+        Get the back buffer to draw into it without an intermediate copy.
+
+        The back buffer changes at each :meth:`update`, so get the view again for every frame.
+        Release the view before the window is closed.
+
+        Returns:
+            memoryview: writable bytes of the back buffer. Row ``y`` starts at ``y * pitch()``.
+        """
+        back = self._back()
+        self.chain.take_stale(back)
+        self.chain.damage((0, 0, self.size[0], self.size[1]))
+        return self.buffers[back]
+
+    def array(self) -> Any:
+        """
+        Get the back buffer as a NumPy array. Requires numpy.
+
+        The back buffer changes at each :meth:`update`, so get the array again for every frame.
+
+        Returns:
+            numpy.ndarray: writable uint8 array of shape (height, width, channels)
+        """
+        import numpy as np  # type: ignore[import-not-found, unused-ignore]  # reason: numpy is optional
+
+        return np.ndarray((self.size[1], self.size[0], self._cpp), dtype=np.uint8, buffer=self.view())
+
+    def pitch(self) -> int:
+        """
+        Get bytes between rows of the window buffers.
+
+        Returns:
+            int: pitch
+        """
+        return self._pitch
+
+    def update(self) -> None:
+        """
+        Update window.
+
+        Publishes the back buffer drawn since the last update with its sequence number and timestamp.
+        If nothing has been drawn, only the changes of the rectangles and alpha are published.
+        """
+        if self.chain.back is None:
+            if self._attributes_changed:
+                self._attributes_changed = False
+                self.display._publish(lambda _timestamp: self._write_header())
+            return
+        start = time.perf_counter()
+        self._attributes_changed = False
+        with self.display._cond:
+            index = self.chain.queue()
+        queued_at = time.monotonic()
+        self.display._publish(lambda timestamp: self._present(index, queued_at, timestamp))
+        self._stats.update(time.perf_counter() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get presentation statistics of the window.
+
+        Frames count as presented when they are published to readers.
+        Drawing in :meth:`Display.batch` with no free buffer is counted in "buffer_waits" before it fails.
+
+        Returns:
+            dict: snapshot described in :meth:`~actfw_raspberrypi.vc4.stats.WindowStats.snapshot`
+        """
+        return self._stats.snapshot()
+
+    def close(self) -> None:
+        """
+        Close window and remove its file. Readers which have mapped it can still read the last frames.
+        """
+        for buf in self.buffers:
+            buf.release()
+        self._map.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _back(self) -> int:
+        with self.display._cond:
+            if self.chain.back is None:
+                back = self.chain.acquire()
+                if back is None:
+                    self._stats.buffer_wait()
+                    raise RuntimeError("can not draw in batch(): no free buffer")
+                # Invalidate the frame which readers may still use
+                _SLOT.pack_into(self._map, _HEADER.size + back * _SLOT.size, 0, 0.0)
+                return back
+            return self.chain.back
+
+    def _present(self, index: int, queued_at: float, timestamp: float) -> None:
+        # Called with the display lock held
+        self._stats.presented(queued_at, timestamp)
+        self._sequence += 1
+        _SLOT.pack_into(self._map, _HEADER.size + index * _SLOT.size, self._sequence, timestamp)
+        self._latest = index
+        self._write_header()
+        self.chain.presented(index)
+
+    def _write_header(self) -> None:
+        _HEADER.pack_into(
+            self._map,
+            0,
+            SHM_MAGIC,
+            SHM_VERSION,
+            self._data_offset,
+            len(self.buffers),
+            self.size[0],
+            self.size[1],
+            self._pitch,
+            self.pixel_format.encode(),
+            self.layer,
+            *self.dst,
+            *self.src,
+            self.alpha,
+            self._latest,
+            self._sequence,
+        )
+
+    def __enter__(self) -> "Window":
+        return self
+
+    def __exit__(
+        self,
+        ex_type: Optional[Type[BaseException]],
+        ex_value: Optional[BaseException],
+        trace: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+
+class WindowReader(object):
+    """
+    Reader of a window shared by :class:`Window`, e.g. in another process.
+
+    Attributes are refreshed from the header by :meth:`latest`.
+    """
+
+    version: int
+    data_offset: int
+    num_buffers: int
+    width: int
+    height: int
+    pitch: int
+    pixel_format: str
+    layer: int
+    dst: Rect
+    src: Rect
+    alpha: int
+    sequence: int
+    _index: int
+    _map: mmap.mmap
+
+    def __init__(self, path: str) -> None:
+        """
+
+        Args:
+            path (str): path of the window file (:attr:`Window.path`)
+        """
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[: len(SHM_MAGIC)] != SHM_MAGIC:
+            self._map.close()
+            raise RuntimeError(f"not a shared window: {path}")
+        self._read_header()
+        if self.version != SHM_VERSION:
+            self._map.close()
+            raise RuntimeError(f"not supported version of shared window: {self.version}")
+
+    def latest(self) -> Optional[SharedFrame]:
+        """
+        Get the latest frame.
+
+        The frame data is a view of the shared buffer, which is overwritten after ``num_buffers - 1`` newer frames.
+        Check :meth:`intact` after using it, or copy it.
+
+        Returns:
+            :class:`SharedFrame`: (sequence, timestamp, index, value), or None if no frame has been updated
+        """
+        self._read_header()
+        if self._index < 0:
+            return None
+        sequence, timestamp = _SLOT.unpack_from(self._map, _HEADER.size + self._index * _SLOT.size)
+        if sequence == 0:
+            # Being drawn again
+            return None
+        buffer_size = self.pitch * self.height
+        offset = self.data_offset + self._index * buffer_size
+        return SharedFrame(sequence, timestamp, self._index, memoryview(self._map)[offset : offset + buffer_size])
+
+    def intact(self, frame: SharedFrame) -> bool:
+        """
+        Check that a frame has not been overwritten.
+
+        Args:
+            frame (:class:`SharedFrame`): frame from :meth:`latest`
+
+        Returns:
+            bool: True if the buffer still holds the frame
+        """
+        sequence, _ = _SLOT.unpack_from(self._map, _HEADER.size + frame.index * _SLOT.size)
+        return bool(sequence == frame.sequence)
+
+    def close(self) -> None:
+        """
+        Unmap the window. Release the views of frames before closing.
+        """
+        self._map.close()
+
+    def _read_header(self) -> None:
+        fields = _HEADER.unpack_from(self._map, 0)
+        (
+            _,
+            self.version,
+            self.data_offset,
+            self.num_buffers,
+            self.width,
+            self.height,
+            self.pitch,
+            pixel_format,
+            self.layer,
+        ) = fields[:9]
+        self.pixel_format = pixel_format.rstrip(b"\0").decode()
+        self.dst = (fields[9], fields[10], fields[11], fields[12])
+        self.src = (fields[13], fields[14], fields[15], fields[16])
+        self.alpha, self._index, self.sequence = fields[17:]
+
+    def __enter__(self) -> "WindowReader":
+        return self
+
+    def __exit__(
+        self,
+        ex_type: Optional[Type[BaseException]],
+        ex_value: Optional[BaseException],
+        trace: Optional[TracebackType],
+    ) -> None:
+        self.close()
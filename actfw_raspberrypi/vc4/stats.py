@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+# Upper bounds of histogram buckets in seconds. The last bucket has no upper bound.
+DURATION_BOUNDS = (0.001, 0.002, 0.004, 0.008, 0.016, 0.033, 0.066)
+# Presentations over this period are used for the frame rate
+FPS_PERIOD = 2.0
+
+
+class Histogram(object):
+    """
+    Histogram of durations.
+    """
+
+    bounds: Sequence[float]
+    counts: List[int]
+    total: float
+    max: float
+
+    def __init__(self, bounds: Sequence[float] = DURATION_BOUNDS) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        i = 0
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+        self.counts[i] += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        count = sum(self.counts)
+        return {
+            "count": count,
+            "mean_s": self.total / count if count else 0.0,
+            "max_s": self.max,
+            "bounds_s": list(self.bounds),
+            "counts": list(self.counts),
+        }
+
+
+class WindowStats(object):
+    """
+    Presentation statistics of a window.
+
+    Backends record blits, updates and presentations. :meth:`snapshot` is cheap enough to be called every frame.
+    """
+
+    vsync_period: float
+    _lock: threading.Lock
+    _blit: Histogram
+    _update: Histogram
+    _flip: Histogram
+    _presented: int
+    _dropped: int
+    _buffer_waits: int
+    _missed_vblanks: int
+    _bytes_copied: int
+    _frame_bytes: int
+    _last_frame_bytes: int
+    _present_times: Deque[float]
+
+    def __init__(self, vsync_period: float = 1 / 60) -> None:
+        """
+
+        Args:
+            vsync_period (float): seconds between vblanks, used to count missed vblanks
+        """
+        self.vsync_period = vsync_period
+        self._lock = threading.Lock()
+        self._blit = Histogram()
+        self._update = Histogram()
+        self._flip = Histogram()
+        self._presented = 0
+        self._dropped = 0
+        self._buffer_waits = 0
+        self._missed_vblanks = 0
+        self._bytes_copied = 0
+        self._frame_bytes = 0
+        self._last_frame_bytes = 0
+        self._present_times = deque(maxlen=256)
+
+    def blit(self, duration: float, nbytes: int) -> None:
+        """Record a blit which copied ``nbytes`` into window buffers"""
+        with self._lock:
+            self._blit.add(duration)
+            self._bytes_copied += nbytes
+            self._frame_bytes += nbytes
+
+    def update(self, duration: float) -> None:
+        """Record an update which took ``duration`` seconds to return"""
+        with self._lock:
+            self._update.add(duration)
+            self._last_frame_bytes, self._frame_bytes = self._frame_bytes, 0
+
+    def presented(self, queued_at: float, presented_at: Optional[float] = None) -> None:
+        """
+        Record a frame put on screen.
+
+        Args:
+            queued_at (float): :func:`time.monotonic` when the frame has been submitted to the display
+            presented_at (float): :func:`time.monotonic` of the vblank when the frame has been put on screen.
+                By default it is now.
+        """
+        now = time.monotonic()
+        if presented_at is None or presented_at < queued_at:
+            presented_at = now
+        latency = presented_at - queued_at
+        with self._lock:
+            self._presented += 1
+            self._flip.add(latency)
+            # A frame is shown at the first vblank after it is queued unless vblanks are missed
+            self._missed_vblanks += int(latency / self.vsync_period) if self.vsync_period > 0 else 0
+            self._present_times.append(presented_at)
+
+    def dropped(self) -> None:
+        """Record a frame replaced by a newer frame before being shown"""
+        with self._lock:
+            self._dropped += 1
+
+    def buffer_wait(self) -> None:
+        """Record that drawing waited because no buffer was free"""
+        with self._lock:
+            self._buffer_waits += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get the statistics.
+
+        Returns:
+            dict: JSON-serializable statistics, e.g. to be sent by ``actfw_core.notify``
+
+            - "frames_presented": frames put on screen
+            - "frames_dropped": frames replaced by newer frames before being shown
+            - "buffer_waits": times drawing waited for a free buffer, i.e. the display was the bottleneck
+            - "missed_vblanks": vblanks passed after frames were submitted, other than the one they were shown at
+            - "fps": frames presented per second in the last 2 seconds
+            - "bytes_copied": bytes copied into window buffers
+            - "bytes_per_frame": bytes copied for the last updated frame
+            - "blit", "update", "flip": histograms of the durations of blits, of update calls
+              and from submission to presentation. Each has "count", "mean_s", "max_s", and "counts" in buckets
+              of which upper bounds are "bounds_s" (the last bucket is unbounded).
+        """
+        now = time.monotonic()
+        with self._lock:
+            recent = [t for t in self._present_times if t >= now - FPS_PERIOD]
+            fps = (len(recent) - 1) / (recent[-1] - recent[0]) if len(recent) > 1 and recent[-1] > recent[0] else 0.0
+            return {
+                "frames_presented": self._presented,
+                "frames_dropped": self._dropped,
+                "buffer_waits": self._buffer_waits,
+                "missed_vblanks": self._missed_vblanks,
+                "fps": fps,
+                "bytes_copied": self._bytes_copied,
+                "bytes_per_frame": self._last_frame_bytes,
+                "blit": self._blit.snapshot(),
+                "update": self._update.snapshot(),
+                "flip": self._flip.snapshot(),
+            }
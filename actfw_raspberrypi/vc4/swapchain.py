@@ -0,0 +1,128 @@
+from collections import deque
+from typing import Deque, Dict, Generic, Hashable, List, Optional, Sequence, Tuple, TypeVar
+
+MIN_BUFFERS = 2
+MAX_BUFFERS = 4
+MAX_DAMAGE_RECTS = 8
+
+Rect = Tuple[int, int, int, int]
+B = TypeVar("B", bound=Hashable)
+
+
+class SwapChain(Generic[B]):
+    """
+    Buffers of a window and their states.
+
+    Each buffer is in one of the states:
+
+    - free: may be drawn
+    - back: being drawn by the application
+    - queued: submitted to the display and waiting for vblank
+    - on screen: scanned out
+
+    The first buffer is on screen at the beginning.
+    Buffers which are not in the chain (e.g. imported ones) may also be queued and put on screen.
+
+    For partial updates, the chain also records the rectangles (left, top, width, height)
+    which each buffer misses because they were redrawn in other buffers.
+    """
+
+    buffers: List[B]
+    free: Deque[B]
+    back: Optional[B]
+    queued: List[B]
+    scanout: B
+    latest: B
+    _stale: Dict[B, List[Rect]]
+
+    def __init__(self, buffers: Sequence[B]) -> None:
+        if not MIN_BUFFERS <= len(buffers) <= MAX_BUFFERS:
+            raise RuntimeError(f"number of buffers must be in [{MIN_BUFFERS}, {MAX_BUFFERS}]: {len(buffers)}")
+        self.buffers = list(buffers)
+        self.free = deque(self.buffers[1:])
+        self.back = None
+        self.queued = []
+        self.scanout = self.buffers[0]
+        self.latest = self.buffers[0]
+        self._stale = {b: [] for b in self.buffers}
+
+    def acquire(self) -> Optional[B]:
+        """
+        Get the back buffer, taking a free buffer if there is no back buffer.
+
+        Returns:
+            back buffer, or None if no buffer is free
+        """
+        if self.back is None and self.free:
+            self.back = self.free.popleft()
+        return self.back
+
+    def queue(self, buffer: Optional[B] = None) -> B:
+        """
+        Mark a buffer as queued. By default the back buffer is queued.
+
+        Returns:
+            queued buffer
+        """
+        if buffer is None:
+            if self.back is None:
+                raise RuntimeError("no back buffer to queue")
+            buffer, self.back = self.back, None
+        if buffer in self.buffers:
+            self.latest = buffer
+        self.queued.append(buffer)
+        return buffer
+
+    def presented(self, buffer: B) -> B:
+        """
+        Mark a queued buffer as on screen. The buffer previously on screen becomes free.
+
+        Returns:
+            buffer previously on screen
+        """
+        self.queued.remove(buffer)
+        previous, self.scanout = self.scanout, buffer
+        self._release(previous)
+        return previous
+
+    def dropped(self, buffer: B) -> None:
+        """
+        Mark a queued buffer as replaced by a newer one before it was shown. The buffer becomes free.
+        """
+        self.queued.remove(buffer)
+        self._release(buffer)
+
+    def damage(self, rect: Rect) -> None:
+        """
+        Record that a rectangle of the back buffer has been redrawn.
+
+        The other buffers miss the rectangle until it is taken by :meth:`take_stale`.
+        """
+        for b in self.buffers:
+            if b != self.back:
+                stale = self._stale[b]
+                stale.append(rect)
+                if len(stale) > MAX_DAMAGE_RECTS:
+                    self._stale[b] = [_bounding_box(stale)]
+
+    def take_stale(self, buffer: B) -> List[Rect]:
+        """
+        Get and forget the rectangles which the buffer misses.
+
+        Returns:
+            list of (int, int, int, int): rectangles
+        """
+        rects, self._stale[buffer] = self._stale[buffer], []
+        return rects
+
+    def _release(self, buffer: B) -> None:
+        if buffer in self.buffers and buffer != self.scanout:
+            self.free.append(buffer)
+
+
+def _bounding_box(rects: Sequence[Rect]) -> Rect:
+    left = min(x for x, _, _, _ in rects)
+    top = min(y for _, y, _, _ in rects)
+    right = max(x + w for x, _, w, _ in rects)
+    bottom = max(y + h for _, y, _, h in rects)
+    return (left, top, right - left, bottom - top)
@@ -0,0 +1,241 @@
+"""
+Benchmark of the display backends of actfw_raspberrypi.vc4.
+
+Measures the latency of ``Window.blit``, ``Window.update``, ``Window.clear`` and ``Window.blit_region``
+for each backend, resolution, pixel format and number of buffers, the time to open ``Display``
+and the time to import the modules in a fresh interpreter.
+libdrm and libbcm_host are replaced with the stand-ins in ``tests/fakes.py`` unless ``--device`` is given,
+so the numbers are the costs of the Python side and of memory copies rather than of the display hardware.
+
+Results are written as JSON, and can be compared with a previous run::
+
+    python benchmarks/bench_display.py --output before.json
+    python benchmarks/bench_display.py --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path[:0] = [ROOT, os.path.join(ROOT, "tests")]
+
+import fakes  # noqa: E402
+
+from actfw_raspberrypi.vc4 import pixel  # noqa: E402
+from actfw_raspberrypi.vc4.dispmanx import Display as DispmanxDisplay  # type: ignore  # noqa: E402
+from actfw_raspberrypi.vc4.drm.display import Display as DRMDisplay  # type: ignore  # noqa: E402
+from actfw_raspberrypi.vc4.shm import Display as ShmDisplay  # noqa: E402
+
+BACKENDS = ["dispmanx", "drm", "shm"]
+RESOLUTIONS = [(320, 240), (640, 480), (1280, 720), (1920, 1080)]
+FORMATS = {
+    "dispmanx": ["RGB", "RGBA", "RGB565"],
+    "drm": ["RGB", "BGR", "RGBA", "RGB565", "NV12"],
+    "shm": ["RGB", "RGBA", "RGB565"],
+}
+NUM_BUFFERS = [2, 3]
+REGION = (64, 64)
+# Keys which identify a result
+KEYS = ("backend", "op", "width", "height", "pixel_format", "num_buffers")
+
+
+def open_display(backend: str, directory: str) -> Any:
+    if backend == "dispmanx":
+        return DispmanxDisplay()
+    if backend == "drm":
+        return DRMDisplay()
+    return ShmDisplay(directory=directory)
+
+
+def image_size(pixel_format: str, width: int, height: int) -> int:
+    if pixel_format == "NV12":
+        return width * height * 3 // 2
+    return width * height * len(pixel.BLIT_FORMATS.get(pixel_format, pixel_format))
+
+
+def measure(func: Callable[[], Any], iterations: int, warmup: int = 2) -> List[float]:
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(samples: List[float], nbytes: int = 0) -> Dict[str, float]:
+    ordered = sorted(samples)
+    mean = statistics.mean(ordered)
+    result = {
+        "iterations": len(ordered),
+        "mean_s": mean,
+        "p50_s": ordered[len(ordered) // 2],
+        "p95_s": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max_s": ordered[-1],
+        "ops_per_s": 1 / mean if mean > 0 else 0.0,
+    }
+    if nbytes:
+        result["mb_per_s"] = nbytes / mean / 1e6 if mean > 0 else 0.0
+    return result
+
+
+def window_cases(args: argparse.Namespace) -> Iterator[Tuple[str, Tuple[int, int], str, int]]:
+    for backend in args.backends:
+        for resolution in args.resolutions:
+            for pixel_format in FORMATS[backend]:
+                for num_buffers in args.num_buffers:
+                    yield (backend, resolution, pixel_format, num_buffers)
+
+
+def bench_window(
+    backend: str, resolution: Tuple[int, int], pixel_format: str, num_buffers: int, iterations: int, directory: str
+) -> List[Dict[str, Any]]:
+    width, height = resolution
+    display = open_display(backend, directory)
+    window = display.open_window((0, 0, width, height), resolution, 1, num_buffers=num_buffers, pixel_format=pixel_format)
+    image = bytes(image_size(pixel_format, width, height))
+    region = bytes(image_size(pixel_format, *REGION))
+
+    def blit() -> None:
+        window.blit(image)
+
+    def blit_update() -> None:
+        window.blit(image)
+        window.update()
+
+    def clear_update() -> None:
+        window.clear((16, 32, 64))
+        window.update()
+
+    def region_update() -> None:
+        window.blit_region(region, (0, 0) + REGION)
+        window.update()
+
+    # update() does nothing without a new frame, so it is timed after each blit
+    update_samples = []
+    for _ in range(iterations):
+        window.blit(image)
+        start = time.perf_counter()
+        window.update()
+        update_samples.append(time.perf_counter() - start)
+
+    results = {
+        "blit": summarize(measure(blit, iterations), len(image)),
+        "update": summarize(update_samples),
+        "blit+update": summarize(measure(blit_update, iterations), len(image)),
+        "clear+update": summarize(measure(clear_update, iterations)),
+    }
+    if pixel_format != "NV12":
+        results["blit_region+update"] = summarize(measure(region_update, iterations), len(region))
+    window.close()
+    display.close()
+    return [
+        {
+            "backend": backend,
+            "op": op,
+            "width": width,
+            "height": height,
+            "pixel_format": pixel_format,
+            "num_buffers": num_buffers,
+            **summary,
+        }
+        for op, summary in results.items()
+    ]
+
+
+def bench_open_display(backend: str, iterations: int, directory: str) -> Dict[str, Any]:
+    def open_close() -> None:
+        open_display(backend, directory).close()
+
+    return {"backend": backend, "op": "open_display", **summarize(measure(open_close, iterations, warmup=1))}
+
+
+def bench_import(iterations: int) -> Dict[str, Any]:
+    # Cold import in fresh interpreters, which includes library discovery if it is done on import
+    code = "import actfw_raspberrypi.vc4.dispmanx, actfw_raspberrypi.vc4.drm, actfw_raspberrypi.vc4.shm"
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=ROOT)
+        samples.append(time.perf_counter() - start)
+    return {"backend": "all", "op": "import", **summarize(samples)}
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Ratio of the mean latency of each result to that of the same case in the baseline"""
+    means = {tuple(r.get(k) for k in KEYS): r["mean_s"] for r in baseline}
+    ratios = []
+    for r in results:
+        key = tuple(r.get(k) for k in KEYS)
+        if means.get(key):
+            ratios.append({**{k: r[k] for k in KEYS if k in r}, "ratio": r["mean_s"] / means[key]})
+    return ratios
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument(
+        "--resolutions",
+        nargs="+",
+        type=lambda s: tuple(int(v) for v in s.split("x")),
+        default=RESOLUTIONS,
+        help="window sizes such as 640x480",
+    )
+    parser.add_argument("--num-buffers", nargs="+", type=int, default=NUM_BUFFERS)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--quick", action="store_true", help="only 320x240 with 2 buffers and 5 iterations")
+    parser.add_argument("--device", action="store_true", help="use the real libraries on a Raspberry Pi")
+    parser.add_argument("--output", help="JSON file to write. By default results are written to stdout")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare with")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.resolutions = [(320, 240)]
+        args.num_buffers = [2]
+        args.iterations = 5
+    return args
+
+
+def main(argv: List[str]) -> None:
+    args = parse_args(argv)
+    if not args.device:
+        fakes.install()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in args.backends:
+            results.append(bench_open_display(backend, args.iterations, directory))
+        for backend, resolution, pixel_format, num_buffers in window_cases(args):
+            results += bench_window(backend, resolution, pixel_format, num_buffers, args.iterations, directory)
+    results.append(bench_import(min(args.iterations, 5)))
+
+    report: Dict[str, Any] = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "numpy": pixel._numpy() is not None,
+        "fakes": not args.device,
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            report["compare"] = compare(results, json.load(f)["results"])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,19 @@
+import pytest
+from fakes import FakeBcmHost, FakeDRM
+
+from actfw_raspberrypi.vc4.dispmanx import _bcm_host  # type: ignore
+from actfw_raspberrypi.vc4.drm import drm
+
+
+@pytest.fixture
+def fake_drm(monkeypatch: pytest.MonkeyPatch) -> FakeDRM:
+    lib = FakeDRM()
+    monkeypatch.setattr(drm, "_drm", lib)
+    return lib
+
+
+@pytest.fixture
+def bcm_host(monkeypatch: pytest.MonkeyPatch) -> FakeBcmHost:
+    lib = FakeBcmHost()
+    monkeypatch.setattr(_bcm_host, "lib", lib)
+    return lib
@@ -0,0 +1,428 @@
+"""
+Stand-ins of libdrm and libbcm_host for tests and benchmarks on machines without VideoCore.
+
+They do no display work but keep the memory traffic of the real libraries: dumb buffers are mapped from a memfd
+and dispmanx resources are written by memmove, so blit costs are comparable between releases.
+Objects and properties are reported as the kernel reports them to the client, so that code paths which fail
+on hardware fail here too.
+"""
+
+import mmap
+import os
+import time
+from ctypes import Array, addressof, c_char, c_uint32, c_uint64, c_void_p, cast, memmove
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from actfw_raspberrypi.vc4.dispmanx import PIXEL_FORMATS as DISPMANX_PIXEL_FORMATS  # type: ignore
+from actfw_raspberrypi.vc4.dispmanx import _bcm_host  # type: ignore
+from actfw_raspberrypi.vc4.drm import drm
+from actfw_raspberrypi.vc4.drm.drm import (  # type: ignore
+    DRM_CLIENT_CAP_ATOMIC,
+    DRM_CLIENT_CAP_UNIVERSAL_PLANES,
+    DRM_FORMAT_ARGB8888,
+    DRM_FORMAT_RGB565,
+    DRM_FORMAT_XRGB8888,
+    DRM_IOCTL_GEM_CLOSE,
+    DRM_IOCTL_MODE_CREATE_DUMB,
+    DRM_IOCTL_MODE_DESTROY_DUMB,
+    DRM_IOCTL_MODE_MAP_DUMB,
+    DRM_MODE_ATOMIC_TEST_ONLY,
+    DRM_MODE_CONNECTED,
+    DRM_MODE_PAGE_FLIP_EVENT,
+    DRM_MODE_PROP_ATOMIC,
+    DRM_MODE_PROP_ENUM,
+    DRM_MODE_PROP_IMMUTABLE,
+    DRM_MODE_PROP_RANGE,
+    DRM_PLANE_TYPE_CURSOR,
+    DRM_PLANE_TYPE_OVERLAY,
+    DRM_PLANE_TYPE_PRIMARY,
+    PIXEL_FORMATS,
+    DRMModeConnector,
+    DRMModeCrtc,
+    DRMModeEncoder,
+    DRMModeObjectProperties,
+    DRMModePlane,
+    DRMModePlaneRes,
+    DRMModeProperty,
+    DRMModePropertyEnum,
+    DRMModeResource,
+)
+
+CONNECTOR_ID = 1
+ENCODER_ID = 2
+CRTC_ID = 3
+PRIMARY_PLANE_ID = 9
+OVERLAY_PLANE_ID = 10
+# Properties of planes which are set by atomic commits
+PLANE_STATE_PROPERTIES = ["FB_ID", "CRTC_ID", "CRTC_X", "CRTC_Y", "CRTC_W", "CRTC_H", "SRC_X", "SRC_Y", "SRC_W", "SRC_H"]
+EBUSY = 16
+EINVAL = 22
+
+
+class FakeDRM:
+    """
+    libdrm of a vc4-like device with one connected display, a primary plane, overlay planes and a cursor plane.
+
+    Primary and cursor planes are listed only to clients which have set the universal planes or atomic cap,
+    and properties flagged ``DRM_MODE_PROP_ATOMIC`` (FB_ID, CRTC_ID, ...) are reported only to atomic clients.
+    Atomic commits are recorded in ``commits``. Page flips complete at the next ``handle_event()``.
+    Functions which are not modeled return 0.
+    """
+
+    def __init__(
+        self, size: Tuple[int, int] = (1920, 1080), atomic: bool = True, overlays: int = 8, vrefresh: int = 60
+    ) -> None:
+        self.size = size
+        self.atomic = atomic
+        self.vrefresh = vrefresh
+        self.client_caps: Dict[int, int] = {}
+        # prop_id -> (name, flags, enums, range)
+        self.properties: Dict[int, Tuple[str, int, Dict[str, int], Optional[Tuple[int, int]]]] = {}
+        # object_id -> {prop_id: value}
+        self.objects: Dict[int, Dict[int, int]] = {}
+        # plane_id -> (type, formats, crtc_id)
+        self.planes: Dict[int, Tuple[int, List[int], int]] = {}
+        # fb_id -> (width, height, DRM format, pitches, offsets)
+        self.fbs: Dict[int, Tuple[int, int, int, List[int], List[int]]] = {}
+        # (flags, plane_id -> property name -> value)
+        self.commits: List[Tuple[int, Dict[int, Dict[str, int]]]] = []
+        self.set_properties: List[Tuple[int, int, int]] = []
+        # drmModeSetPlane() calls as (plane_id, crtc_id, fb_id)
+        self.set_planes: List[Tuple[int, int, int]] = []
+        self.closed_handles: List[int] = []
+        self.test_result = 0
+        self.flip_pending = False
+        self.get_property_calls = 0
+        self.handle_event_calls = 0
+        self._sequence = 0
+        self._next_id = 1000
+        self._fd = -1
+        self._end = 0
+        # handle -> (offset, size)
+        self._handles: Dict[int, Tuple[int, int]] = {}
+        self._requests: Dict[int, List[Tuple[int, int, int]]] = {}
+        self._keep: List[Any] = []
+
+        zpos_range = (0, overlays + 1)
+        formats = sorted({drm_format for drm_format, _ in PIXEL_FORMATS.values()})
+        # The primary plane shows the console
+        primary_formats = [DRM_FORMAT_XRGB8888, DRM_FORMAT_RGB565]
+        self.add_plane(PRIMARY_PLANE_ID, DRM_PLANE_TYPE_PRIMARY, 0, zpos_range, primary_formats, crtc_id=CRTC_ID)
+        for i in range(overlays):
+            self.add_plane(OVERLAY_PLANE_ID + i, DRM_PLANE_TYPE_OVERLAY, i + 1, zpos_range, formats)
+        self.add_plane(OVERLAY_PLANE_ID + overlays, DRM_PLANE_TYPE_CURSOR, overlays + 1, zpos_range, [DRM_FORMAT_ARGB8888])
+
+    def add_property(
+        self,
+        object_id: int,
+        name: str,
+        value: int,
+        flags: int = DRM_MODE_PROP_RANGE,
+        enums: Optional[Dict[str, int]] = None,
+        range: Optional[Tuple[int, int]] = None,
+    ) -> int:
+        prop_id = len(self.properties) + 1
+        self.properties[prop_id] = (name, flags, enums or {}, range)
+        self.objects.setdefault(object_id, {})[prop_id] = value
+        return prop_id
+
+    def add_plane(
+        self, plane_id: int, type: int, zpos: int, zpos_range: Tuple[int, int], formats: List[int], crtc_id: int = 0
+    ) -> None:
+        self.planes[plane_id] = (type, formats, crtc_id)
+        types = {"Overlay": DRM_PLANE_TYPE_OVERLAY, "Primary": DRM_PLANE_TYPE_PRIMARY, "Cursor": DRM_PLANE_TYPE_CURSOR}
+        self.add_property(plane_id, "type", type, DRM_MODE_PROP_ENUM | DRM_MODE_PROP_IMMUTABLE, enums=types)
+        self.add_property(plane_id, "zpos", zpos, range=zpos_range)
+        self.add_property(plane_id, "alpha", 0xFFFF, range=(0, 0xFFFF))
+        for name in PLANE_STATE_PROPERTIES:
+            self.add_property(plane_id, name, 0, flags=DRM_MODE_PROP_RANGE | DRM_MODE_PROP_ATOMIC, range=(0, 0xFFFFFFFF))
+
+    def plane_values(self, plane_id: int) -> Dict[str, int]:
+        """Current property values of a plane by name"""
+        return {self.properties[prop_id][0]: value for prop_id, value in self.objects[plane_id].items()}
+
+    def flips(self) -> List[Dict[int, Dict[str, int]]]:
+        """Planes updated by each atomic commit with a page flip event"""
+        return [planes for flags, planes in self.commits if flags & DRM_MODE_PAGE_FLIP_EVENT]
+
+    def open(self, *_args: Any) -> int:
+        self._fd = os.memfd_create("fake-drm")
+        return self._fd
+
+    def close(self, fd: int) -> int:
+        os.close(fd)
+        return 0
+
+    def support_dumb_buffer(self, _fd: int) -> bool:
+        return True
+
+    def set_client_cap(self, _fd: int, cap: int, value: int) -> int:
+        if cap == DRM_CLIENT_CAP_ATOMIC and not self.atomic:
+            return -EINVAL
+        self.client_caps[cap] = value
+        return 0
+
+    def get_resources(self, _fd: int) -> Any:
+        res = DRMModeResource()
+        res.count_connectors = 1
+        res._connectors = self._array(c_uint32, [CONNECTOR_ID])
+        res.count_crtcs = 1
+        res._crtcs = self._array(c_uint32, [CRTC_ID])
+        return res
+
+    def get_connector(self, _fd: int, connector_id: int) -> Any:
+        conn = DRMModeConnector()
+        conn.connector_id = connector_id
+        conn.encoder_id = ENCODER_ID
+        conn.connection = DRM_MODE_CONNECTED
+        return conn
+
+    def get_encoder(self, _fd: int, encoder_id: int) -> Any:
+        enc = DRMModeEncoder()
+        enc.encoder_id = encoder_id
+        enc.crtc_id = CRTC_ID
+        return enc
+
+    def get_crtc(self, _fd: int, crtc_id: int) -> Any:
+        crtc = DRMModeCrtc()
+        crtc.crtc_id = crtc_id
+        crtc.mode.hdisplay, crtc.mode.vdisplay = self.size
+        crtc.mode.vrefresh = self.vrefresh
+        return crtc
+
+    def get_plane_resources(self, _fd: int) -> Any:
+        universal = self.client_caps.get(DRM_CLIENT_CAP_UNIVERSAL_PLANES) or self.client_caps.get(DRM_CLIENT_CAP_ATOMIC)
+        plane_ids = [plane_id for plane_id, (type, _, _) in self.planes.items() if universal or type == DRM_PLANE_TYPE_OVERLAY]
+        res = DRMModePlaneRes()
+        res.count_planes = len(plane_ids)
+        res.planes = self._array(c_uint32, plane_ids)
+        return res
+
+    def get_plane(self, _fd: int, plane_id: int) -> Any:
+        _, formats, crtc_id = self.planes[plane_id]
+        plane = DRMModePlane()
+        plane.plane_id = plane_id
+        plane.crtc_id = crtc_id
+        plane.count_formats = len(formats)
+        plane.formats = self._array(c_uint32, formats)
+        plane.possible_crtcs = 1
+        return plane
+
+    def get_property(self, _fd: int, prop_id: int) -> Any:
+        self.get_property_calls += 1
+        name, flags, enums, range = self.properties[prop_id]
+        prop = DRMModeProperty()
+        prop.prop_id = prop_id
+        prop.flags = flags
+        prop.name = name.encode()
+        entries = (DRMModePropertyEnum * max(len(enums), 1))()
+        for i, (enum_name, value) in enumerate(enums.items()):
+            entries[i].name = enum_name.encode()
+            entries[i].value = value
+        prop.count_enums = len(enums)
+        prop.enums = entries
+        prop.count_values = 2 if range else 0
+        prop.values = self._array(c_uint64, list(range or (0, 0)))
+        self._keep.append(entries)
+        return prop
+
+    def get_property_blob(self, *_args: Any) -> None:
+        return None
+
+    def get_object_properties(self, _fd: int, object_id: int, _object_type: int) -> Any:
+        atomic = self.client_caps.get(DRM_CLIENT_CAP_ATOMIC)
+        entries = [
+            (prop_id, value)
+            for prop_id, value in self.objects.get(object_id, {}).items()
+            if atomic or not self.properties[prop_id][1] & DRM_MODE_PROP_ATOMIC
+        ]
+        props = DRMModeObjectProperties()
+        props.count_props = len(entries)
+        props.props = self._array(c_uint32, [prop_id for prop_id, _ in entries])
+        props.prop_values = self._array(c_uint64, [value for _, value in entries])
+        return props
+
+    def set_object_property(self, _fd: int, object_id: int, _object_type: int, prop_id: int, value: int) -> int:
+        self.set_properties.append((object_id, prop_id, value))
+        self.objects[object_id][prop_id] = value
+        return 0
+
+    def set_plane(self, _fd: int, plane_id: int, crtc_id: int, fb_id: int, *_args: Any) -> int:
+        self.set_planes.append((plane_id, crtc_id, fb_id))
+        return 0
+
+    def ioctl(self, fd: int, request: int, arg: Any) -> int:
+        req = arg._obj
+        if request == DRM_IOCTL_MODE_CREATE_DUMB:
+            req.pitch = (req.width * req.bpp // 8 + 63) // 64 * 64
+            req.size = req.pitch * req.height
+            req.handle = self._new_id()
+            offset = self._end
+            self._end += (req.size + mmap.PAGESIZE - 1) // mmap.PAGESIZE * mmap.PAGESIZE
+            os.ftruncate(fd, self._end)
+            self._handles[req.handle] = (offset, req.size)
+        elif request == DRM_IOCTL_MODE_MAP_DUMB:
+            req.offset = self._handles[req.handle][0]
+        elif request in (DRM_IOCTL_MODE_DESTROY_DUMB, DRM_IOCTL_GEM_CLOSE):
+            self.closed_handles.append(req.handle)
+        return 0
+
+    def add_fb(
+        self,
+        _fd: int,
+        width: int,
+        height: int,
+        drm_format: int,
+        _handles: Any,
+        pitches: Any,
+        offsets: Any,
+        fb: Any,
+        _flags: int,
+    ) -> int:
+        fb_id = self._new_id()
+        self.fbs[fb_id] = (width, height, drm_format, list(pitches), list(offsets))
+        fb._obj.value = fb_id
+        return 0
+
+    def rm_fb(self, _fd: int, fb_id: int) -> int:
+        del self.fbs[fb_id]
+        return 0
+
+    def prime_fd_to_handle(self, _fd: int, dmabuf_fd: int, handle: Any) -> int:
+        handle._obj.value = self._new_id()
+        return 0
+
+    def atomic_alloc(self) -> int:
+        req = self._new_id()
+        self._requests[req] = []
+        return req
+
+    def atomic_free(self, req: int) -> None:
+        del self._requests[req]
+
+    def atomic_add_property(self, req: int, object_id: int, prop_id: int, value: int) -> int:
+        self._requests[req].append((object_id, prop_id, value))
+        return len(self._requests[req])
+
+    def atomic_commit(self, _fd: int, req: int, flags: int, _user_data: Any) -> int:
+        if not self.client_caps.get(DRM_CLIENT_CAP_ATOMIC):
+            return -EINVAL
+        entries = self._requests[req]
+        if any(prop_id not in self.objects.get(object_id, {}) for object_id, prop_id, _ in entries):
+            return -EINVAL
+        if flags & DRM_MODE_ATOMIC_TEST_ONLY:
+            self.commits.append((flags, self._by_plane(entries)))
+            return self.test_result
+        if flags & DRM_MODE_PAGE_FLIP_EVENT:
+            if self.flip_pending:
+                return -EBUSY
+            self.flip_pending = True
+        self.commits.append((flags, self._by_plane(entries)))
+        for object_id, prop_id, value in entries:
+            self.objects[object_id][prop_id] = value
+        return 0
+
+    def handle_event(self, fd: int, context: Any) -> int:
+        self.handle_event_calls += 1
+        if self.flip_pending:
+            self.flip_pending = False
+            self._sequence += 1
+            now = time.monotonic()
+            context._obj.page_flip_handler(fd, self._sequence, int(now), int(now % 1 * 1e6), None)
+        return 0
+
+    def __getattr__(self, _name: str) -> Callable[..., int]:
+        return lambda *_args: 0
+
+    def _by_plane(self, entries: List[Tuple[int, int, int]]) -> Dict[int, Dict[str, int]]:
+        planes: Dict[int, Dict[str, int]] = {}
+        for object_id, prop_id, value in entries:
+            planes.setdefault(object_id, {})[self.properties[prop_id][0]] = value
+        return planes
+
+    def _new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def _array(self, ctype: Any, values: List[int]) -> Any:
+        array = (ctype * max(len(values), 1))(*values)
+        self._keep.append(array)
+        return array
+
+
+class FakeBcmHost:
+    """
+    libbcm_host whose resources are written and read by memmove.
+
+    Asynchronous updates are applied when ``vsync()`` is called, or as soon as they are submitted if ``immediate``.
+    """
+
+    def __init__(self, size: Tuple[int, int] = (1920, 1080), immediate: bool = False) -> None:
+        self.size = size
+        self.immediate = immediate
+        self.submitted: List[Tuple[int, Callable[[int, Any], None]]] = []
+        self.resources: Dict[int, Any] = {}
+        self._handles = 0
+
+    def bcm_host_init(self) -> None:
+        pass
+
+    def vc_dispmanx_display_get_info(self, _display: int, info: Any) -> int:
+        info._obj.width, info._obj.height = self.size
+        return 0
+
+    def vc_dispmanx_resource_create(self, image_type: int, width: int, height: int, _native: Any) -> int:
+        bpp = {image_type: bpp for image_type, bpp in DISPMANX_PIXEL_FORMATS.values()}[image_type]
+        handle = self._new_handle()
+        self.resources[handle] = (c_char * (width * bpp // 8 * height))()
+        return handle
+
+    def vc_dispmanx_resource_write_data(self, resource: int, _image_type: int, pitch: int, src: Any, rect: Any) -> int:
+        r = rect._obj
+        memmove(addressof(self.resources[resource]) + r.y * pitch, _address(src) + r.y * pitch, r.height * pitch)
+        return 0
+
+    def vc_dispmanx_resource_read_data(self, resource: int, rect: Any, dst: Any, pitch: int) -> int:
+        r = rect._obj
+        memmove(_address(dst) + r.y * pitch, addressof(self.resources[resource]) + r.y * pitch, r.height * pitch)
+        return 0
+
+    def vc_dispmanx_resource_delete(self, resource: int) -> int:
+        del self.resources[resource]
+        return 0
+
+    def vc_dispmanx_update_submit(self, update: int, callback: Callable[[int, Any], None], _arg: Any) -> int:
+        self.submitted.append((update, callback))
+        if self.immediate:
+            self.vsync()
+        return 0
+
+    def vsync(self) -> None:
+        submitted, self.submitted = self.submitted, []
+        for update, callback in submitted:
+            callback(update, None)
+
+    def _new_handle(self, *_args: Any) -> int:
+        self._handles += 1
+        return self._handles
+
+    vc_dispmanx_display_open = _new_handle
+    vc_dispmanx_update_start = _new_handle
+    vc_dispmanx_element_add = _new_handle
+
+    def __getattr__(self, _name: str) -> Callable[..., int]:
+        return lambda *_args: 0
+
+
+def _address(buf: Any) -> int:
+    if isinstance(buf, Array):
+        return addressof(buf)
+    address = cast(buf, c_void_p).value
+    assert address is not None
+    return address
+
+
+def install(size: Tuple[int, int] = (1920, 1080)) -> None:
+    """Replace libdrm and libbcm_host of the backends with the stand-ins"""
+    setattr(drm, "_drm", FakeDRM(size))
+    _bcm_host.lib = FakeBcmHost(size, immediate=True)
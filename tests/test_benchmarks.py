@@ -0,0 +1,18 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BENCHMARK = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "bench_display.py")
+
+
+def test_benchmark_runs(tmp_path: Path) -> None:
+    output = tmp_path / "results.json"
+    args = ["--quick", "--iterations", "2", "--output", str(output)]
+    subprocess.run([sys.executable, BENCHMARK, *args], check=True)
+    subprocess.run([sys.executable, BENCHMARK, *args, "--backends", "shm", "--compare", str(output)], check=True)
+    report = json.loads(output.read_text())
+    ops = {(r["backend"], r["op"]) for r in report["results"]}
+    assert ("shm", "blit+update") in ops
+    assert all(r["ratio"] > 0 for r in report["compare"])
@@ -0,0 +1,75 @@
+import time
+from typing import Any, Generator, List
+
+from actfw_core.capture import Frame
+
+from actfw_raspberrypi.capture import PiCameraCapture, PiCameraFrame, PooledFrame, raw_frame_layout
+
+
+class FakeCamera:
+    def __init__(self, frames: List[bytes]) -> None:
+        self.frames = frames
+        self.resolution = (30, 2)
+
+    def capture_sequence(self, outputs: Generator[Any, None, None], *_args: Any, **_kwargs: Any) -> None:
+        frames = iter(self.frames)
+        for output in outputs:
+            frame = next(frames, None)
+            if frame is None:
+                break
+            # picamera may write a frame in chunks
+            output.write(frame[:1])
+            output.write(frame[1:])
+        outputs.close()
+
+
+def test_pooled_frames_are_recycled() -> None:
+    frames = [bytes([i]) * 8 for i in range(5)]
+    capture = PiCameraCapture(FakeCamera(frames), pool_size=2, buffer_size=4)
+    pad_out, pad_in = capture._new_pad().into_pad_pair()
+    capture._add_out_queue(pad_in)
+    capture.run()
+
+    # Frames discarded for newer ones have been returned to the pool
+    frame: Frame[Any] = pad_out.get(timeout=1)
+    assert isinstance(frame, PooledFrame)
+    assert bytes(frame.getvalue()) == frames[-1]
+    assert capture._pool.qsize() == 1
+    assert capture.stats() == {"captured": 5, "delivered": 1, "dropped": 4}
+    assert frame.sequence == 4
+    frame.release()
+    frame.release()
+    assert capture._pool.qsize() == 2
+
+
+def test_raw_frame_layout() -> None:
+    assert raw_frame_layout("rgb", (30, 2)) == (96, 96 * 16)
+    assert raw_frame_layout("yuv", (64, 48)) == (64, 64 * 48 * 3 // 2)
+
+
+def test_raw_frames_carry_layout() -> None:
+    frames = [bytes(96 * 16)]
+    capture = PiCameraCapture(FakeCamera(frames), "rgb", pool_size=2, use_video_port=True)
+    pad_out, pad_in = capture._new_pad().into_pad_pair()
+    capture._add_out_queue(pad_in)
+    capture.run()
+
+    frame = pad_out.get(timeout=1)
+    assert isinstance(frame, PooledFrame)
+    assert (frame.format, frame.resolution, frame.stride) == ("rgb", (30, 2), 96)
+    assert len(frame.getvalue()) == 96 * 16
+
+
+def test_frames_carry_sequence_and_timestamp() -> None:
+    capture = PiCameraCapture(FakeCamera([b"a", b"b"]))
+    pad_out, pad_in = capture._new_pad().into_pad_pair()
+    capture._add_out_queue(pad_in)
+    before = time.monotonic()
+    capture.run()
+
+    frame = pad_out.get(timeout=1)
+    assert isinstance(frame, PiCameraFrame)
+    assert frame.getvalue() == b"b"
+    assert frame.sequence == 1
+    assert before <= frame.timestamp <= time.monotonic()
+    assert capture.stats() == {"captured": 2, "delivered": 1, "dropped": 1}
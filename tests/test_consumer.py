@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Any, List, Tuple
+
+import pytest
+from actfw_core.util.pad import _PadBlocking
+
+from actfw_raspberrypi.vc4.consumer import DisplayConsumer
+
+
+class FakeWindow:
+    def __init__(self) -> None:
+        self.shown: List[int] = []
+        self.closed = False
+        self.gate = threading.Event()
+
+    def blit(self, image: int) -> None:
+        self.gate.wait()
+        self.image = image
+
+    def update(self) -> None:
+        self.shown.append(self.image)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FakeDisplay:
+    def __init__(self) -> None:
+        self.window = FakeWindow()
+        self.pixel_format = ""
+
+    def open_window(
+        self,
+        dst: Tuple[int, int, int, int],
+        size: Tuple[int, int],
+        layer: int,
+        *,
+        num_buffers: int = 2,
+        pixel_format: str = "RGB",
+    ) -> Any:
+        self.pixel_format = pixel_format
+        return self.window
+
+
+def test_display_consumer_shows_latest_image_without_blocking() -> None:
+    display = FakeDisplay()
+    consumer: DisplayConsumer[int] = DisplayConsumer(display, (0, 0, 32, 32), (32, 32), 1)
+    pad_out, pad_in = _PadBlocking[int]().into_pad_pair()
+    consumer._add_in_queue(pad_out)
+    consumer.start()
+
+    # The window is stuck in blit(), but the upstream is never blocked.
+    for i in range(10):
+        pad_in.put(i, timeout=1)
+    time.sleep(0.1)
+    display.window.gate.set()
+    time.sleep(0.1)
+
+    consumer.stop()
+    consumer.join()
+    assert display.window.shown[-1] == 9
+    assert len(display.window.shown) < 10
+    assert display.window.closed
+
+
+class FailingConsumer(DisplayConsumer[int]):
+    def render(self, image: int) -> None:
+        raise ValueError(f"can not draw {image}")
+
+
+def test_display_consumer_stops_when_drawing_fails() -> None:
+    display = FakeDisplay()
+    consumer = FailingConsumer(display, (0, 0, 32, 32), (32, 32), 1, pixel_format="BGRA")
+    assert display.pixel_format == "BGRA"
+    pad_out, pad_in = _PadBlocking[int]().into_pad_pair()
+    consumer._add_in_queue(pad_out)
+    pad_in.put(7, timeout=1)
+
+    with pytest.raises(ValueError, match="can not draw 7"):
+        consumer.run()
+    assert not consumer._is_running()
+    assert display.window.closed
@@ -0,0 +1,106 @@
+import pytest
+from fakes import FakeBcmHost
+
+from actfw_raspberrypi.vc4.dispmanx import Display, _pointer  # type: ignore
+
+
+def test_update_returns_before_vsync(bcm_host: FakeBcmHost) -> None:
+    display = Display()
+    window = display.open_window((0, 0, 32, 2), (32, 2), 1, num_buffers=3)
+    for _ in range(2):
+        window.blit(bytes(32 * 2 * 3))
+        window.update()
+    assert len(window.chain.queued) == 2
+    bcm_host.vsync()
+    assert window.chain.queued == []
+    assert window.chain.scanout == window.resources[2]
+    window.close()
+    display.close()
+
+
+def test_batch_submits_one_update(bcm_host: FakeBcmHost) -> None:
+    display = Display()
+    windows = [display.open_window((0, 0, 32, 2), (32, 2), layer, num_buffers=2) for layer in (1, 2)]
+    with display.batch():
+        for window in windows:
+            window.blit(bytes(32 * 2 * 3))
+            window.update()
+        assert bcm_host.submitted == []
+        with pytest.raises(RuntimeError):
+            windows[0].blit(bytes(32 * 2 * 3))
+    assert len(bcm_host.submitted) == 1
+    bcm_host.vsync()
+    assert all(window.chain.scanout == window.resources[1] for window in windows)
+
+
+def test_blit_pads_unaligned_width(bcm_host: FakeBcmHost) -> None:
+    display = Display()
+    window = display.open_window((0, 0, 30, 2), (30, 2), 1)
+    assert window.pitch() == 96
+    window.blit(bytes(range(90)) * 2)
+    assert window._shadow[:90] == bytes(range(90))
+    assert window._shadow[96:186] == bytes(range(90))
+    padded = bytearray(96 * 2)
+    window.blit(padded, stride=window.pitch())
+    assert window._shadow == padded
+
+
+def test_blit_region_keeps_frame_blitted_before_it(bcm_host: FakeBcmHost) -> None:
+    red, green, blue = bytes([255, 0, 0]), bytes([0, 255, 0]), bytes([0, 0, 255])
+    display = Display()
+    window = display.open_window((0, 0, 32, 8), (32, 8), 1)
+    pitch = window.pitch()
+    window.clear((255, 0, 0))
+    window.blit_region(green * 4, (0, 0, 2, 2))
+    window.update()
+    bcm_host.vsync()
+    window.blit_region(blue * 4, (4, 4, 2, 2))
+    back = bcm_host.resources[window.chain.back]
+    assert back[20 * 3 : 21 * 3] == red
+    assert back[pitch : pitch + 3] == green
+    assert back[4 * pitch + 4 * 3 : 4 * pitch + 5 * 3] == blue
+    window.close()
+    display.close()
+
+
+def test_rgba_window(bcm_host: FakeBcmHost) -> None:
+    display = Display()
+    window = display.open_window((0, 0, 8, 1), (8, 1), 1, pixel_format="RGBA")
+    assert window.pitch() == 32 * 4
+    window.clear((0, 0, 0, 0))
+    assert window._shadow[: 8 * 4] == bytes(8 * 4)
+
+
+def test_rgb565_window_packs_rgb(bcm_host: FakeBcmHost) -> None:
+    display = Display()
+    window = display.open_window((0, 0, 2, 1), (2, 1), 1, pixel_format="RGB565")
+    window.blit(bytes([255, 0, 0, 0, 0, 255]))
+    assert window._shadow[:4] == bytes([0x00, 0xF8, 0x1F, 0x00])
+
+
+def test_pointer_shares_writable_buffer() -> None:
+    image = bytearray(6)
+    buf = _pointer(memoryview(image), 6)
+    buf[0] = b"\x01"
+    assert image[0] == 1
+
+
+def test_pointer_rejects_small_or_strided_image() -> None:
+    with pytest.raises(RuntimeError):
+        _pointer(b"\x00" * 5, 6)
+    with pytest.raises(RuntimeError):
+        _pointer(memoryview(bytearray(12))[::2], 6)
+
+
+def test_window_stats(bcm_host: FakeBcmHost) -> None:
+    display = Display()
+    window = display.open_window((0, 0, 32, 2), (32, 2), 1, num_buffers=3)
+    window.blit(bytes(32 * 2 * 3))
+    window.update()
+    stats = window.stats()
+    assert stats["frames_presented"] == 0
+    assert stats["bytes_per_frame"] == 32 * 2 * 3
+    bcm_host.vsync()
+    stats = window.stats()
+    assert stats["frames_presented"] == 1
+    assert stats["blit"]["count"] == 1 and stats["update"]["count"] == 1 and stats["flip"]["count"] == 1
@@ -0,0 +1,432 @@
+import select
+import time
+from ctypes import c_uint32
+from typing import Any, List
+
+import pytest
+from fakes import CRTC_ID, EINVAL, OVERLAY_PLANE_ID, FakeDRM
+
+from actfw_raspberrypi.vc4.drm import drm
+from actfw_raspberrypi.vc4.drm.display import Display  # type: ignore
+from actfw_raspberrypi.vc4.drm.drm import (  # type: ignore
+    DRM_FORMAT_BGR888,
+    DRM_FORMAT_NV12,
+    DRM_FORMAT_YUV420,
+    DRM_MODE_OBJECT_PLANE,
+    DRM_MODE_PROP_ENUM,
+    DRM_MODE_PROP_IMMUTABLE,
+    DRM_MODE_PROP_RANGE,
+    DRMModePlane,
+    Framebuffer,
+    Plane,
+    PlaneAllocator,
+    PropertyIndex,
+)
+
+# Planes made by the tests, apart from the planes of the fake device
+PLANE_ID = 100
+SIZE = (64, 32)
+IMAGE = bytes(64 * 32 * 3)
+
+
+def make_plane(plane_id: int, formats: List[int] = [DRM_FORMAT_BGR888]) -> Any:
+    raw = DRMModePlane()
+    raw.plane_id = plane_id
+    raw.count_formats = len(formats)
+    raw.formats = (c_uint32 * len(formats))(*formats)
+    raw.possible_crtcs = 1
+    return raw
+
+
+def test_property_index_fetches_metadata_once(fake_drm: FakeDRM) -> None:
+    fake_drm.add_property(PLANE_ID, "zpos", 3, range=(0, 7))
+    blend = fake_drm.add_property(
+        PLANE_ID, "pixel blend mode", 1, flags=DRM_MODE_PROP_ENUM, enums={"None": 0, "Pre-multiplied": 1, "Coverage": 2}
+    )
+    index = PropertyIndex(0)
+    for _ in range(3):
+        properties, values = index.object_properties(PLANE_ID, DRM_MODE_OBJECT_PLANE)
+    assert fake_drm.get_property_calls == 2
+    assert values == {"zpos": 3, "pixel blend mode": 1}
+    assert properties["zpos"].range == (0, 7)
+    assert properties["pixel blend mode"].enums["Coverage"] == 2
+
+    plane = Plane(0, make_plane(PLANE_ID), index)
+    assert plane.zpos == 3
+    plane._set_blend_mode("Coverage")
+    plane._set_blend_mode("Unknown")
+    assert fake_drm.set_properties == [(PLANE_ID, blend, 2)]
+    assert fake_drm.get_property_calls == 2
+
+
+def make_planes(fake_drm: FakeDRM, formats: List[List[int]], flags: int = DRM_MODE_PROP_RANGE) -> List[Any]:
+    index = PropertyIndex(0)
+    planes = []
+    for zpos, plane_formats in enumerate(formats):
+        plane_id = PLANE_ID + zpos
+        fake_drm.add_property(plane_id, "zpos", zpos, flags=flags, range=(0, len(formats) - 1))
+        planes.append(Plane(0, make_plane(plane_id, plane_formats), index))
+    return planes
+
+
+def test_allocator_picks_plane_at_layer(fake_drm: FakeDRM) -> None:
+    planes = make_planes(fake_drm, [[DRM_FORMAT_BGR888]] * 3)
+    allocator = PlaneAllocator(planes)
+    plane = allocator.pick(1)
+    assert plane is planes[1]
+    with pytest.raises(RuntimeError):
+        allocator.pick(1)
+    allocator.free(plane)
+    assert allocator.pick(1) is plane
+    assert fake_drm.set_properties == []
+
+
+def test_allocator_moves_plane_supporting_format(fake_drm: FakeDRM) -> None:
+    rgb = DRM_FORMAT_BGR888
+    nv12 = DRM_FORMAT_NV12
+    planes = make_planes(fake_drm, [[rgb], [rgb], [rgb, nv12]])
+    allocator = PlaneAllocator(planes)
+    # The plane at layer 1 can not show NV12, so the plane supporting it is moved there
+    plane = allocator.pick(1, "NV12")
+    assert plane is planes[2] and plane.zpos == 1
+    assert fake_drm.set_properties == [(plane.plane_id, plane.prop_ids["zpos"], 1)]
+    # RGB windows are not given to the plane with more formats when another plane is at the layer
+    allocator.free(plane)
+    assert allocator.pick(1, "RGB") is planes[1]
+
+
+def test_allocator_does_not_move_immutable_zpos(fake_drm: FakeDRM) -> None:
+    planes = make_planes(fake_drm, [[DRM_FORMAT_BGR888]] * 2, flags=DRM_MODE_PROP_RANGE | DRM_MODE_PROP_IMMUTABLE)
+    allocator = PlaneAllocator(planes)
+    with pytest.raises(RuntimeError, match=r"layer value must be in \[0, 1\]"):
+        allocator.pick(2)
+
+
+def test_atomic_properties_are_resolved_after_enabling_atomic(fake_drm: FakeDRM) -> None:
+    with Display() as display:
+        assert display.device.page_flip
+        # Primary and cursor planes are listed to atomic clients, but windows use overlay planes only
+        assert [p.plane_id for p in display.device.planes] == list(range(OVERLAY_PLANE_ID, OVERLAY_PLANE_ID + 8))
+        window = display.open_window((0, 0, 64, 32), (64, 32), 1)
+        window.blit(bytes(64 * 32 * 3))
+        window.update()
+        (fb,) = window.chain.queued
+        (flip,) = fake_drm.flips()
+        assert list(flip) == [window.plane.plane_id]
+        assert flip[window.plane.plane_id]["FB_ID"] == fb.fb_id
+        window.close()
+
+
+def test_planes_are_set_without_atomic(monkeypatch: pytest.MonkeyPatch) -> None:
+    lib = FakeDRM(atomic=False)
+    monkeypatch.setattr(drm, "_drm", lib)
+    with Display() as display:
+        assert not display.device.page_flip
+        window = display.open_window((0, 0, 64, 32), (64, 32), 1)
+        window.blit(bytes(64 * 32 * 3))
+        window.update()
+        assert lib.set_planes[-1] == (window.plane.plane_id, CRTC_ID, window.chain.scanout.fb_id)
+        assert lib.commits == []
+        window.close()
+
+
+def flipped_fbs(fake_drm: FakeDRM, plane_id: int) -> List[int]:
+    return [flip[plane_id]["FB_ID"] for flip in fake_drm.flips() if plane_id in flip]
+
+
+def test_updates_are_deferred_while_flip_is_in_flight(fake_drm: FakeDRM) -> None:
+    with Display() as display:
+        window = display.open_window((0, 0) + SIZE, SIZE, 1, num_buffers=4)
+        fbs = window.chain.buffers
+        for _ in range(3):
+            window.blit(IMAGE)
+            window.update()
+        # The second frame is replaced by the third before the first flip completes
+        assert flipped_fbs(fake_drm, window.plane.plane_id) == [fbs[1].fb_id]
+        assert window.chain.queued == [fbs[1], fbs[3]]
+        assert window.stats()["frames_dropped"] == 1
+        # The deferred frame is committed when the flip event is handled
+        display.device.wait(lambda: window.chain.scanout is fbs[1])
+        assert fake_drm.handle_event_calls == 1
+        assert flipped_fbs(fake_drm, window.plane.plane_id) == [fbs[1].fb_id, fbs[3].fb_id]
+        assert window.chain.queued == [fbs[3]]
+        window.close()
+
+
+def test_flip_latency_is_measured_from_commit(fake_drm: FakeDRM) -> None:
+    with Display() as display:
+        window = display.open_window((0, 0) + SIZE, SIZE, 1, num_buffers=3)
+        fbs = window.chain.buffers
+        for _ in range(2):
+            window.blit(IMAGE)
+            window.update()
+        # The first flip completes late and the deferred second frame is committed after it
+        time.sleep(0.05)
+        display.device.wait(lambda: window.chain.scanout is fbs[2])
+        stats = window.stats()
+        assert stats["frames_presented"] == 2
+        # Only the first frame waited for a late vblank
+        assert sum(stats["flip"]["counts"][:5]) == 1
+        assert stats["flip"]["max_s"] >= 0.05
+        window.close()
+
+
+def test_drawing_waits_only_without_free_buffer(fake_drm: FakeDRM) -> None:
+    with Display() as display:
+        window = display.open_window((0, 0) + SIZE, SIZE, 1, num_buffers=3)
+        fbs = window.chain.buffers
+        for _ in range(2):
+            window.blit(IMAGE)
+            window.update()
+        assert fake_drm.handle_event_calls == 0
+        # The first buffer is scanned out, the second is in flight and the third is deferred
+        window.blit(IMAGE)
+        assert fake_drm.handle_event_calls == 1
+        assert window.chain.back is fbs[0]
+        assert flipped_fbs(fake_drm, window.plane.plane_id) == [fbs[1].fb_id, fbs[2].fb_id]
+        assert window.stats()["buffer_waits"] == 1
+        window.close()
+
+
+def test_window_presents_after_failed_commit(fake_drm: FakeDRM) -> None:
+    with Display() as display:
+        window = display.open_window((0, 0) + SIZE, SIZE, 1, num_buffers=2)
+        fbs = window.chain.buffers
+        # The driver rejects the flip with -EBUSY
+        fake_drm.flip_pending = True
+        window.blit(IMAGE)
+        with pytest.raises(RuntimeError, match="fail to commit atomic request"):
+            window.update()
+        fake_drm.flip_pending = False
+        assert window.chain.queued == [] and list(window.chain.free) == [fbs[1]]
+        assert window.stats()["frames_dropped"] == 1
+
+        window.blit(IMAGE)
+        window.update()
+        display.device.wait(lambda: window.chain.scanout is fbs[1])
+        assert window.stats()["frames_presented"] == 1
+        window.close()
+
+
+def test_flip_timeout(fake_drm: FakeDRM, monkeypatch: pytest.MonkeyPatch) -> None:
+    display = Display()
+    window = display.open_window((0, 0) + SIZE, SIZE, 1, num_buffers=2)
+    window.blit(IMAGE)
+    window.update()
+    with monkeypatch.context() as m:
+        m.setattr(select, "select", lambda *_args: ([], [], []))
+        with pytest.raises(RuntimeError, match="timed out waiting for page flip"):
+            window.blit(IMAGE)
+    window.close()
+    display.close()
+
+
+def test_batch_commits_windows_at_once(fake_drm: FakeDRM) -> None:
+    with Display() as display:
+        windows = [display.open_window((0, 0) + SIZE, SIZE, layer) for layer in (1, 2)]
+        commits = len(fake_drm.commits)
+        with display.batch():
+            for window in windows:
+                window.blit(IMAGE)
+                window.update()
+            assert len(fake_drm.commits) == commits
+        assert len(fake_drm.commits) == commits + 1
+        (flip,) = fake_drm.flips()
+        assert sorted(flip) == sorted(window.plane.plane_id for window in windows)
+        for window in windows:
+            window.close()
+
+
+def test_window_rejected_by_test_commit_is_cleaned_up(fake_drm: FakeDRM) -> None:
+    with Display() as display:
+        fake_drm.test_result = -EINVAL
+        with pytest.raises(RuntimeError, match="layer 1 can not show"):
+            display.open_window((0, 0) + SIZE, SIZE, 1)
+        # Framebuffers are removed and the plane is disabled and returned
+        assert fake_drm.fbs == {}
+        assert fake_drm.set_planes == [(OVERLAY_PLANE_ID, 0, 0)]
+        fake_drm.test_result = 0
+        window = display.open_window((0, 0) + SIZE, SIZE, 1)
+        assert window.plane.plane_id == OVERLAY_PLANE_ID
+        window.close()
+
+
+def test_window_failing_to_create_framebuffers_is_cleaned_up(fake_drm: FakeDRM, monkeypatch: pytest.MonkeyPatch) -> None:
+    with Display() as display:
+        create_fb = display.device.create_fb
+        created: List[Any] = []
+
+        def create_one_fb(*args: Any, **kwargs: Any) -> Any:
+            if created:
+                raise RuntimeError("fail to create dumb")
+            created.append(create_fb(*args, **kwargs))
+            return created[-1]
+
+        with monkeypatch.context() as m:
+            m.setattr(display.device, "create_fb", create_one_fb)
+            with pytest.raises(RuntimeError, match="fail to create dumb"):
+                display.open_window((0, 0) + SIZE, SIZE, 1, num_buffers=3)
+        # The framebuffer created before the failure is removed and the plane is returned
+        assert fake_drm.fbs == {}
+        assert fake_drm.set_planes == [(OVERLAY_PLANE_ID, 0, 0)]
+        window = display.open_window((0, 0) + SIZE, SIZE, 1)
+        assert window.plane.plane_id == OVERLAY_PLANE_ID
+        window.close()
+
+
+def test_set_layer_keeps_plane_until_new_plane_is_accepted(fake_drm: FakeDRM) -> None:
+    with Display() as display:
+        window = display.open_window((0, 0) + SIZE, SIZE, 1)
+        plane = window.plane
+        fake_drm.set_planes.clear()
+        fake_drm.test_result = -EINVAL
+        with pytest.raises(RuntimeError, match="layer 3 can not show"):
+            window.set_layer(3)
+        # Only the rejected plane is disabled and returned
+        assert window.plane is plane and plane.zpos == 1
+        assert [plane_id for plane_id, _, _ in fake_drm.set_planes] == [OVERLAY_PLANE_ID + 2]
+        assert 3 in display.device.allocator.zposs()
+
+        fake_drm.test_result = 0
+        window.set_layer(3)
+        assert window.plane.zpos == 3
+        assert fake_drm.set_planes[-1] == (plane.plane_id, 0, 0)
+        assert 1 in display.device.allocator.zposs()
+        window.close()
+
+
+def test_swap_layer_exchanges_zpos(fake_drm: FakeDRM) -> None:
+    with Display() as display:
+        windows = [display.open_window((0, 0) + SIZE, SIZE, layer) for layer in (1, 2)]
+        planes = [window.plane for window in windows]
+        windows[0].swap_layer(windows[1])
+        assert [window.plane for window in windows] == planes
+        assert [plane.zpos for plane in planes] == [2, 1]
+        assert [fake_drm.plane_values(plane.plane_id)["zpos"] for plane in planes] == [2, 1]
+        for window in windows:
+            window.close()
+
+
+def test_blit_region_keeps_frame_drawn_before_it(fake_drm: FakeDRM) -> None:
+    red, green, blue = bytes([255, 0, 0]), bytes([0, 255, 0]), bytes([0, 0, 255])
+    with Display() as display:
+        window = display.open_window((0, 0, 8, 8), (8, 8), 1)
+        window.clear((255, 0, 0))
+        window.blit_region(green * 4, (0, 0, 2, 2))
+        window.update()
+        window.blit_region(blue * 4, (4, 4, 2, 2))
+        pitch = window.pitch()
+        with window.chain.back.view() as view:
+            assert view[7 * 3 : 8 * 3] == red
+            assert view[pitch : pitch + 3] == green
+            assert view[4 * pitch + 4 * 3 : 4 * pitch + 5 * 3] == blue
+        window.close()
+
+
+def test_framebuffer_write_copies_rows_to_pitch(fake_drm: FakeDRM) -> None:
+    fb = Framebuffer(fake_drm.open(), 3, 2, pixel_format="RGB")
+    assert fb.pitch == 64
+    packed = bytes(range(18))
+    fb.write(packed)
+    with fb.view() as view:
+        assert view[:9] == packed[:9] and view[64:73] == packed[9:]
+    # Rows 12 bytes apart. Padding of the last row may be omitted.
+    strided = bytes(range(100, 109)) + bytes(3) + bytes(range(200, 209))
+    fb.write(strided, stride=12)
+    with fb.view() as view:
+        assert view[:9] == strided[:9] and view[64:73] == strided[12:]
+    with pytest.raises(RuntimeError, match="image is too small: 20 < 21"):
+        fb.write(strided[:-1], stride=12)
+    with pytest.raises(RuntimeError, match="image is too small"):
+        fb.write(packed[:-1])
+    fb.close()
+
+
+def test_framebuffer_array_has_pitch_stride(fake_drm: FakeDRM) -> None:
+    pytest.importorskip("numpy")
+    fb = Framebuffer(fake_drm.open(), 3, 2, pixel_format="RGB")
+    array = fb.array()
+    assert array.shape == (2, 3, 3) and array.strides == (fb.pitch, 3, 1)
+    array[1, 2] = (1, 2, 3)
+    del array
+    with fb.view() as view:
+        assert view[fb.pitch + 6 : fb.pitch + 9] == b"\x01\x02\x03"
+    fb.close()
+
+
+def test_yuv_framebuffer_planes(fake_drm: FakeDRM) -> None:
+    fd = fake_drm.open()
+    # Rows of 48 pixels are padded to 64 bytes by the fake driver
+    nv12 = Framebuffer(fd, 48, 4, pixel_format="NV12")
+    assert fake_drm.fbs[nv12.fb_id] == (48, 4, DRM_FORMAT_NV12, [64, 64, 0, 0], [0, 256, 0, 0])
+    yuv420 = Framebuffer(fd, 48, 4, pixel_format="YUV420")
+    assert fake_drm.fbs[yuv420.fb_id] == (48, 4, DRM_FORMAT_YUV420, [64, 32, 32, 0], [0, 256, 320, 0])
+    with yuv420.view() as view:
+        # Black
+        assert view[:256] == bytes(256) and view[256:] == b"\x80" * 128
+
+    # Packed I420 planes are copied row by row to the plane pitches
+    yuv420.write(b"\x01" * 48 * 4 + b"\x02" * 24 * 2 + b"\x03" * 24 * 2)
+    with yuv420.view() as view:
+        assert view[64 * 3 : 64 * 3 + 48] == b"\x01" * 48
+        assert view[256 + 32 : 256 + 32 + 24] == b"\x02" * 24
+        assert view[320 + 32 : 320 + 32 + 24] == b"\x03" * 24
+        assert view[320 + 32 + 24 : 320 + 64] == b"\x80" * 8
+    nv12.close()
+    yuv420.close()
+
+
+def test_presented_framebuffers_are_released_when_no_longer_scanned_out(fake_drm: FakeDRM) -> None:
+    with Display() as display:
+        window = display.open_window((0, 0) + SIZE, SIZE, 1, pixel_format="NV12")
+        fbs = [display.import_fb(dmabuf_fd, 64, 32, "NV12", 64) for dmabuf_fd in range(4)]
+        released: List[Any] = []
+        window.present(fbs[0], released.append)
+        display.device.wait(lambda: window.chain.scanout is fbs[0])
+        # On screen
+        assert released == []
+
+        window.present(fbs[1], released.append)
+        window.present(fbs[2], released.append)
+        # The deferred frame is released as soon as it is replaced
+        window.present(fbs[3], released.append)
+        assert released == [fbs[2]]
+        # The previous frame is released when the next one is on screen
+        display.device.wait(lambda: window.chain.scanout is fbs[1])
+        assert released == [fbs[2], fbs[0]]
+        display.device.wait(lambda: window.chain.scanout is fbs[3])
+        assert released == [fbs[2], fbs[0], fbs[1]]
+
+        window.close()
+        assert released == [fbs[2], fbs[0], fbs[1], fbs[3]]
+        for fb in fbs:
+            fb.close()
+        assert all(fb.fb_id not in fake_drm.fbs for fb in fbs)
+
+
+def test_geometry_is_applied_at_next_update(fake_drm: FakeDRM) -> None:
+    with Display() as display:
+        window = display.open_window((0, 0) + SIZE, SIZE, 1)
+        plane_id = window.plane.plane_id
+        window.set_source_rect((16, 8, 32, 16))
+        window.set_dest_rect((100, 50, 128, 64))
+        assert fake_drm.flips() == []
+        # The frame on screen is shown again with the new rectangles
+        window.update()
+        (flip,) = fake_drm.flips()
+        values = flip[plane_id]
+        assert values["FB_ID"] == window.chain.buffers[0].fb_id
+        assert [values[name] for name in ("SRC_X", "SRC_Y", "SRC_W", "SRC_H")] == [16 << 16, 8 << 16, 32 << 16, 16 << 16]
+        assert [values[name] for name in ("CRTC_X", "CRTC_Y", "CRTC_W", "CRTC_H")] == [100, 50, 128, 64]
+
+        # Rectangles rejected by the driver are not applied
+        fake_drm.test_result = -EINVAL
+        with pytest.raises(RuntimeError, match="can not scale"):
+            window.set_dest_rect((0, 0, 1024, 512))
+        fake_drm.test_result = 0
+        window.blit(IMAGE)
+        window.update()
+        display.device.wait(lambda: not window.chain.queued)
+        values = fake_drm.flips()[-1][plane_id]
+        assert values["FB_ID"] == window.chain.buffers[1].fb_id and values["CRTC_W"] == 128
+        window.close()
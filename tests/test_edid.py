@@ -0,0 +1,36 @@
+import pytest
+
+from actfw_raspberrypi.edid import EDID, EDID_HEADER, Mode
+
+
+def _edid() -> bytes:
+    data = bytearray(128)
+    data[0:8] = EDID_HEADER
+    data[21], data[22] = 52, 29  # 52cm x 29cm
+    data[35] = 0x21  # 640x480@60, 800x600@60
+    data[38:54] = b"\x01\x01" * 8  # no standard timings
+    # 1920x1080@60: 148.5MHz, blanking 280x45, 521mm x 293mm
+    dtd = bytearray(18)
+    dtd[0:2] = (14850).to_bytes(2, "little")
+    dtd[2], dtd[3], dtd[4] = 1920 & 0xFF, 280 & 0xFF, (1920 >> 8) << 4 | 280 >> 8
+    dtd[5], dtd[6], dtd[7] = 1080 & 0xFF, 45, (1080 >> 8) << 4
+    dtd[12], dtd[13], dtd[14] = 521 & 0xFF, 293 & 0xFF, (521 >> 8) << 4 | 293 >> 8
+    data[54:72] = dtd
+    data[127] = -sum(data) % 256
+    return bytes(data)
+
+
+def test_edid_modes() -> None:
+    edid = EDID(_edid())
+    assert edid.preferred_mode() == (1920, 1080)
+    assert edid.modes() == [Mode(1920, 1080, 60), Mode(640, 480, 60), Mode(800, 600, 60)]
+    assert edid.physical_size() == (521, 293)
+
+
+def test_edid_invalid() -> None:
+    data = bytearray(_edid())
+    data[127] ^= 1
+    with pytest.raises(RuntimeError):
+        EDID(bytes(data))
+    with pytest.raises(RuntimeError):
+        EDID(b"\x00" * 128)
@@ -1,3 +1,6 @@
+import subprocess
+import sys
+
 import pytest
 
 
@@ -7,7 +10,19 @@ import pytest
         ("actfw_raspberrypi", "Display"),
         ("actfw_raspberrypi.capture", "PiCameraCapture"),
         ("actfw_raspberrypi.vc4", "Display"),
+        ("actfw_raspberrypi.vc4", "DisplayConsumer"),
     ],
 )
 def test_import_actfw_raspberrypi(from_: str, import_: str) -> None:
     exec(f"""from {from_} import {import_}""")
+
+
+def test_import_does_not_load_libraries() -> None:
+    # Run in a fresh interpreter since other tests may have loaded them
+    code = """
+from actfw_raspberrypi.vc4 import dispmanx
+from actfw_raspberrypi.vc4.drm import drm
+assert drm._drm is None
+assert dispmanx._bcm_host.lib is None
+"""
+    subprocess.run([sys.executable, "-c", code], check=True)
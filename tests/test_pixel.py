@@ -0,0 +1,41 @@
+import pytest
+
+from actfw_raspberrypi.vc4 import pixel
+
+
+@pytest.fixture(params=["numpy", "bytes"])
+def backend(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> None:
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        monkeypatch.setattr(pixel, "_np", None)
+    else:
+        monkeypatch.setattr(pixel, "_np", False)
+
+
+def test_swizzle_rgb_to_bgr(backend: None) -> None:
+    src = bytes(range(1, 13))  # 2x2 RGB
+    dst = bytearray(12)
+    pixel.swizzle(dst, 6, src, 6, 2, 2, (2, 1, 0))
+    assert dst == bytes([3, 2, 1, 6, 5, 4, 9, 8, 7, 12, 11, 10])
+
+
+def test_swizzle_honors_pitch_and_stride(backend: None) -> None:
+    src = bytes([1, 2, 3, 0xEE, 4, 5, 6, 0xEE])  # 1x2 RGB with 1 byte of row padding
+    dst = bytearray(16)
+    pixel.swizzle(dst, 8, src, 4, 1, 2, (2, 1, 0))
+    assert dst == bytes([3, 2, 1, 0, 0, 0, 0, 0, 6, 5, 4, 0, 0, 0, 0, 0])
+
+
+def test_fill() -> None:
+    assert pixel.fill("BGRA", (1, 2, 3), 2, 1) == bytes([3, 2, 1, 255]) * 2
+    assert pixel.fill("RGBA", (1, 2, 3, 0), 1, 1) == bytes([1, 2, 3, 0])
+    assert pixel.fill("RGBX", (1, 2, 3, 0), 1, 1) == bytes([1, 2, 3, 255])
+    assert pixel.fill("NV12", (255, 255, 255), 4, 2) == bytes([255] * 8 + [128, 128] * 2)
+    assert pixel.fill("YUV420", (0, 0, 0), 2, 2) == bytes([0] * 4 + [128, 128])
+
+
+def test_rgb_to_rgb565(backend: None) -> None:
+    src = bytes([255, 0, 0, 0, 255, 0, 0xEE, 0, 0, 255, 8, 4, 0, 0xEE])  # 2x2 RGB with 1 byte of row padding
+    dst = bytearray(10)
+    pixel.rgb_to_rgb565(dst, 5, src, 7, 2, 2)
+    assert dst == bytes([0x00, 0xF8, 0xE0, 0x07, 0, 0x1F, 0x00, 0x20, 0x08, 0])
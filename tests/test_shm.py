@@ -0,0 +1,70 @@
+from pathlib import Path
+
+import pytest
+
+from actfw_raspberrypi.vc4.display import Display  # type: ignore
+from actfw_raspberrypi.vc4.shm import WindowReader
+
+
+def test_shared_window(tmp_path: Path) -> None:
+    with Display(backend="shm", directory=str(tmp_path)) as display:
+        window = display.open_window((0, 0, 2, 2), (2, 2), 1)
+        reader = WindowReader(window.path)
+        assert reader.latest() is None
+        assert (reader.width, reader.height, reader.pitch, reader.pixel_format) == (2, 2, 6, "RGB")
+
+        window.blit(bytes(range(12)))
+        window.update()
+        frame = reader.latest()
+        assert frame is not None
+        assert frame.sequence == 1 and frame.timestamp > 0
+        assert bytes(frame.value) == bytes(range(12))
+
+        # The frame is overwritten when the buffer is drawn again
+        window.blit_region(b"\xff" * 3, (1, 1, 1, 1))
+        assert reader.intact(frame)
+        window.update()
+        latest = reader.latest()
+        assert latest is not None
+        assert bytes(latest.value) == bytes(range(9)) + b"\xff" * 3
+        window.clear()
+        assert not reader.intact(frame)
+
+        stats = window.stats()
+        assert stats["frames_presented"] == 2 and stats["missed_vblanks"] == 0
+        # The stale rectangle of the second buffer and the blitted pixel
+        assert stats["bytes_per_frame"] == 12 + 3
+
+        del frame, latest
+        reader.close()
+        window.close()
+        assert not Path(window.path).exists()
+
+
+def test_shared_window_batch(tmp_path: Path) -> None:
+    with Display(backend="shm", directory=str(tmp_path)) as display:
+        windows = [display.open_window((0, 0, 1, 1), (1, 1), layer, pixel_format="RGBA") for layer in (1, 2)]
+        readers = [WindowReader(window.path) for window in windows]
+        with display.batch():
+            for window in windows:
+                window.clear((1, 2, 3, 4))
+                window.update()
+            assert all(reader.latest() is None for reader in readers)
+            with pytest.raises(RuntimeError):
+                windows[0].clear()
+        frames = [reader.latest() for reader in readers]
+        assert [bytes(frame.value) for frame in frames if frame] == [b"\x01\x02\x03\x04"] * 2
+        assert frames[0] and frames[1] and frames[0].timestamp == frames[1].timestamp
+        del frames
+        for reader, window in zip(readers, windows):
+            reader.close()
+            window.close()
+
+
+def test_open_window_options_are_keyword_only(tmp_path: Path) -> None:
+    with Display(backend="shm", directory=str(tmp_path)) as display:
+        with pytest.raises(TypeError):
+            display.open_window((0, 0, 2, 2), (2, 2), 1, 3)
+        window = display.open_window((0, 0, 2, 2), (2, 2), 1, num_buffers=3, pixel_format="BGRA")
+        assert (len(window.buffers), window.pixel_format) == (3, "BGRA")
+        window.close()
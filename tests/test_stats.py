@@ -0,0 +1,33 @@
+import json
+
+from actfw_raspberrypi.vc4.stats import Histogram, WindowStats
+
+
+def test_histogram_buckets() -> None:
+    histogram = Histogram((0.001, 0.01))
+    for value in (0.0005, 0.001, 0.005, 0.5):
+        histogram.add(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["counts"] == [2, 1, 1]
+    assert snapshot["count"] == 4 and snapshot["max_s"] == 0.5
+
+
+def test_window_stats() -> None:
+    stats = WindowStats(vsync_period=0.01)
+    stats.blit(0.001, 100)
+    stats.blit(0.001, 20)
+    stats.update(0.0001)
+    # Shown at the first vblank and 2 vblanks late
+    stats.presented(1.0, 1.005)
+    stats.presented(1.02, 1.045)
+    stats.dropped()
+    stats.buffer_wait()
+    snapshot = stats.snapshot()
+    assert snapshot["bytes_copied"] == 120 and snapshot["bytes_per_frame"] == 120
+    assert snapshot["missed_vblanks"] == 2
+    assert snapshot["frames_presented"] == 2
+    assert snapshot["frames_dropped"] == 1 and snapshot["buffer_waits"] == 1
+    assert snapshot["blit"]["count"] == 2 and snapshot["flip"]["count"] == 2
+    # Presentations in the past are not counted in the frame rate
+    assert snapshot["fps"] == 0.0
+    json.dumps(snapshot)
@@ -0,0 +1,70 @@
+import pytest
+
+from actfw_raspberrypi.vc4.swapchain import SwapChain
+
+
+def test_swapchain_states() -> None:
+    chain = SwapChain(["a", "b", "c"])
+    assert chain.scanout == "a"
+
+    b = chain.acquire()
+    assert b == "b"
+    assert chain.acquire() == "b"
+    chain.queue()
+    c = chain.acquire()
+    assert c == "c"
+    chain.queue()
+    assert chain.acquire() is None
+
+    assert chain.presented("b") == "a"
+    assert chain.acquire() == "a"
+
+    chain.dropped("c")
+    assert list(chain.free) == ["c"]
+    assert chain.queued == []
+
+
+def test_swapchain_external_buffer() -> None:
+    chain = SwapChain(["a", "b"])
+    chain.queue("ext")
+    assert chain.presented("ext") == "a"
+    assert list(chain.free) == ["b", "a"]
+    chain.queue(chain.acquire())
+    assert chain.presented("b") == "ext"
+    assert list(chain.free) == ["a"]
+
+
+def test_swapchain_queue_without_back_buffer() -> None:
+    chain = SwapChain(["a", "b"])
+    with pytest.raises(RuntimeError):
+        chain.queue()
+    assert chain.queued == []
+
+
+@pytest.mark.parametrize("n", [1, 5])
+def test_swapchain_number_of_buffers(n: int) -> None:
+    with pytest.raises(RuntimeError):
+        SwapChain(list(range(n)))
+
+
+def test_swapchain_damage() -> None:
+    chain = SwapChain(["a", "b", "c"])
+    chain.acquire()
+    chain.damage((0, 0, 4, 4))
+    assert chain.take_stale("b") == []
+    assert chain.take_stale("a") == [(0, 0, 4, 4)]
+    assert chain.take_stale("a") == []
+    assert chain.take_stale("c") == [(0, 0, 4, 4)]
+
+    for i in range(9):
+        chain.damage((i, i, 1, 1))
+    assert chain.take_stale("c") == [(0, 0, 9, 9)]
+
+
+def test_swapchain_latest() -> None:
+    chain = SwapChain(["a", "b"])
+    assert chain.latest == "a"
+    chain.queue(chain.acquire())
+    assert chain.latest == "b"
+    chain.queue("ext")
+    assert chain.latest == "b"